@@ -1,21 +1,361 @@
+import time
+_import_started = time.perf_counter()
+
 from flask import Flask, request, jsonify, send_file
 from flask_cors import CORS
 import json
+import base64
+import hashlib
+import hmac
+import random
 import os
-from openai import OpenAI
+import string
+import sys
+import threading
+import unicodedata
 import re
-from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from artifact_store import ArtifactStore
+from idea_cache import IdeaIndex
+from layout_library import LayoutLibrary
+from usage_stats import UsageStats
+from prompt_variants import ExperimentStats, assign_variants, bind_variants, current_variant, variant_field
+from llm_cassette import Cassette
+from response_detail import parse_detail, results_url, shape_payload
+from single_flight import SingleFlight
+from run_checkpoint import RunCheckpoints
+from level_nav import distance_field, build_navigation, navigation_summary, nav_to_lua
+from layout_scoring import rank_layouts, score_layout
+from level_export import FORMAT_VERSION as LEVEL_EXPORT_VERSION, pack_level, loader_lua, layout_blocks, world_blocks
+from world_builder import (TooManyTiles, plan_tiles, plan_gates, distribute_counts, tile_gates, tile_intent,
+                           tile_prompt_suffix, validate_tile, stitch_world, check_world_connectivity)
+from http_cache import init_http_cache
+from lua_syntax import LuaSyntaxError, check_lua_syntax, strip_markdown_fences
+from lua_bundle import bundle_lua
+from profiling import RequestProfiler, stage, staged
+from log_utils import bind_run, get_logger, in_context, init_request_logging, log_payload, module_span, setup_logging
+from startup import StartupTimeline
+
+# OpenAI SDK（及其HTTP依赖）较重，在第一次创建客户端或预热时才导入
+startup = StartupTimeline(_import_started)
+startup.record("imports", (time.perf_counter() - _import_started) * 1000, at_ms=0)
 
 app = Flask(__name__, static_folder='static', static_url_path='')
 CORS(app)
+log = get_logger("app")
+setup_logging()
+init_request_logging(app)
 
 CONFIG_FILE = "config.json"
+OUTPUT_DIR = "output"
+
+_artifact_store = None
+_idea_index = None
+_layout_library = None
+_usage_stats = None
+_experiment_stats = None
+_cassette = None
+_clients = {}
+_clients_lock = threading.Lock()
+# 已知不支持n参数的 (Base URL, 模型)，之后直接并行调用
+_n_unsupported = set()
+MAX_CACHED_CLIENTS = 8
+
+# 各模块prompt模板可用的占位符（与流水线中format的参数一致）
+TEMPLATE_FIELDS = {
+    "screenwriter": {"user_input"},
+    "stage_design": {"blueprint"},
+    "stage_programmer": {"stage_design"},
+    "casting_design": {"blueprint", "stage_design"},
+    "character_config": {"casting_design"},
+    "executive_director": {"blueprint", "stage_lua", "cast_lua"},
+    "intent_parser": {"user_input"},
+    "grid_planner": {"intent"},
+}
+
+# 进行中请求合并（按流水线区分）
+script_flight = SingleFlight()
+level_flight = SingleFlight()
+
+def get_artifact_store(config=None):
+    """获取产物存储（进程内单例），并按配置更新回收策略"""
+    global _artifact_store
+    if _artifact_store is None:
+        _artifact_store = ArtifactStore(OUTPUT_DIR)
+        # 回收的运行同时从相似想法索引中删除（索引文件不会无限增长）
+        _artifact_store.gc_listeners.append(forget_removed_runs)
+    if config is not None:
+        _artifact_store.configure(config.get("storage", {}))
+    return _artifact_store
+
+def get_idea_index():
+    """获取相似想法索引（进程内单例）"""
+    global _idea_index
+    if _idea_index is None:
+        _idea_index = IdeaIndex(OUTPUT_DIR)
+    return _idea_index
+
+def forget_removed_runs(run_ids):
+    """从相似想法索引中删除已回收的运行（清理失败不影响回收）"""
+    try:
+        removed = get_idea_index().remove_runs(run_ids)
+        if removed:
+            log.info("相似想法索引删除了 %d 条已回收运行的记录", removed)
+    except Exception as e:
+        log.warning("相似想法索引清理失败: %s", e)
+
+def get_layout_library(config=None):
+    """获取预验证布局库（进程内单例）"""
+    global _layout_library
+    if _layout_library is None:
+        _layout_library = LayoutLibrary(OUTPUT_DIR)
+    if config is not None:
+        _layout_library.max_per_key = config.get("layout_library", {}).get("max_per_key", 50)
+    return _layout_library
+
+def get_usage_stats():
+    """获取模块用量统计（进程内单例）"""
+    global _usage_stats
+    if _usage_stats is None:
+        _usage_stats = UsageStats(OUTPUT_DIR)
+    return _usage_stats
+
+def get_experiment_stats():
+    """获取prompt变体实验统计（进程内单例）"""
+    global _experiment_stats
+    if _experiment_stats is None:
+        _experiment_stats = ExperimentStats(OUTPUT_DIR)
+    return _experiment_stats
+
+def get_cassette(config):
+    """获取LLM录制/回放的cassette（进程内单例，配置变化时重新打开），未开启时返回None"""
+    global _cassette
+    cassette_config = config.get("llm_cassette", {})
+    mode = cassette_config.get("mode", "off")
+    if mode == "off":
+        return None
+    settings = {
+        "path": cassette_config.get("path") or os.path.join(OUTPUT_DIR, "llm_cassette.jsonl"),
+        "mode": mode,
+        "replay_latency": cassette_config.get("replay_latency", False),
+        "latency_scale": cassette_config.get("latency_scale", 1.0),
+    }
+    if _cassette is None or any(getattr(_cassette, name) != value for name, value in settings.items()):
+        _cassette = Cassette(**settings)
+    return _cassette
+
+def module_prompt(config, module_name):
+    """模块的prompt模板（当前运行分配了变体时使用变体的模板）"""
+    return variant_field(config["modules"][module_name], module_name, "prompt_template", "")
+
+def module_settings(module_name, config):
+    """
+    模块实际使用的 max_tokens 和 reasoning_effort
+    开启 auto_tune 时使用根据历史用量计算的建议值，否则使用模块配置
+    """
+    module_config = config["modules"][module_name]
+    settings = {
+        "max_tokens": module_config.get("max_tokens", 2000),
+        "reasoning_effort": module_config.get("reasoning_effort", "high"),
+    }
+    auto_tune = config.get("auto_tune", {})
+    if auto_tune.get("enabled") and module_name not in auto_tune.get("exclude", []):
+        settings.update(get_usage_stats().recommend(module_name, module_config, auto_tune.get("tuning")))
+    return settings
+
+def response_usage(response):
+    """从 chat.completions 或 responses 的返回中提取输出Token数、推理Token数和是否被截断"""
+    usage = getattr(response, "usage", None)
+    if hasattr(response, "choices"):
+        details = getattr(usage, "completion_tokens_details", None)
+        output_tokens = getattr(usage, "completion_tokens", None)
+        truncated = bool(response.choices) and response.choices[0].finish_reason == "length"
+    else:
+        details = getattr(usage, "output_tokens_details", None)
+        output_tokens = getattr(usage, "output_tokens", None)
+        truncated = getattr(response, "status", None) == "incomplete"
+    return output_tokens, getattr(details, "reasoning_tokens", None), truncated
+
+def response_input_tokens(response):
+    """从 chat.completions 或 responses 的返回中提取输入Token数"""
+    usage = getattr(response, "usage", None)
+    return getattr(usage, "prompt_tokens" if hasattr(response, "choices") else "input_tokens", None)
+
+def sent_reasoning_effort(settings, response):
+    """调用实际使用的推理强度：只有responses API的调用带reasoning参数，chat.completions的调用为None"""
+    return None if hasattr(response, "choices") else settings["reasoning_effort"]
+
+def record_module_usage(module_name, model, started, response, result, settings, json_mode):
+    """记录一次模块调用的用量（统计失败不影响生成）"""
+    try:
+        output_tokens, reasoning_tokens, truncated = response_usage(response)
+        record_usage_sample(module_name, model, time.perf_counter() - started, settings, json_mode, result,
+                            output_tokens, reasoning_tokens, truncated, response_input_tokens(response),
+                            sent_reasoning_effort(settings, response))
+    except Exception as e:
+        log.warning("用量统计记录失败: %s", e)
+
+def record_candidates_usage(module_name, model, started, response, results, settings, json_mode):
+    """
+    一次调用生成多个候选（n参数）时按候选分别记录用量（统计失败不影响生成）
+    Token数按候选数平均分摊，是否截断按各候选的finish_reason判断
+    """
+    try:
+        latency = time.perf_counter() - started
+        output_tokens, reasoning_tokens, _ = response_usage(response)
+        input_tokens = response_input_tokens(response)
+        share = lambda tokens: tokens // len(results) if tokens is not None else None
+        for choice, result in zip(response.choices, results):
+            record_usage_sample(module_name, model, latency, settings, json_mode, result, share(output_tokens),
+                                share(reasoning_tokens), choice.finish_reason == "length", share(input_tokens),
+                                sent_reasoning_effort(settings, response))
+    except Exception as e:
+        log.warning("用量统计记录失败: %s", e)
+
+def record_usage_sample(module_name, model, latency, settings, json_mode, result, output_tokens, reasoning_tokens,
+                        truncated, input_tokens, reasoning_effort=None):
+    """
+    记录一个输出的用量，当前运行分配了prompt变体时同时记入变体统计
+    reasoning_effort: 调用实际发送的推理强度（没有发送reasoning参数时为None，不计入按推理强度的统计）
+    """
+    json_failed = bool(json_mode) and not is_json_success(result)
+    get_usage_stats().record(module_name, model, latency,
+                             output_tokens=output_tokens, reasoning_tokens=reasoning_tokens,
+                             max_tokens=settings["max_tokens"], reasoning_effort=reasoning_effort,
+                             truncated=truncated, json_failed=json_failed)
+    variant = current_variant(module_name)
+    if variant is not None:
+        get_experiment_stats().record_call(module_name, variant, latency, input_tokens=input_tokens,
+                                           output_tokens=output_tokens,
+                                           json_failed=json_failed if json_mode else None)
+
+def record_variant_check(module_name, check, passed):
+    """按当前运行的prompt变体记录一次校验结果（模块没有配置变体时不记录，统计失败不影响生成）"""
+    variant = current_variant(module_name)
+    if variant is None:
+        return
+    try:
+        get_experiment_stats().record_check(module_name, variant, check, passed)
+    except Exception as e:
+        log.warning("变体统计记录失败: %s", e)
+
+def config_version(config):
+    """模块配置（模型、prompt等）和全局模型的指纹，配置变化后旧结果不再复用"""
+    api_config = config.get("api_config", {})
+    fingerprint = json.dumps({
+        "modules": config.get("modules", {}),
+        "model": api_config.get("model"),
+        "base_url": api_config.get("base_url")
+    }, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(fingerprint.encode('utf-8')).hexdigest()[:12]
+
+def with_resume_info(payload, run, error):
+    """流水线失败时记录失败的步骤，并在错误响应中附带运行ID，便于之后继续运行"""
+    if run is None:
+        return payload
+    try:
+        run.mark("failed", failed_step=run.current, error=str(error))
+    except Exception as e:
+        log.warning("记录运行状态失败: %s", e)
+    payload.update({
+        "run_id": run.run_id,
+        "failed_step": run.current,
+        "completed_steps": sorted(run.checkpoints),
+        "resumable": True
+    })
+    return payload
+
+PROFILE_FILES = ("profile.json", "profile.txt")
+
+def is_admin(config):
+    """请求头X-Admin-Token与配置profiling.admin_token一致（未配置admin_token时没有管理员）"""
+    admin_token = config.get("profiling", {}).get("admin_token", "")
+    provided = request.headers.get("X-Admin-Token", "")
+    return bool(admin_token) and hmac.compare_digest(provided.encode('utf-8'), admin_token.encode('utf-8'))
+
+def profiling_requested(config):
+    """
+    请求是否要求性能分析（X-Profile: 1 请求头或 ?profile=1），仅限管理员
+    返回: (是否开启, 非管理员请求时的403响应)
+    """
+    flag = request.headers.get("X-Profile") or request.args.get("profile", "")
+    if flag.lower() not in ("1", "true", "yes"):
+        return False, None
+    if not is_admin(config):
+        return False, (jsonify({"error": "性能分析仅限管理员（需要正确的X-Admin-Token请求头）"}), 403)
+    return True, None
+
+def execute_pipeline(pipeline, flight, key, func, config, profile=False):
+    """
+    执行流水线，相同的并发请求只执行一次
+    开启性能分析时单独执行（不与其他请求合并），分析结果保存为该运行的 profile.json / profile.txt
+    """
+    if not profile:
+        (payload, status), shared = flight.do(key, func)
+        if shared:
+            payload = dict(payload, coalesced=True)
+        return payload, status
+    
+    profiling_config = config.get("profiling", {})
+    with RequestProfiler(cpu=profiling_config.get("cpu", True)) as profiler:
+        payload, status = func()
+    run_id = payload.get("run_id")
+    if not run_id or payload.get("reused"):
+        return dict(payload, profile={"wall_ms": profiler.wall_ms, "stages": profiler.stage_summary()}), status
+    report = profiler.report(profiling_config.get("top_functions", 30))
+    report.update(pipeline=pipeline, run_id=run_id, status=status)
+    try:
+        get_artifact_store(config).save_run(pipeline, {
+            "profile.json": json.dumps(report, ensure_ascii=False, indent=2),
+            "profile.txt": profiler.cpu_text(profiling_config.get("top_functions", 30))
+        }, run_id=run_id)
+    except Exception as e:
+        log.warning("保存性能分析结果失败: %s", e)
+    return dict(payload, profile={
+        "wall_ms": profiler.wall_ms,
+        "stages": report["stages"],
+        "downloads": {name: f"/api/download/{run_id}/{name}" for name in PROFILE_FILES}
+    }), status
+
+def flight_key(pipeline, config, user_input, **params):
+    """进行中请求合并的键：流水线 + 配置指纹 + 归一化后的请求参数（忽略全角半角和多余空白）"""
+    normalized = " ".join(unicodedata.normalize("NFKC", user_input).split())
+    raw = json.dumps([pipeline, config_version(config), normalized, params], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+def find_reusable_run(user_input, config, pipeline="script"):
+    """
+    查找可复用的历史运行，返回(匹配信息, 历史结果)，没有时返回(None, None)
+    历史运行已被回收时跳过，继续找下一个
+    """
+    cache_config = config.get("idea_cache", {})
+    if not cache_config.get("enabled", True):
+        return None, None
+    store = get_artifact_store(config)
+    index = get_idea_index()
+    version = config_version(config)
+    threshold = cache_config.get("threshold", 0.85)
+    missing = set()
+    while True:
+        match = index.lookup(user_input, threshold, pipeline, version, exclude=missing)
+        if match is None:
+            return None, None
+        results_path = store.get_file_path(match.run_id, "results.json")
+        if results_path:
+            try:
+                with open(results_path, 'r', encoding='utf-8') as f:
+                    return match, json.load(f)
+            except (OSError, ValueError):
+                pass
+        missing.add(match.run_id)
 
 def load_config():
     """加载配置文件"""
     if os.path.exists(CONFIG_FILE):
         with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
+            config = json.load(f)
+        setup_logging(config.get("logging"))
+        return config
     return {}
 
 def save_config(config):
@@ -24,17 +364,31 @@ def save_config(config):
         json.dump(config, f, ensure_ascii=False, indent=2)
 
 def get_client(api_config):
-    """创建OpenAI客户端"""
+    """获取OpenAI客户端（按API密钥和Base URL缓存，复用连接池）"""
     api_key = api_config.get("api_key", "")
     base_url = api_config.get("base_url", "")
-    model = api_config.get("model", "gpt-4")
     
     if not api_key:
         raise ValueError("API密钥未配置，请在API配置页面设置API密钥")
     
+    key = (api_key, base_url)
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                client = create_client(api_key, base_url)
+                if len(_clients) >= MAX_CACHED_CLIENTS:
+                    _clients.pop(next(iter(_clients)))
+                _clients[key] = client
+    return client
+
+def create_client(api_key, base_url):
+    """创建OpenAI客户端"""
+    from openai import OpenAI
+    
     try:
         # OpenAI SDK 初始化 - 只传递支持的参数
-        import os
         # 清除可能影响初始化的环境变量
         env_backup = {}
         problematic_vars = ['HTTP_PROXY', 'HTTPS_PROXY', 'http_proxy', 'https_proxy', 'ALL_PROXY', 'all_proxy']
@@ -62,6 +416,77 @@ def get_client(api_config):
     except Exception as e:
         raise ValueError(f"无法创建OpenAI客户端: {str(e)}")
 
+def parse_prompt_templates(config):
+    """
+    预解析各模块的prompt模板
+    prompt变体的模板以 "模块名:变体名" 为键
+    返回: {模块名: {"fields": [占位符], "unknown": [流水线不提供的占位符]}}，格式错误的模板为 {"error": 原因}
+    """
+    parsed = {}
+    for module_name, module_config in config.get("modules", {}).items():
+        templates = [(module_name, module_config.get("prompt_template"))]
+        templates += [(f"{module_name}:{variant_name}", variant.get("prompt_template"))
+                      for variant_name, variant in (module_config.get("prompt_variants") or {}).items()]
+        for key, template in templates:
+            if not template:
+                continue
+            try:
+                fields = sorted({name for _, name, _, _ in string.Formatter().parse(template) if name})
+            except ValueError as e:
+                parsed[key] = {"error": str(e)}
+                continue
+            allowed = TEMPLATE_FIELDS.get(module_name)
+            unknown = [name for name in fields if allowed is not None and name not in allowed]
+            parsed[key] = {"fields": fields, "unknown": unknown}
+            if unknown:
+                log.warning("模块 %s 的prompt模板包含流水线不提供的占位符: %s", key, unknown)
+    return parsed
+
+def warm_up(config=None):
+    """
+    预热：导入OpenAI SDK、创建客户端并建立连接、预解析prompt模板、打开各个存储
+    各阶段的耗时记录在startup中（/api/startup），失败的阶段只记录错误，不影响服务
+    """
+    startup.mark("warming")
+    config = config if config is not None else load_config()
+    startup_config = config.get("startup", {})
+    api_config = config.get("api_config", {})
+    
+    with startup.phase("import_openai"):
+        import openai  # noqa: F401
+    if api_config.get("api_key"):
+        with startup.phase("client"):
+            get_client(api_config)
+        if startup_config.get("warm_connection", True) and "client" not in startup.errors:
+            with startup.phase("connection"):
+                warm_connection(get_client(api_config), startup_config.get("connection_timeout", 5))
+    with startup.phase("templates"):
+        startup.details["templates"] = parse_prompt_templates(config)
+    with startup.phase("stores"):
+        get_artifact_store(config)
+        get_idea_index()
+        get_layout_library(config)
+        get_usage_stats()
+    startup.mark("ready")
+    log.info("预热完成: %.1f ms", startup.ready_ms, extra={"fields": {"errors": startup.errors}})
+
+def warm_connection(client, timeout):
+    """请求一次模型列表，提前完成DNS解析和TLS握手（连接留在客户端的连接池中）"""
+    try:
+        client.with_options(timeout=timeout, max_retries=0).models.list()
+    except Exception as e:
+        # 接口返回错误状态码（例如不支持/v1/models）时连接已经建立
+        if getattr(e, "status_code", None) is None:
+            raise
+        startup.details["connection_status"] = e.status_code
+
+def start_warmup(config=None):
+    """在后台线程中预热，立即返回（WSGI部署时在导入app后调用）"""
+    thread = threading.Thread(target=warm_up, args=(config,), name="warmup", daemon=True)
+    thread.start()
+    return thread
+
+@staged("extract_json_from_response")
 def extract_json_from_response(text):
     """从响应中提取JSON"""
     if not text:
@@ -105,20 +530,52 @@ def extract_json_from_response(text):
     try:
         return json.loads(text)
     except json.JSONDecodeError as e:
-        # 返回原始文本和错误信息，但尝试提取部分JSON
-        error_info = {
+        # 返回原始文本和错误信息（原始文本只保存一份，响应中按detail决定是否返回）
+        return {
             "raw": text,
             "error": "Failed to parse JSON",
             "error_position": e.pos if hasattr(e, 'pos') else None,
             "error_message": str(e)
         }
-        # 如果文本很长，只保存前1000个字符
-        if len(text) > 1000:
-            error_info["raw_preview"] = text[:1000] + "..."
-        return error_info
 
-def call_gpt_module(module_name, prompt, config, system_prompt=None):
-    """调用GPT模块"""
+def is_json_success(result):
+    """JSON模式的输出是否解析成功（extract_json_from_response失败时返回带error的字典）"""
+    return not (isinstance(result, dict) and result.get("error") == "Failed to parse JSON")
+
+class CandidatesNotSupported(ValueError):
+    """模型或接口不支持一次调用生成多个候选（n参数）"""
+
+def is_n_unsupported_error(error_msg):
+    """接口错误是否表示不支持n参数（如 "Unsupported parameter: 'n'"、"Invalid 'n'"）"""
+    return re.search(r"""['"`]n['"`]|\bparameter:?\s+n\b""", error_msg, re.IGNORECASE) is not None
+
+def module_model(config, module_name):
+    """模块使用的模型：优先使用模块特定的模型，否则使用全局模型"""
+    return config["modules"][module_name].get("model") or config.get("api_config", {}).get("model", "gpt-4")
+
+def module_client(module_name, config):
+    """模块调用使用的客户端：开启录制时包装真实客户端，回放时不创建真实客户端（不需要网络）"""
+    cassette = get_cassette(config)
+    if cassette is not None and cassette.mode == "replay":
+        return cassette.client(module_name)
+    client = get_client(config.get("api_config", {}))
+    return cassette.client(module_name, client) if cassette is not None else client
+
+def uses_responses_api(model):
+    """codex/pro 模型使用 responses API"""
+    return model in ["gpt-5.1-codex", "gpt-5.2-pro"] or "codex" in model.lower()
+
+def call_gpt_module(module_name, prompt, config, system_prompt=None, n=1):
+    """
+    调用GPT模块（日志中记录开始、结束和耗时，按采样率记录输出）
+    n > 1 时一次调用生成n个候选，返回各候选的结果列表；模型或接口不支持时抛出CandidatesNotSupported
+    """
+    with module_span(log, module_name, **({"n": n} if n > 1 else {})):
+        result = _call_gpt_module(module_name, prompt, config, system_prompt, n)
+    log_payload(log, module_name, result)
+    return result
+
+def _call_gpt_module(module_name, prompt, config, system_prompt=None, n=1):
     if module_name not in config.get("modules", {}):
         raise ValueError(f"模块 {module_name} 不存在于配置中")
     
@@ -129,20 +586,22 @@ def call_gpt_module(module_name, prompt, config, system_prompt=None):
         raise ValueError("api_config 配置不存在")
     
     try:
-        client = get_client(api_config)
+        client = module_client(module_name, config)
     except Exception as e:
         raise ValueError(f"无法创建API客户端: {str(e)}")
     
     response_format = {"type": "json_object"} if module_config.get("json_mode") else None
+    settings = module_settings(module_name, config)
+    started = time.perf_counter()
     
     # 优先使用模块特定的模型，否则使用全局模型
-    model = module_config.get("model") or api_config.get("model", "gpt-4")
+    model = module_model(config, module_name)
     
     # 直接使用用户指定的模型，不进行自动映射
     
-    # 使用自定义system prompt或默认值
+    # 使用自定义system prompt、模块（或prompt变体）配置的system_prompt或默认值
     if system_prompt is None:
-        system_prompt = "你是一个专业的Lua游戏脚本生成助手。"
+        system_prompt = variant_field(module_config, module_name, "system_prompt") or "你是一个专业的Lua游戏脚本生成助手。"
     
     messages = [
         {"role": "system", "content": system_prompt},
@@ -150,10 +609,9 @@ def call_gpt_module(module_name, prompt, config, system_prompt=None):
     ]
     
     # 检查是否为 codex 模型（使用 responses API）
-    codex_models = ["gpt-5.1-codex", "gpt-5.2-pro"]
-    is_codex_model = model in codex_models or "codex" in model.lower()
-    
-    if is_codex_model:
+    if uses_responses_api(model):
+        if n > 1:
+            raise CandidatesNotSupported(f"模型 '{model}' 使用 responses API，不支持n参数")
         # 使用 responses.create API for codex models
         # 将 system + user messages 合并为单个 input
         full_prompt = prompt  # prompt 已经包含了完整的内容
@@ -165,19 +623,21 @@ def call_gpt_module(module_name, prompt, config, system_prompt=None):
         }
         
         # 添加 reasoning 参数（codex 模型支持）
-        reasoning_effort = module_config.get("reasoning_effort", "high")
-        responses_params["reasoning"] = {"effort": reasoning_effort}
+        responses_params["reasoning"] = {"effort": settings["reasoning_effort"]}
         
         # 注意：codex 模型不支持 temperature 参数，所以不添加
         
         try:
-            response = client.responses.create(**responses_params)
+            with stage(f"provider:{module_name}"):
+                response = client.responses.create(**responses_params)
             result = response.output_text
             
             # 如果是JSON模式，尝试解析
             if module_config.get("json_mode"):
                 result = extract_json_from_response(result)
             
+            record_module_usage(module_name, model, started, response, result, settings,
+                                module_config.get("json_mode"))
             return result
         except AttributeError:
             # 如果 responses API 不存在，尝试使用 chat API
@@ -203,25 +663,35 @@ def call_gpt_module(module_name, prompt, config, system_prompt=None):
         
         # 只在支持的模型上添加 max_tokens
         if use_maxtokens:
-            api_params["max_tokens"] = module_config.get("max_tokens", 2000)
+            api_params["max_tokens"] = settings["max_tokens"]
         
         # 只在支持的模型上添加 response_format
         # 注意：某些新模型可能不支持 response_format，如果失败会在异常处理中重试
         if response_format:
             api_params["response_format"] = response_format
         
+        # 一次调用生成多个候选（输入只发送一次）
+        if n > 1:
+            api_params["n"] = n
+        
         try:
-            response = client.chat.completions.create(**api_params)
+            with stage(f"provider:{module_name}"):
+                response = client.chat.completions.create(**api_params)
         except Exception as e:
             error_msg = str(e)
             
+            # 不支持n参数时由调用方改为多次调用
+            if n > 1 and is_n_unsupported_error(error_msg):
+                raise CandidatesNotSupported(f"模型 '{model}' 不支持n参数: {error_msg}")
+            
             # 处理不支持 max_tokens 的情况，重试不带该参数
-            if "max_tokens" in error_msg.lower() and "not supported" in error_msg.lower():
+            elif "max_tokens" in error_msg.lower() and "not supported" in error_msg.lower():
                 try:
                     api_params_no_maxtokens = {k: v for k, v in api_params.items() if k != "max_tokens"}
                     if "response_format" in api_params_no_maxtokens:
                         del api_params_no_maxtokens["response_format"]
-                    response = client.chat.completions.create(**api_params_no_maxtokens)
+                    with stage(f"provider:{module_name}"):
+                        response = client.chat.completions.create(**api_params_no_maxtokens)
                 except Exception as e2:
                     raise ValueError(f"模型 '{model}' 调用失败: {str(e2)}")
             
@@ -241,19 +711,105 @@ def call_gpt_module(module_name, prompt, config, system_prompt=None):
             else:
                 raise ValueError(f"API调用失败: {error_msg}")
         
+        if n > 1:
+            results = [choice.message.content for choice in response.choices]
+            if module_config.get("json_mode"):
+                results = [extract_json_from_response(text) for text in results]
+            record_candidates_usage(module_name, model, started, response, results, settings,
+                                    module_config.get("json_mode"))
+            return results
+        
         result = response.choices[0].message.content
     
     # 如果是JSON模式，尝试解析
     if module_config.get("json_mode"):
         result = extract_json_from_response(result)
     
+    record_module_usage(module_name, model, started, response, result, settings, module_config.get("json_mode"))
     return result
 
+LUA_FIX_HINT = """
+
+IMPORTANT: Your previous answer for this task was rejected by a Lua syntax checker.
+Error at line {line}, column {column}: {message} (near '{near}')
+Offending line: {source_line}
+Output the COMPLETE corrected Lua code only. Do NOT use markdown code blocks."""
+
+def call_lua_module(module_name, prompt, config, lua_checks):
+    """
+    调用生成Lua代码的模块：去掉多余的markdown代码块并在本地做语法检查，
+    语法错误时只重新生成这一个模块，重试后仍失败则立即报错，不再调用下游模块
+    """
+    lua_check_config = config.get("lua_check", {})
+    if not lua_check_config.get("enabled", True):
+        return call_gpt_module(module_name, prompt, config)
+    
+    max_retries = lua_check_config.get("max_retries", 1)
+    errors = []
+    attempt_prompt = prompt
+    
+    for attempt in range(max_retries + 1):
+        lua_code = call_gpt_module(module_name, attempt_prompt, config)
+        if not isinstance(lua_code, str):
+            return lua_code
+        
+        lua_code = strip_markdown_fences(lua_code)
+        with stage("lua_syntax_check"):
+            error = check_lua_syntax(lua_code)
+        if error is None:
+            lua_checks[module_name] = {
+                "status": "fixed" if errors else "ok",
+                "attempts": attempt + 1,
+                "errors": errors
+            }
+            return lua_code
+        
+        errors.append(error)
+        log.warning("%s Lua语法检查失败 (尝试 %d/%d): 第%s行第%s列 %s", module_name, attempt + 1,
+                    max_retries + 1, error['line'], error['column'], error['message'])
+        lines = lua_code.splitlines()
+        source_line = lines[error["line"] - 1].strip() if 0 < error["line"] <= len(lines) else ""
+        attempt_prompt = prompt + LUA_FIX_HINT.format(source_line=source_line, **error)
+    
+    lua_checks[module_name] = {"status": "invalid", "attempts": max_retries + 1, "errors": errors}
+    last = errors[-1]
+    raise ValueError(f"模块 {module_name} 生成的Lua代码存在语法错误（第{last['line']}行第{last['column']}列: "
+                     f"{last['message']}），已重新生成{max_retries}次仍未通过")
+
+def public_prompt(entry, url):
+    """模块（或prompt变体）配置中的prompt模板换成哈希和正文地址"""
+    if "prompt_template" not in entry:
+        return entry
+    entry = dict(entry)
+    digest = prompt_hash(entry.pop("prompt_template") or "")
+    entry["prompt_hash"] = digest
+    if url:
+        entry["prompt_url"] = f"{url}?v={digest}"
+    return entry
+
+def public_config(config):
+    """
+    返回给页面的配置：不包含管理员令牌；prompt模板只返回哈希和正文地址
+    （正文通过 /api/modules/<模块>/prompt 按需获取，保存配置时不传prompt_template不会清空模板）
+    """
+    if config.get("profiling", {}).get("admin_token"):
+        config = dict(config, profiling=dict(config["profiling"], admin_token=""))
+    if config.get("modules"):
+        modules = {}
+        for name, module_config in config["modules"].items():
+            module_config = dict(public_prompt(module_config, f"/api/modules/{name}/prompt"))
+            if module_config.get("prompt_variants"):
+                module_config["prompt_variants"] = {variant: public_prompt(variant_config, None)
+                                                    for variant, variant_config in
+                                                    module_config["prompt_variants"].items()}
+            modules[name] = module_config
+        config = dict(config, modules=modules)
+    return config
+
 @app.route('/api/config', methods=['GET'])
 def get_config():
-    """获取配置"""
-    config = load_config()
-    return jsonify(config)
+    """获取配置（不返回管理员令牌和prompt正文）"""
+    return jsonify(public_config(load_config()))
 
 @app.route('/api/config', methods=['POST'])
 def update_config():
@@ -274,7 +830,7 @@ def update_config():
                 config["modules"][module_name] = module_data
     
     save_config(config)
-    return jsonify({"success": True, "config": config})
+    return jsonify({"success": True, "config": public_config(config)})
 
 @app.route('/api/generate', methods=['POST'])
 def generate_lua():
@@ -283,52 +839,115 @@ def generate_lua():
         data = request.json
         if not data:
             return jsonify({"error": "请求数据为空"}), 400
-            
-        user_input = data.get("user_input", "")
-        
-        if not user_input:
-            return jsonify({"error": "用户输入不能为空"}), 400
         
         config = load_config()
-        
-        if not config:
-            return jsonify({"error": "配置文件不存在或为空"}), 500
-        
-        if "modules" not in config:
-            return jsonify({"error": "配置文件中缺少modules配置"}), 500
-        
-        if "api_config" not in config:
-            return jsonify({"error": "配置文件中缺少api_config配置"}), 500
-        
-        api_key = config.get("api_config", {}).get("api_key", "")
-        if not api_key:
-            return jsonify({"error": "请先配置API密钥"}), 400
-        
-        # 验证所有必需的模块是否存在
-        required_modules = ["screenwriter", "stage_design", "stage_programmer", 
-                          "casting_design", "character_config", "executive_director"]
-        missing_modules = [m for m in required_modules if m not in config.get("modules", {})]
-        if missing_modules:
-            return jsonify({"error": f"缺少必需的模块配置: {', '.join(missing_modules)}"}), 500
-        
-        # 验证每个模块是否有prompt_template
-        for module_name in required_modules:
-            module_config = config["modules"][module_name]
-            if "prompt_template" not in module_config:
-                return jsonify({"error": f"模块 {module_name} 缺少 prompt_template"}), 500
+        params, error = script_params(data, config)
+        if not error:
+            detail, error = requested_detail(data, config)
+        if error:
+            return jsonify({"error": error[0]}), error[1]
     
     except KeyError as e:
         return jsonify({"error": f"配置错误: 缺少必需的配置项 {str(e)}"}), 500
     except Exception as e:
         return jsonify({"error": f"配置加载失败: {str(e)}"}), 500
     
+    profile, denied = profiling_requested(config)
+    if denied:
+        return denied
+    
+    # 相同的并发请求只执行一次流水线，其余请求等待并共享结果
+    key = flight_key("script", config, **params)
+    payload, status = execute_pipeline("script", script_flight, key,
+                                       lambda: run_script_pipeline(config=config, **params), config, profile)
+    return jsonify(shape_payload(payload, "script", *detail)), status
+
+def requested_detail(data, config):
+    """响应详略：请求体中的 detail / fields，也可以用查询参数（?detail=summary&fields=a,b）"""
+    return parse_detail({**request.args.to_dict(), **(data or {})}, config)
+
+def script_params(data, config):
+    """
+    校验游戏脚本生成的请求参数和配置（HTTP接口和 batch_cli.py 共用）
+    返回: (流水线参数, None)，校验失败时返回 (None, (错误信息, HTTP状态码))
+    """
+    user_input = data.get("user_input", "")
+    
+    if not user_input:
+        return None, ("用户输入不能为空", 400)
+    
+    if not config:
+        return None, ("配置文件不存在或为空", 500)
+    
+    if "modules" not in config:
+        return None, ("配置文件中缺少modules配置", 500)
+    
+    if "api_config" not in config:
+        return None, ("配置文件中缺少api_config配置", 500)
+    
+    api_key = config.get("api_config", {}).get("api_key", "")
+    if not api_key:
+        return None, ("请先配置API密钥", 400)
+    
+    # 验证所有必需的模块是否存在
+    required_modules = ["screenwriter", "stage_design", "stage_programmer", 
+                      "casting_design", "character_config", "executive_director"]
+    missing_modules = [m for m in required_modules if m not in config.get("modules", {})]
+    if missing_modules:
+        return None, (f"缺少必需的模块配置: {', '.join(missing_modules)}", 500)
+    
+    # 验证每个模块是否有prompt_template
+    for module_name in required_modules:
+        module_config = config["modules"][module_name]
+        if "prompt_template" not in module_config:
+            return None, (f"模块 {module_name} 缺少 prompt_template", 500)
+    
+    return {"user_input": user_input, "reuse": data.get("reuse")}, None
+
+def run_script_pipeline(user_input, config, reuse=None, resume=None):
+    """
+    游戏脚本生成流水线（不依赖请求上下文）
+    每个模块完成后保存检查点；resume为已有运行的检查点时，从第一个未完成的模块继续
+    返回: (响应数据, HTTP状态码)
+    """
+    run = None
     try:
+        # 相似想法复用：reuse未指定时使用配置中的auto_reuse
+        if reuse is None:
+            reuse = config.get("idea_cache", {}).get("auto_reuse", False)
+        match, cached_results = (None, None) if resume else find_reusable_run(user_input, config)
+        similar_idea = None
+        if match is not None:
+            similar_idea = {"run_id": match.run_id, "similarity": match.similarity, "idea": match.idea}
+            if reuse:
+                store = get_artifact_store(config)
+                manifest = store.load_manifest(match.run_id)
+                saved_files = {name: os.path.join(store.run_dir(match.run_id), name)
+                               for name in manifest["files"] if name.endswith('.lua')}
+                log.info("复用相似想法的结果: %s (相似度 %s)", match.run_id, match.similarity)
+                return {
+                    "success": True,
+                    "run_id": match.run_id,
+                    "results": cached_results,
+                    "saved_files": saved_files,
+                    "output_dir": store.run_dir(match.run_id),
+                    "reused": similar_idea
+                }, 200
+        
+        store = get_artifact_store(config)
+        run = resume or RunCheckpoints.start(store, "script", {"user_input": user_input})
+        bind_run(run.run_id)
         results = {}
+        variants = assign_variants(config, run.run_id)
+        bind_variants(variants)
+        if variants:
+            results["prompt_variants"] = variants
+        lua_checks = run.checkpoints.get("lua_checks", {})
+        results["lua_checks"] = lua_checks
         
         # 1. 编剧模块
-        print("开始编剧模块...")
         try:
-            screenwriter_prompt = config["modules"]["screenwriter"]["prompt_template"].format(
+            screenwriter_prompt = module_prompt(config, "screenwriter").format(
                 user_input=user_input
             )
         except KeyError as e:
@@ -336,137 +955,165 @@ def generate_lua():
         except Exception as e:
             raise ValueError(f"编剧模块prompt模板处理失败: {str(e)}")
         
-        blueprint = call_gpt_module("screenwriter", screenwriter_prompt, config)
+        blueprint = run.step("blueprint", lambda: call_gpt_module("screenwriter", screenwriter_prompt, config),
+                             keep=is_json_success)
         results["blueprint"] = blueprint
-        print("编剧模块完成")
         
         blueprint_str = json.dumps(blueprint, ensure_ascii=False) if isinstance(blueprint, dict) else str(blueprint)
         
         # 2. 场务设计模块
-        print("开始场务设计模块...")
-        stage_design_prompt = config["modules"]["stage_design"]["prompt_template"].format(
+        stage_design_prompt = module_prompt(config, "stage_design").format(
             blueprint=blueprint_str
         )
-        stage_design = call_gpt_module("stage_design", stage_design_prompt, config)
+        stage_design = run.step("stage_design", lambda: call_gpt_module("stage_design", stage_design_prompt, config),
+                                keep=is_json_success)
         results["stage_design"] = stage_design
-        print("场务设计模块完成")
         
         stage_design_str = json.dumps(stage_design, ensure_ascii=False) if isinstance(stage_design, dict) else str(stage_design)
         
         # 3. 场务程序模块
-        print("开始场务程序模块...")
-        stage_programmer_prompt = config["modules"]["stage_programmer"]["prompt_template"].format(
+        stage_programmer_prompt = module_prompt(config, "stage_programmer").format(
             stage_design=stage_design_str
         )
-        stage_lua = call_gpt_module("stage_programmer", stage_programmer_prompt, config)
+        stage_lua = run.step("stage_lua", lambda: call_lua_module("stage_programmer", stage_programmer_prompt,
+                                                                   config, lua_checks))
+        run.save("lua_checks", lua_checks)
         results["stage_lua"] = stage_lua
-        print("场务程序模块完成")
         
         # 4. 选角设计模块
-        print("开始选角设计模块...")
-        casting_design_prompt = config["modules"]["casting_design"]["prompt_template"].format(
+        casting_design_prompt = module_prompt(config, "casting_design").format(
             blueprint=blueprint_str,
             stage_design=stage_design_str
         )
-        casting_design = call_gpt_module("casting_design", casting_design_prompt, config)
+        casting_design = run.step("casting_design",
+                                  lambda: call_gpt_module("casting_design", casting_design_prompt, config),
+                                  keep=is_json_success)
         results["casting_design"] = casting_design
-        print("选角设计模块完成")
         
         casting_design_str = json.dumps(casting_design, ensure_ascii=False) if isinstance(casting_design, dict) else str(casting_design)
         
         # 5. 角色配置程序模块
-        print("开始角色配置程序模块...")
-        character_config_prompt = config["modules"]["character_config"]["prompt_template"].format(
+        character_config_prompt = module_prompt(config, "character_config").format(
             casting_design=casting_design_str
         )
-        cast_lua = call_gpt_module("character_config", character_config_prompt, config)
+        cast_lua = run.step("cast_lua", lambda: call_lua_module("character_config", character_config_prompt,
+                                                                 config, lua_checks))
+        run.save("lua_checks", lua_checks)
         results["cast_lua"] = cast_lua
-        print("角色配置程序模块完成")
         
         # 6. 执行导演模块
-        print("开始执行导演模块...")
-        executive_director_prompt = config["modules"]["executive_director"]["prompt_template"].format(
+        executive_director_prompt = module_prompt(config, "executive_director").format(
             blueprint=blueprint_str,
             stage_lua=stage_lua if isinstance(stage_lua, str) else json.dumps(stage_lua, ensure_ascii=False),
             cast_lua=cast_lua if isinstance(cast_lua, str) else json.dumps(cast_lua, ensure_ascii=False)
         )
-        main_lua = call_gpt_module("executive_director", executive_director_prompt, config)
+        main_lua = run.step("main_lua", lambda: call_lua_module("executive_director", executive_director_prompt,
+                                                                 config, lua_checks))
+        run.save("lua_checks", lua_checks)
         results["main_lua"] = main_lua
-        print("执行导演模块完成")
-        
-        # 自动保存生成的 Lua 文件
-        output_dir = "output"
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-        
-        saved_files = {}
         
-        # 保存 stage_lua
-        if isinstance(stage_lua, str) and stage_lua.strip():
-            stage_file = os.path.join(output_dir, "Stage.lua")
-            with open(stage_file, 'w', encoding='utf-8') as f:
-                f.write(stage_lua)
-            saved_files["Stage.lua"] = stage_file
-            print(f"已保存: {stage_file}")
+        files = {"Stage.lua": stage_lua, "Cast.lua": cast_lua, "main.lua": main_lua}
         
-        # 保存 cast_lua
-        if isinstance(cast_lua, str) and cast_lua.strip():
-            cast_file = os.path.join(output_dir, "Cast.lua")
-            with open(cast_file, 'w', encoding='utf-8') as f:
-                f.write(cast_lua)
-            saved_files["Cast.lua"] = cast_file
-            print(f"已保存: {cast_file}")
+        # 可选：把三个文件打包成一个自包含文件，并去掉注释和空白
+        bundle_config = config.get("lua_bundle", {})
+        if bundle_config.get("enabled", False) and all(isinstance(v, str) for v in files.values()):
+            try:
+                with stage("lua_bundle"):
+                    files["main.bundle.lua"], results["bundle"] = bundle_lua(
+                        {"Stage": stage_lua, "Cast": cast_lua}, main_lua,
+                        minify=bundle_config.get("minify", True),
+                        rename_locals=bundle_config.get("rename_locals", False)
+                    )
+                log.info("打包完成: %d -> %d 字节", results['bundle']['input_total_bytes'],
+                         results['bundle']['bundle_bytes'])
+            except (LuaSyntaxError, ValueError) as e:
+                log.warning("打包失败: %s", e)
+                results["bundle"] = {"error": str(e)}
         
-        # 保存 main_lua
-        if isinstance(main_lua, str) and main_lua.strip():
-            main_file = os.path.join(output_dir, "main.lua")
-            with open(main_file, 'w', encoding='utf-8') as f:
-                f.write(main_lua)
-            saved_files["main.lua"] = main_file
-            print(f"已保存: {main_file}")
+        # 自动保存生成的 Lua 文件（每次运行写入独立目录，避免并发请求互相覆盖）
+        already_completed = run.meta.get("status") == "completed"
+        files["results.json"] = json.dumps(results, ensure_ascii=False)
+        run_id, saved_files = store.save_run("script", files, run_id=run.run_id,
+                                             meta={"status": "completed", "failed_step": None, "error": None})
+        results_file = saved_files.pop("results.json", None)
+        for saved_file in saved_files.values():
+            log.info("已保存: %s", saved_file)
+        if results_file and not already_completed:
+            get_idea_index().add(user_input, run_id, "script", config_version(config))
         
-        return jsonify({
+        response = {
             "success": True,
+            "run_id": run_id,
             "results": results,
             "saved_files": saved_files,
-            "output_dir": output_dir
-        })
+            "output_dir": store.run_dir(run_id)
+        }
+        if similar_idea:
+            response["similar_idea"] = similar_idea
+        if run.restored:
+            response["resumed_steps"] = run.restored
+        return response, 200
         
     except ValueError as e:
         # 业务逻辑错误，返回友好的错误信息
-        import traceback
-        error_trace = traceback.format_exc()
-        print(f"业务错误：\n{error_trace}")
-        return jsonify({
+        log.exception("业务错误")
+        return with_resume_info({
             "error": str(e),
             "error_type": "ValueError"
-        }), 500
+        }, run, e), 500
     except Exception as e:
         # 其他未预期的错误
         import traceback
         error_trace = traceback.format_exc()
-        print(f"未预期的错误：\n{error_trace}")
-        return jsonify({
+        log.exception("未预期的错误")
+        return with_resume_info({
             "error": f"服务器内部错误: {str(e)}",
             "error_type": type(e).__name__,
             "traceback": error_trace if app.debug else None
-        }), 500
+        }, run, e), 500
+
+def prompt_hash(template):
+    """prompt模板的内容哈希（用作ETag和提示词地址中的版本号）"""
+    return hashlib.sha256(template.encode('utf-8')).hexdigest()[:16]
+
+def module_summary(name, module_config):
+    """模块目录中的一项：模块元数据和prompt模板的哈希（不含prompt正文）"""
+    template = module_config.get("prompt_template", "")
+    digest = prompt_hash(template)
+    return {
+        "name": module_config.get("name", name),
+        "model": module_config.get("model", ""),
+        "temperature": module_config.get("temperature", 0.5),
+        "max_tokens": module_config.get("max_tokens", 2000),
+        "json_mode": module_config.get("json_mode", False),
+        "prompt_hash": digest,
+        "prompt_chars": len(template),
+        "prompt_url": f"/api/modules/{name}/prompt?v={digest}"
+    }
 
 @app.route('/api/modules', methods=['GET'])
 def get_modules():
-    """获取所有模块的prompt模板"""
+    """模块目录：各模块的元数据和prompt模板哈希，prompt正文通过 prompt_url 按需获取"""
     config = load_config()
-    modules = {}
-    for name, module_config in config.get("modules", {}).items():
-        modules[name] = {
-            "name": module_config.get("name", name),
-            "model": module_config.get("model", ""),
-            "prompt_template": module_config.get("prompt_template", ""),
-            "temperature": module_config.get("temperature", 0.5),
-            "max_tokens": module_config.get("max_tokens", 2000),
-            "json_mode": module_config.get("json_mode", False)
-        }
-    return jsonify(modules)
+    return jsonify({name: module_summary(name, module_config)
+                    for name, module_config in config.get("modules", {}).items()})
+
+@app.route('/api/modules/<module_name>/prompt', methods=['GET'])
+def get_module_prompt(module_name):
+    """
+    获取模块的prompt模板正文，内容哈希作为强ETag
+    地址中的版本号（?v=哈希）与当前内容一致时允许浏览器长期缓存，否则每次都要验证
+    """
+    module_config = load_config().get("modules", {}).get(module_name)
+    if module_config is None:
+        return jsonify({"error": f"模块不存在: {module_name}"}), 404
+    template = module_config.get("prompt_template", "")
+    digest = prompt_hash(template)
+    response = app.response_class(template, mimetype="text/plain")
+    response.set_etag(digest)
+    if request.args.get("v") == digest:
+        response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    return response
 
 @app.route('/api/modules/<module_name>', methods=['POST'])
 def update_module(module_name):
@@ -482,7 +1129,7 @@ def update_module(module_name):
     config["modules"][module_name].update(data)
     save_config(config)
     
-    return jsonify({"success": True, "module": config["modules"][module_name]})
+    return jsonify({"success": True, "module": module_summary(module_name, config["modules"][module_name])})
 
 @app.route('/')
 def index():
@@ -494,35 +1141,106 @@ def favicon():
     """处理favicon请求"""
     return '', 204
 
-@app.route('/api/download/<filename>')
-def download_file(filename):
-    """下载生成的文件"""
-    output_dir = "output"
-    file_path = os.path.join(output_dir, filename)
+@app.route('/api/download/<run_id>/<filename>')
+def download_file(run_id, filename):
+    """下载某次运行生成的文件"""
+    store = get_artifact_store()
+    file_path = store.get_file_path(run_id, filename)
     
-    if os.path.exists(file_path) and filename.endswith('.lua'):
-        return send_file(file_path, as_attachment=True, download_name=filename)
+    if file_path and filename in PROFILE_FILES:
+        # 性能分析结果仅限管理员下载
+        if not is_admin(load_config()):
+            return jsonify({"error": "性能分析结果仅限管理员下载"}), 403
+        mimetype = "application/json" if filename.endswith('.json') else "text/plain"
+        return send_file(os.path.abspath(file_path), as_attachment=True, download_name=filename, mimetype=mimetype)
+    elif file_path and filename.endswith('.lua'):
+        # 内容哈希作为强ETag，未变化的文件返回304
+        digest = store.load_manifest(run_id)["files"][filename]["sha256"]
+        return send_file(os.path.abspath(file_path), as_attachment=True, download_name=filename,
+                         mimetype="text/x-lua", etag=digest)
     else:
         return jsonify({"error": "文件不存在"}), 404
 
+@app.route('/api/startup')
+def startup_report():
+    """启动耗时：导入、应用初始化和后台预热各阶段的耗时，以及预热是否完成"""
+    report = startup.snapshot()
+    report["openai_loaded"] = "openai" in sys.modules
+    return jsonify(report)
+
+@app.route('/api/metrics')
+def metrics():
+    """运行指标：进行中请求合并的执行次数、合并次数和当前进行中的流水线数"""
+    return jsonify({
+        "single_flight": {
+            "script": script_flight.stats(),
+            "level": level_flight.stats()
+        }
+    })
+
+@app.route('/api/usage-report')
+def usage_report():
+    """各模块的用量统计、自动调参建议值及预计效果"""
+    config = load_config()
+    auto_tune = config.get("auto_tune", {})
+    return jsonify({
+        "auto_tune_enabled": bool(auto_tune.get("enabled")),
+        "modules": get_usage_stats().report(config.get("modules", {}), auto_tune.get("tuning"))
+    })
+
+@app.route('/api/prompt-experiments')
+def prompt_experiments():
+    """prompt变体对比：各模块各变体的流量权重、耗时、Token用量、JSON解析成功率和LayoutGuard首次验证通过率"""
+    config = load_config()
+    min_samples = config.get("prompt_experiments", {}).get("min_samples", 20)
+    return jsonify({
+        "min_samples": min_samples,
+        "modules": get_experiment_stats().compare(config.get("modules", {}), min_samples)
+    })
+
+@app.route('/api/layout-library')
+def layout_library_stats():
+    """预验证布局库的统计信息（按索引键汇总）"""
+    keys = get_layout_library().stats()
+    return jsonify({
+        "total": sum(row["layouts"] for row in keys),
+        "keys": keys
+    })
+
 @app.route('/api/files')
 def list_files():
-    """列出所有生成的文件"""
-    output_dir = "output"
-    files = []
-    
-    if os.path.exists(output_dir):
-        for filename in sorted(os.listdir(output_dir)):
-            if filename.endswith('.lua'):
-                file_path = os.path.join(output_dir, filename)
-                file_size = os.path.getsize(file_path)
-                files.append({
-                    "name": filename,
-                    "size": file_size,
-                    "path": f"/api/download/{filename}"
-                })
+    """
+    分页列出生成的文件（基于元数据索引，不扫描目录）
+    查询参数: limit, cursor, pipeline, run_id, date(YYYY-MM-DD), since, until, sort(time|size), order(asc|desc)
+    """
+    try:
+        rows, next_cursor = get_artifact_store().index.list(
+            limit=request.args.get("limit", 50),
+            cursor=request.args.get("cursor"),
+            pipeline=request.args.get("pipeline"),
+            run_id=request.args.get("run_id"),
+            date=request.args.get("date"),
+            since=request.args.get("since"),
+            until=request.args.get("until"),
+            sort=request.args.get("sort", "time"),
+            order=request.args.get("order", "desc")
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    # 完整结果（results.json）不能通过下载接口获取，指向按运行ID获取结果的接口
+    files = [{
+        "name": row["name"],
+        "run_id": row["run_id"],
+        "pipeline": row["pipeline"],
+        "size": row["size"],
+        "sha256": row["sha256"],
+        "created_at": row["created_at"],
+        "path": results_url(row["run_id"]) if row["name"] == "results.json"
+        else f"/api/download/{row['run_id']}/{row['name']}"
+    } for row in rows]
     
-    return jsonify({"files": files})
+    return jsonify({"files": files, "next_cursor": next_cursor})
 
 def validate_layout(intent_data, draft_layout):
     """
@@ -626,7 +1344,7 @@ def validate_layout(intent_data, draft_layout):
     return True, [], draft_layout
 
 def check_reachability(grid_ascii, start_pos, doors):
-    """检查玩家是否能到达至少一个门（BFS）"""
+    """检查玩家是否能到达至少一个门（BFS距离场，与导航数据共用同一实现）"""
     if not start_pos or not doors:
         return True
     
@@ -640,35 +1358,11 @@ def check_reachability(grid_ascii, start_pos, doors):
     if sx < 0 or sy < 0 or sx >= width or sy >= height:
         return False
     
-    # 可行走字符
-    walkable = set('. S C E N D')
-    
-    # BFS
-    visited = set()
-    queue = deque([(sx, sy)])
-    visited.add((sx, sy))
-    
-    directions = [(0, 1), (0, -1), (1, 0), (-1, 0)]
-    
-    while queue:
-        x, y = queue.popleft()
-        
-        # 检查是否到达任何门
-        for door in doors:
-            dx, dy = door.get("x", -1), door.get("y", -1)
-            if (x, y) == (dx, dy):
-                return True
-        
-        # 探索四个方向
-        for dx, dy in directions:
-            nx, ny = x + dx, y + dy
-            if 0 <= nx < width and 0 <= ny < height:
-                if (nx, ny) not in visited:
-                    char = grid_ascii[ny][nx]
-                    if char in walkable:
-                        visited.add((nx, ny))
-                        queue.append((nx, ny))
-    
+    field = distance_field(grid_ascii, [(sx, sy)])
+    for door in doors:
+        dx, dy = door.get("x", -1), door.get("y", -1)
+        if 0 <= dx < width and 0 <= dy < height and field[dy * width + dx] >= 0:
+            return True
     return False
 
 def ascii_to_lua(validated_layout, environment_lua=""):
@@ -687,6 +1381,40 @@ def ascii_to_lua(validated_layout, environment_lua=""):
     # 分配block
     lua_lines.append(f"local block = Env.AllocBlock({width}, {height}, 0, 0)")
     lua_lines.append("")
+    lua_lines.extend(block_lua_lines(grid_ascii, width, height))
+    
+    # 合并环境Lua代码
+    final_lua = "\n".join(lua_lines)
+    if environment_lua:
+        final_lua = environment_lua + "\n\n" + final_lua
+    
+    return final_lua
+
+def world_to_lua(tiles, tile_layouts, environment_lua=""):
+    """
+    把分块生成的大地图转换为Lua代码：每个区块一个Env.AllocBlock（带世界坐标偏移），
+    区块内的物体使用区块内坐标
+    每个区块放在单独的 do ... end 中（Lua每个函数最多200个局部变量，区块数量不受这个限制）
+    """
+    lua_lines = []
+    for tile, layout in zip(tiles, tile_layouts):
+        block = f"block_{tile['tx']}_{tile['ty']}"
+        lua_lines.append(f"-- Tile ({tile['tx']}, {tile['ty']}) at ({tile['x']}, {tile['y']})")
+        lua_lines.append("do")
+        lua_lines.append(f"local {block} = Env.AllocBlock({tile['width']}, {tile['height']}, {tile['x']}, {tile['y']})")
+        lua_lines.extend(block_lua_lines(layout["grid_ascii"], tile["width"], tile["height"], block))
+        lua_lines.append("end")
+        lua_lines.append("")
+    
+    final_lua = "\n".join(lua_lines).rstrip("\n")
+    if environment_lua:
+        final_lua = environment_lua + "\n\n" + final_lua
+    
+    return final_lua
+
+def block_lua_lines(grid_ascii, width, height, block="block"):
+    """一个block内逐格生成的Lua语句（'.'跳过）"""
+    lua_lines = []
     
     # 逐行处理ASCII网格
     for y in range(height):
@@ -696,31 +1424,206 @@ def ascii_to_lua(validated_layout, environment_lua=""):
             
             if char == '#':
                 # 墙
-                lua_lines.append(f'Env.PlaceItem(block, "Wall_Stone", {x}, {y})')
+                lua_lines.append(f'Env.PlaceItem({block}, "Wall_Stone", {x}, {y})')
             elif char == 'S':
                 # 玩家起始位置（注意：这里只是标记位置，实际玩家生成可能需要其他API）
                 # 根据entities中的player_start信息
                 lua_lines.append(f'-- Player start at ({x}, {y})')
             elif char == 'D':
                 # 门（使用Wall_Stone）
-                lua_lines.append(f'Env.PlaceItem(block, "Wall_Stone", {x}, {y})')
+                lua_lines.append(f'Env.PlaceItem({block}, "Wall_Stone", {x}, {y})')
             elif char == 'C':
                 # 宝箱（使用Grave_Stone）
-                lua_lines.append(f'Env.PlaceItem(block, "Grave_Stone", {x}, {y})')
+                lua_lines.append(f'Env.PlaceItem({block}, "Grave_Stone", {x}, {y})')
             elif char == 'E':
                 # 敌人
-                lua_lines.append(f'Env.SpawnNPC(block, "Skeleton_Warrior", {x}, {y}, "Enemy")')
+                lua_lines.append(f'Env.SpawnNPC({block}, "Skeleton_Warrior", {x}, {y}, "Enemy")')
             elif char == 'N':
                 # NPC
-                lua_lines.append(f'Env.SpawnNPC(block, "Ghost_Nun", {x}, {y}, "Neutral")')
+                lua_lines.append(f'Env.SpawnNPC({block}, "Ghost_Nun", {x}, {y}, "Neutral")')
             # '.' 字符跳过，不需要生成代码
     
-    # 合并环境Lua代码
-    final_lua = "\n".join(lua_lines)
-    if environment_lua:
-        final_lua = environment_lua + "\n\n" + final_lua
+    return lua_lines
+
+def generate_world_level(intent_data, environment_lua, config, world, results, run):
+    """
+    大地图分块生成：规划区块和区块间的通道，并行调用Grid Planner生成各区块，
+    拼接后检查整张地图的连通性，返回每个区块一个AllocBlock的Lua代码，以及紧凑导出用的blocks
+    区块规划和每个完成的区块都保存检查点，继续运行时只重新生成失败的区块
+    """
+    world_config = config.get("world", {})
+    grid = intent_data.get("grid", {})
+    width, height = int(grid.get("width", 20)), int(grid.get("height", 12))
     
-    return final_lua
+    plan = run.checkpoints.get("world_plan")
+    if plan is None:
+        tiles = plan_tiles(width, height, world.get("tile_width") or world_config.get("tile_width", 40),
+                           world.get("tile_height") or world_config.get("tile_height", 30),
+                           max_tiles=world_config.get("max_tiles", 100))
+        gates = plan_gates(tiles, random.Random(world_config.get("seed")))
+        plan = {"tiles": tiles, "counts": distribute_counts(intent_data.get("counts", {}), tiles), "gates": gates}
+        run.save("world_plan", plan)
+    tiles, gates = plan["tiles"], plan["gates"]
+    log.info("大地图 %dx%d 分为 %d 个区块", width, height, len(tiles))
+    run.current = "world"
+    
+    # 每个区块至少尝试一次（tile_retries为0时也不会在没有验证结果的情况下报错）
+    max_retries = max(1, int(world_config.get("tile_retries", 3)))
+    
+    def generate_tile(index):
+        tile = tiles[index]
+        name = f"tile_{tile['tx']}_{tile['ty']}"
+        if name in run.checkpoints:
+            run.restored.append(name)
+            return run.checkpoints[name]
+        intent = tile_intent(intent_data, tile, plan["counts"][index], tile_gates(index, tiles, gates), index == 0)
+        prompt = build_grid_planner_prompt(config, intent) + tile_prompt_suffix(intent)
+        errors = []
+        for attempt in range(max_retries):
+            log.info("生成区块(%d, %d) (尝试 %d/%d)", tile['tx'], tile['ty'], attempt + 1, max_retries)
+            layout = call_gpt_module("grid_planner", prompt, config)
+            with stage("layout_guard"):
+                is_valid, errors = validate_tile(intent, layout)
+            if attempt == 0:
+                record_variant_check("grid_planner", "layout_guard_first_attempt", is_valid)
+            if is_valid:
+                run.save(name, layout)
+                return layout
+            log.warning("区块(%d, %d)验证失败: %s", tile['tx'], tile['ty'], errors)
+        raise ValueError(f"区块({tile['tx']}, {tile['ty']})重试{max_retries}次仍未通过验证: {errors[0]['detail']}")
+    
+    with ThreadPoolExecutor(max_workers=max(1, world_config.get("max_parallel", 4))) as executor:
+        futures = [executor.submit(in_context(generate_tile), index) for index in range(len(tiles))]
+        tile_layouts, failures = [], []
+        for future in futures:
+            try:
+                tile_layouts.append(future.result())
+            except Exception as e:
+                failures.append(str(e))
+    if failures:
+        raise ValueError("；".join(failures))
+    
+    with stage("stitch_world"):
+        world_layout = stitch_world(width, height, tiles, tile_layouts)
+        connected, connectivity = check_world_connectivity(world_layout, tiles)
+    results["world"] = {
+        "tiles": [dict(tile, counts=counts) for tile, counts in zip(tiles, plan["counts"])],
+        "gates": [gate["world"] for gate in gates],
+        "connectivity": connectivity
+    }
+    if not connected:
+        raise ValueError(f"区块拼接后地图不连通: {connectivity}")
+    results["validated_result"] = {"status": "valid", "errors": [], "layout": world_layout}
+    results["layout_source"] = {"source": "llm_tiles"}
+    run.current = None
+    with stage("ascii_to_lua"):
+        return world_to_lua(tiles, tile_layouts, environment_lua), world_blocks(tiles, tile_layouts)
+
+def generate_layout_candidates(grid_planner_prompt, config, count):
+    """
+    调用Grid Planner生成count个候选布局，返回 (候选列表, 生成方式)
+    - single_call: 一次chat.completions调用用n参数生成全部候选（输入Token只计一次，只有一次往返）
+    - parallel: 模型不支持n参数（responses API或接口报错）或关闭了single_call时，并行调用count次；
+      单个失败的候选记为错误（验证不通过），全部失败才抛出
+    只有一个候选时直接调用一次，失败直接抛出
+    """
+    if count <= 1:
+        return [call_gpt_module("grid_planner", grid_planner_prompt, config)], "single_call"
+    scoring_config = config.get("layout_scoring", {})
+    model = module_model(config, "grid_planner")
+    model_key = (config.get("api_config", {}).get("base_url"), model)
+    if scoring_config.get("single_call", True) and not uses_responses_api(model) and model_key not in _n_unsupported:
+        try:
+            drafts = call_gpt_module("grid_planner", grid_planner_prompt, config, n=count)
+            if drafts:
+                return drafts, "single_call"
+        except CandidatesNotSupported as e:
+            _n_unsupported.add(model_key)
+            log.info("改为并行生成候选: %s", e)
+    max_parallel = max(1, scoring_config.get("max_parallel", 4))
+    
+    def generate(_):
+        try:
+            return call_gpt_module("grid_planner", grid_planner_prompt, config), None
+        except Exception as e:
+            return {"error": str(e)}, e
+    
+    with ThreadPoolExecutor(max_workers=min(count, max_parallel)) as executor:
+        outcomes = list(executor.map(in_context(generate), range(count)))
+    if all(error is not None for _, error in outcomes):
+        raise outcomes[0][1]
+    return [draft for draft, _ in outcomes], "parallel"
+
+def layout_score_result(best, ranking=None, candidates=1, positions=None):
+    """
+    响应中的布局评分（ranking为所有通过验证的候选的排名）
+    positions: 通过验证的候选在所有候选中的下标，selected和ranking中的index换算成所有候选中的下标
+    """
+    result = {key: best[key] for key in ("score", "metrics", "components")}
+    result["candidates"] = candidates
+    if ranking is not None:
+        if positions is None:
+            positions = range(len(ranking))
+        result["selected"] = positions[best["index"]]
+        result["ranking"] = [{"index": positions[r["index"]], "score": r["score"]} for r in ranking]
+    return result
+
+@staged("prompt_format")
+def build_grid_planner_prompt(config, intent_data):
+    """构造Grid Planner的prompt（未配置prompt_template时使用默认prompt）"""
+    intent_str = json.dumps(intent_data, ensure_ascii=False)
+    grid_planner_prompt = module_prompt(config, "grid_planner").format(
+        intent=intent_str
+    )
+    if not grid_planner_prompt:
+        grid_planner_prompt = f"""System:
+You are a top-down RPG level layout designer.
+Your task is to design an ASCII grid layout and entity coordinates.
+Do NOT generate Lua code.
+
+Developer:
+Output MUST be strict JSON. Do not include explanations or markdown.
+Use exactly the following structure:
+
+{{
+  "grid_meta": {{
+    "width": int,
+    "height": int,
+    "meters_per_char": number,
+    "origin": "top_left_(0,0)"
+  }},
+  "grid_ascii": ["string"],
+  "entities": {{
+    "player_start": {{"x": int, "y": int}},
+    "doors": [{{"x": int, "y": int}}],
+    "chests": [{{"x": int, "y": int}}],
+    "enemies": [{{"x": int, "y": int, "type": "Skeleton_Warrior"}}],
+    "npcs": [{{"x": int, "y": int, "type": "Ghost_Nun"}}]
+  }},
+  "design_notes": ["string"]
+}}
+
+Hard rules:
+1. grid_ascii length must equal height
+2. each row length must equal width
+3. allowed characters only: . # S C E N D
+4. exactly ONE 'S'
+5. symbol counts must match counts in intent
+6. entity coordinates must match symbols in grid_ascii
+
+Design goals:
+- Main path should be clear
+- Chest should be on a side path if possible
+- Respect difficulty and notes from intent
+
+design_notes:
+- max 3 short bullet-style sentences
+
+User:
+{{
+  "intent": {intent_str}
+}}"""
+    return grid_planner_prompt
 
 @app.route('/api/generate-level', methods=['POST'])
 def generate_level():
@@ -729,49 +1632,133 @@ def generate_level():
         data = request.json
         if not data:
             return jsonify({"error": "请求数据为空"}), 400
-            
-        user_input = data.get("user_input", "")
-        use_intent_parser = data.get("use_intent_parser", True)
-        
-        if not user_input:
-            return jsonify({"error": "用户输入不能为空"}), 400
         
         config = load_config()
-        
-        if not config:
-            return jsonify({"error": "配置文件不存在或为空"}), 500
-        
-        if "api_config" not in config:
-            return jsonify({"error": "配置文件中缺少api_config配置"}), 500
-        
-        api_key = config.get("api_config", {}).get("api_key", "")
-        if not api_key:
-            return jsonify({"error": "请先配置API密钥"}), 400
-        
-        # 验证必需的模块是否存在（只需要grid_planner，layout_guard/lua_builder/lua_validator用Python实现）
-        required_modules = ["grid_planner"]
-        if use_intent_parser:
-            required_modules.insert(0, "intent_parser")
-        
-        missing_modules = [m for m in required_modules if m not in config.get("modules", {})]
-        if missing_modules:
-            return jsonify({"error": f"缺少必需的模块配置: {', '.join(missing_modules)}"}), 500
+        params, error = level_params(data, config)
+        if not error:
+            detail, error = requested_detail(data, config)
+        if error:
+            return jsonify({"error": error[0]}), error[1]
     
     except KeyError as e:
         return jsonify({"error": f"配置错误: 缺少必需的配置项 {str(e)}"}), 500
     except Exception as e:
         return jsonify({"error": f"配置加载失败: {str(e)}"}), 500
     
+    profile, denied = profiling_requested(config)
+    if denied:
+        return denied
+    
+    # 相同的并发请求只执行一次流水线，其余请求等待并共享结果
+    key = flight_key("level", config, **params)
+    payload, status = execute_pipeline("level", level_flight, key,
+                                       lambda: run_level_pipeline(config=config, **params), config, profile)
+    return jsonify(shape_payload(payload, "level", *detail)), status
+
+def level_params(data, config):
+    """
+    校验关卡生成的请求参数和配置（HTTP接口和 batch_cli.py 共用）
+    返回: (流水线参数, None)，校验失败时返回 (None, (错误信息, HTTP状态码))
+    """
+    user_input = data.get("user_input", "")
+    use_intent_parser = data.get("use_intent_parser", True)
+    
+    if not user_input:
+        return None, ("用户输入不能为空", 400)
+    
+    if not config:
+        return None, ("配置文件不存在或为空", 500)
+    
+    # 布局来源: llm（调用Grid Planner）或 library（优先从预验证布局库中取，未命中时再调用Grid Planner）
+    library_config = config.get("layout_library", {})
+    layout_source = data.get("layout_source") or library_config.get("default_source", "llm")
+    if layout_source not in ("llm", "library"):
+        return None, (f"无效的layout_source: {layout_source}，可选值为 llm、library", 400)
+    
+    # 生成模式: single（整张地图一次生成）或 world（大地图分块生成）
+    mode = data.get("mode", "single")
+    if mode not in ("single", "world"):
+        return None, (f"无效的mode: {mode}，可选值为 single、world", 400)
+    world = None
+    if mode == "world":
+        try:
+            world = {key: int(data[key]) for key in ("tile_width", "tile_height") if data.get(key)}
+        except (TypeError, ValueError):
+            return None, ("tile_width和tile_height必须是整数", 400)
+    
+    # 候选布局数: 单张地图模式下一次生成多个布局，通过验证的按质量评分取最好的
+    candidates = None
+    if data.get("candidates") is not None:
+        max_candidates = config.get("layout_scoring", {}).get("max_candidates", 8)
+        try:
+            candidates = int(data["candidates"])
+        except (TypeError, ValueError):
+            return None, ("candidates必须是整数", 400)
+        if not 1 <= candidates <= max_candidates:
+            return None, (f"candidates必须在1到{max_candidates}之间", 400)
+    
+    if "api_config" not in config:
+        return None, ("配置文件中缺少api_config配置", 500)
+    
+    api_key = config.get("api_config", {}).get("api_key", "")
+    if not api_key:
+        return None, ("请先配置API密钥", 400)
+    
+    # 验证必需的模块是否存在（只需要grid_planner，layout_guard/lua_builder/lua_validator用Python实现）
+    required_modules = ["grid_planner"]
+    if use_intent_parser:
+        required_modules.insert(0, "intent_parser")
+    
+    missing_modules = [m for m in required_modules if m not in config.get("modules", {})]
+    if missing_modules:
+        return None, (f"缺少必需的模块配置: {', '.join(missing_modules)}", 500)
+    
+    return {
+        "user_input": user_input,
+        "use_intent_parser": use_intent_parser,
+        "layout_source": layout_source,
+        "world": world,
+        "candidates": candidates
+    }, None
+
+def run_level_pipeline(user_input, config, use_intent_parser=True, layout_source="llm", resume=None, world=None,
+                       candidates=None):
+    """
+    关卡生成流水线（不依赖请求上下文）
+    Intent和通过验证的布局完成后保存检查点；resume为已有运行的检查点时跳过已完成的步骤
+    world不为None时使用大地图分块模式（可指定tile_width、tile_height）
+    candidates为单张地图模式下每次生成的候选布局数（默认取配置layout_scoring.candidates）
+    返回: (响应数据, HTTP状态码)
+    """
+    library_config = config.get("layout_library", {})
+    run = None
     try:
         results = {}
+        store = get_artifact_store(config)
+        run = resume or RunCheckpoints.start(store, "level", {
+            "user_input": user_input,
+            "use_intent_parser": use_intent_parser,
+            "layout_source": layout_source,
+            "world": world,
+            "candidates": candidates
+        })
+        bind_run(run.run_id)
+        variants = assign_variants(config, run.run_id)
+        bind_variants(variants)
+        if variants:
+            results["prompt_variants"] = variants
         
-        # Module 0: Intent Parser (可选)
-        intent_data = None
-        if use_intent_parser:
-            print("开始Intent Parser模块...")
+        # Module 0: Intent Parser (可选，已有检查点时直接复用)
+        intent_data = run.checkpoints.get("intent")
+        intent_parsed = False
+        if intent_data is not None:
+            log.info("使用检查点: intent")
+            run.restored.append("intent")
+            if use_intent_parser:
+                results["intent"] = intent_data
+        if use_intent_parser and intent_data is None:
             try:
-                intent_parser_config = config["modules"]["intent_parser"]
-                intent_prompt = intent_parser_config.get("prompt_template", "").format(
+                intent_prompt = module_prompt(config, "intent_parser").format(
                     user_input=user_input
                 )
                 if not intent_prompt:
@@ -835,9 +1822,9 @@ User:
                 
                 intent_data = call_gpt_module("intent_parser", intent_prompt, config)
                 results["intent"] = intent_data
-                print("Intent Parser模块完成")
+                intent_parsed = is_json_success(intent_data)
             except Exception as e:
-                print(f"Intent Parser模块失败: {str(e)}")
+                log.warning("Intent Parser模块失败: %s", e)
                 # Intent Parser是可选的，失败时继续使用默认值
                 intent_data = {
                     "language": "zh",
@@ -869,9 +1856,21 @@ User:
                 },
                 "environment_lua": 'Env.SetEnvironment("Foggy", "Night")'
             }
+        # 只保存Intent Parser成功解析的输出，失败时的默认值不保存（继续运行时重新调用Intent Parser）
+        if "intent" not in run.checkpoints and intent_parsed:
+            run.save("intent", intent_data)
         
-        # 提取环境Lua代码
+        # 提取环境Lua代码（LLM生成，先做语法检查，不合法时使用默认值）
         environment_lua = intent_data.get("environment_lua", "")
+        if not isinstance(environment_lua, str):
+            environment_lua = ""
+        environment_lua = strip_markdown_fences(environment_lua).strip()
+        if environment_lua:
+            env_error = check_lua_syntax(environment_lua)
+            if env_error:
+                log.warning("environment_lua语法检查失败，使用默认环境: %s", env_error)
+                results["lua_checks"] = {"environment_lua": {"status": "invalid", "errors": [env_error]}}
+                environment_lua = ""
         if not environment_lua:
             # 如果没有，根据theme和difficulty生成默认值
             theme = intent_data.get("theme", "default").lower()
@@ -887,151 +1886,303 @@ User:
             
             environment_lua = f'Env.SetEnvironment("{weather}", "{time}")'
         
-        intent_str = json.dumps(intent_data, ensure_ascii=False)
+        if world is not None:
+            # 大地图模式：分块并行生成后拼接
+            level_lua, export_blocks = generate_world_level(intent_data, environment_lua, config, world, results, run)
+            results["level_lua"] = level_lua
+        else:
+            # Module 1: Grid Planner
+            grid_planner_prompt = build_grid_planner_prompt(config, intent_data)
         
-        # Module 1: Grid Planner
-        print("开始Grid Planner模块...")
-        grid_planner_config = config["modules"]["grid_planner"]
-        grid_planner_prompt = grid_planner_config.get("prompt_template", "").format(
-            intent=intent_str
-        )
-        if not grid_planner_prompt:
-            grid_planner_prompt = f"""System:
-You are a top-down RPG level layout designer.
-Your task is to design an ASCII grid layout and entity coordinates.
-Do NOT generate Lua code.
-
-Developer:
-Output MUST be strict JSON. Do not include explanations or markdown.
-Use exactly the following structure:
-
-{{
-  "grid_meta": {{
-    "width": int,
-    "height": int,
-    "meters_per_char": number,
-    "origin": "top_left_(0,0)"
-  }},
-  "grid_ascii": ["string"],
-  "entities": {{
-    "player_start": {{"x": int, "y": int}},
-    "doors": [{{"x": int, "y": int}}],
-    "chests": [{{"x": int, "y": int}}],
-    "enemies": [{{"x": int, "y": int, "type": "Skeleton_Warrior"}}],
-    "npcs": [{{"x": int, "y": int, "type": "Ghost_Nun"}}]
-  }},
-  "design_notes": ["string"]
-}}
-
-Hard rules:
-1. grid_ascii length must equal height
-2. each row length must equal width
-3. allowed characters only: . # S C E N D
-4. exactly ONE 'S'
-5. symbol counts must match counts in intent
-6. entity coordinates must match symbols in grid_ascii
-
-Design goals:
-- Main path should be clear
-- Chest should be on a side path if possible
-- Respect difficulty and notes from intent
-
-design_notes:
-- max 3 short bullet-style sentences
-
-User:
-{{
-  "intent": {intent_str}
-}}"""
+            # Module 1: Grid Planner (带重试机制)
+            max_retries = 3
+            scoring_config = config.get("layout_scoring", {})
+            candidate_count = candidates or scoring_config.get("candidates", 1)
+            validated_layout = None
+            validation_errors = []
+            library_enabled = library_config.get("enabled", True)
         
-        # Module 1: Grid Planner (带重试机制)
-        max_retries = 3
-        validated_layout = None
-        validation_errors = []
+            saved_layout = run.checkpoints.get("layout")
+            if saved_layout:
+                log.info("使用检查点: layout")
+                run.restored.append("layout")
+                validated_layout = saved_layout["layout"]
+                results.update(saved_layout["results"])
+            run.current = "layout"
         
-        for attempt in range(max_retries):
-            print(f"开始Grid Planner模块 (尝试 {attempt + 1}/{max_retries})...")
-            draft_layout = call_gpt_module("grid_planner", grid_planner_prompt, config)
-            results["draft_layout"] = draft_layout
-            print("Grid Planner模块完成")
+            # 从预验证布局库中取布局（随机旋转/镜像），变换后重新验证
+            if validated_layout is None and library_enabled and layout_source == "library":
+                library = get_layout_library(config)
+                try:
+                    sampled = library.sample(intent_data, transforms=library_config.get("transforms", True))
+                except Exception as e:
+                    # intent中的尺寸或数量不是数字（LLM输出了null、"twenty"等）时不查布局库
+                    log.warning("布局库查询失败: %s", e)
+                    sampled = None
+                if sampled:
+                    library_layout, layout_id, transform = sampled
+                    is_valid, errors, _ = validate_layout(intent_data, library_layout)
+                    if is_valid:
+                        log.info("从布局库中取得布局 #%s (变换: %s)", layout_id, transform)
+                        validated_layout = library_layout
+                        results["draft_layout"] = library_layout
+                        results["validated_result"] = {
+                            "status": "valid",
+                            "errors": [],
+                            "layout": library_layout
+                        }
+                        results["layout_source"] = {"source": "library", "layout_id": layout_id, "transform": transform}
+                    else:
+                        log.warning("布局库中的布局 #%s 变换后验证失败，已移除: %s", layout_id, errors)
+                        library.remove(layout_id)
+                if validated_layout is None:
+                    log.info("布局库未命中，调用Grid Planner")
+        
+            for attempt in range(0 if validated_layout is not None else max_retries):
+                log.info("Grid Planner 尝试 %d/%d，候选数 %d", attempt + 1, max_retries, candidate_count)
+                drafts, generation_mode = generate_layout_candidates(grid_planner_prompt, config, candidate_count)
+                draft_layout = drafts[0]
+                results["draft_layout"] = draft_layout
+                if candidate_count > 1:
+                    results["layout_candidates"] = {"requested": candidate_count, "received": len(drafts),
+                                                    "mode": generation_mode}
             
-            # Module 1.5: LayoutGuard (Python验证)
-            print("开始LayoutGuard模块 (Python验证)...")
-            is_valid, errors, validated_layout = validate_layout(intent_data, draft_layout)
+                # Module 1.5: LayoutGuard (Python验证)
+                # selection=best: 多个候选都通过时按质量评分取最好的；first: 取第一个通过验证的候选
+                with module_span(log, "layout_guard", candidates=len(drafts)):
+                    if scoring_config.get("selection", "best") == "first":
+                        checked = []
+                        for draft in drafts:
+                            checked.append(validate_layout(intent_data, draft))
+                            if checked[-1][0]:
+                                break
+                    else:
+                        checked = [validate_layout(intent_data, draft) for draft in drafts]
+                    passed = [layout for ok, _, layout in checked if ok]
+                    passed_positions = [index for index, (ok, _, _) in enumerate(checked) if ok]
+                    ranking = rank_layouts(passed, scoring_config.get("weights")) if passed else None
+                if attempt == 0:
+                    for ok, _, _ in checked:
+                        record_variant_check("grid_planner", "layout_guard_first_attempt", ok)
+                is_valid, errors, validated_layout = checked[0]
+                if passed:
+                    is_valid, errors, validated_layout = True, [], ranking[0]["layout"]
+                    draft_layout = validated_layout
+                    results["draft_layout"] = draft_layout
+                    results["layout_score"] = layout_score_result(ranking[0], ranking, len(drafts),
+                                                                   passed_positions)
             
-            if is_valid:
-                print("LayoutGuard验证通过")
-                results["validated_result"] = {
-                    "status": "valid",
-                    "errors": [],
-                    "layout": validated_layout
-                }
-                break
-            else:
-                validation_errors = errors
-                print(f"LayoutGuard验证失败: {errors}")
-                results["validated_result"] = {
-                    "status": "invalid",
-                    "errors": errors,
-                    "layout": draft_layout
-                }
-                if attempt < max_retries - 1:
-                    print(f"验证失败，将重新调用Grid Planner...")
+                if is_valid:
+                    log.info("LayoutGuard验证通过")
+                    results["validated_result"] = {
+                        "status": "valid",
+                        "errors": [],
+                        "layout": validated_layout
+                    }
+                    results["layout_source"] = {"source": "llm"}
+                    # 通过验证的布局自动收录到布局库
+                    if library_enabled and library_config.get("auto_add", True):
+                        try:
+                            get_layout_library(config).add(intent_data, validated_layout)
+                        except Exception as e:
+                            log.warning("布局收录失败: %s", e)
+                    break
                 else:
-                    print(f"已达到最大重试次数，使用最后一次生成的布局")
-                    validated_layout = draft_layout  # 使用最后一次的布局，即使验证失败
+                    validation_errors = errors
+                    log.warning("LayoutGuard验证失败: %s", errors)
+                    results["validated_result"] = {
+                        "status": "invalid",
+                        "errors": errors,
+                        "layout": draft_layout
+                    }
+                    if attempt < max_retries - 1:
+                        log.info("验证失败，将重新调用Grid Planner")
+                    else:
+                        log.warning("已达到最大重试次数，使用最后一次生成的布局")
+                        validated_layout = draft_layout  # 使用最后一次的布局，即使验证失败
+        
+            if validated_layout is None:
+                return {"error": "无法生成有效的布局"}, 500
+            # 只保存通过验证的布局，验证失败时继续运行会重新调用Grid Planner
+            if not saved_layout and results.get("validated_result", {}).get("status") == "valid":
+                run.save("layout", {
+                    "layout": validated_layout,
+                    "results": {key: results[key] for key in ("draft_layout", "validated_result", "layout_source",
+                                                              "layout_score", "layout_candidates") if key in results}
+                })
+            run.current = None
         
-        if validated_layout is None:
-            return jsonify({"error": "无法生成有效的布局"}), 500
+            # Module 2: ASCII转Lua (Python转换，不再使用LLM)
+            with module_span(log, "ascii_to_lua"):
+                level_lua = ascii_to_lua(validated_layout, environment_lua)
+            results["level_lua"] = level_lua
+            export_blocks = None
         
-        # Module 2: ASCII转Lua (Python转换，不再使用LLM)
-        print("开始ASCII转Lua转换 (Python实现)...")
-        level_lua = ascii_to_lua(validated_layout, environment_lua)
-        results["level_lua"] = level_lua
-        print("ASCII转Lua转换完成")
+        # 布局质量评分（布局库、单个候选和大地图模式只评分，不做选择）
+        validated_result = results.get("validated_result", {})
+        if "layout_score" not in results and validated_result.get("status") == "valid":
+            with stage("layout_scoring"):
+                results["layout_score"] = layout_score_result(
+                    score_layout(validated_result["layout"], config.get("layout_scoring", {}).get("weights")))
         
         final_lua = level_lua
+        files = {"Level.lua": final_lua}
         
-        # 自动保存生成的 Lua 文件
-        output_dir = "output"
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
+        # 紧凑导出：网格打包+实体表，嵌入Lua加载器（引擎加载时调用相同的Env API）
+        export_config = config.get("level_export", {})
+        if export_config.get("enabled", True):
+            try:
+                with stage("level_export"):
+                    if export_blocks is None:
+                        export_blocks = layout_blocks(validated_layout)
+                    packed = pack_level(export_blocks)
+                    files["Level.packed.lua"] = loader_lua(packed, environment_lua)
+                results["level_export"] = {
+                    "format_version": LEVEL_EXPORT_VERSION,
+                    "packed_bytes": len(packed),
+                    "loader_lua_bytes": len(files["Level.packed.lua"].encode('utf-8')),
+                    "source_lua_bytes": len(final_lua.encode('utf-8'))
+                }
+                # 打包数据已经嵌入Level.packed.lua，只在配置了include_data时才放进响应
+                if export_config.get("include_data", False):
+                    results["level_export"]["data_base64"] = base64.b64encode(packed).decode('ascii')
+            except (ValueError, KeyError, TypeError) as e:
+                # 最后一次的布局可能是JSON解析失败的输出（没有grid_ascii）
+                log.warning("紧凑导出失败: %s", e)
         
-        saved_files = {}
+        # 导航数据：到起点和各个门的距离场 + 路点图，运行时AI直接查表
+        nav_layout = results.get("validated_result", {}).get("layout")
+        if config.get("navigation", {}).get("enabled", True) and nav_layout:
+            try:
+                with stage("navigation"):
+                    nav = build_navigation(nav_layout)
+                    files["LevelNav.lua"] = nav_to_lua(nav)
+                results["navigation"] = navigation_summary(nav)
+            except (ValueError, KeyError, TypeError) as e:
+                log.warning("导航数据生成失败: %s", e)
         
-        # 保存最终验证后的 level_lua
-        if isinstance(final_lua, str) and final_lua.strip():
-            level_file = os.path.join(output_dir, "Level.lua")
-            with open(level_file, 'w', encoding='utf-8') as f:
-                f.write(final_lua)
-            saved_files["Level.lua"] = level_file
-            print(f"已保存: {level_file}")
+        # 自动保存生成的 Lua 文件（每次运行写入独立目录，避免并发请求互相覆盖）
+        files["results.json"] = json.dumps(results, ensure_ascii=False)
+        run_id, saved_files = store.save_run("level", files, run_id=run.run_id,
+                                             meta={"status": "completed", "failed_step": None, "error": None})
+        saved_files.pop("results.json", None)
+        for saved_file in saved_files.values():
+            log.info("已保存: %s", saved_file)
         
-        return jsonify({
+        response = {
             "success": True,
+            "run_id": run_id,
             "results": results,
             "saved_files": saved_files,
-            "output_dir": output_dir
-        })
+            "output_dir": store.run_dir(run_id)
+        }
+        if run.restored:
+            response["resumed_steps"] = run.restored
+        return response, 200
         
+    except TooManyTiles as e:
+        # 请求的地图太大，不调用任何区块的Grid Planner
+        log.warning("区块数量超过上限: %s", e)
+        return with_resume_info({
+            "error": str(e),
+            "error_type": "TooManyTiles"
+        }, run, e), 400
     except ValueError as e:
-        import traceback
-        error_trace = traceback.format_exc()
-        print(f"业务错误：\n{error_trace}")
-        return jsonify({
+        log.exception("业务错误")
+        return with_resume_info({
             "error": str(e),
             "error_type": "ValueError"
-        }), 500
+        }, run, e), 500
     except Exception as e:
         import traceback
         error_trace = traceback.format_exc()
-        print(f"未预期的错误：\n{error_trace}")
-        return jsonify({
+        log.exception("未预期的错误")
+        return with_resume_info({
             "error": f"服务器内部错误: {str(e)}",
             "error_type": type(e).__name__,
             "traceback": error_trace if app.debug else None
-        }), 500
+        }, run, e), 500
+
+@app.route('/api/resume/<run_id>', methods=['POST'])
+def resume_run(run_id):
+    """从第一个未完成的步骤继续之前失败（或中断）的运行，已完成的步骤使用检查点，不再调用API"""
+    config = load_config()
+    if not config or "api_config" not in config:
+        return jsonify({"error": "配置文件不存在或缺少api_config配置"}), 500
+    if not config.get("api_config", {}).get("api_key", ""):
+        return jsonify({"error": "请先配置API密钥"}), 400
+    detail, error = requested_detail(request.get_json(silent=True), config)
+    if error:
+        return jsonify({"error": error[0]}), error[1]
+    
+    profile, denied = profiling_requested(config)
+    if denied:
+        return denied
+    
+    store = get_artifact_store(config)
+    manifest = store.load_manifest(run_id)
+    if not manifest or "request" not in manifest.get("meta", {}):
+        return jsonify({"error": "运行不存在或不支持继续"}), 404
+    
+    request_data = manifest["meta"]["request"]
+    if manifest["pipeline"] == "script":
+        flight = script_flight
+        pipeline = lambda: run_script_pipeline(request_data["user_input"], config, reuse=False,
+                                               resume=RunCheckpoints.resume(store, run_id))
+    else:
+        flight = level_flight
+        pipeline = lambda: run_level_pipeline(request_data["user_input"], config,
+                                              request_data.get("use_intent_parser", True),
+                                              request_data.get("layout_source", "llm"),
+                                              resume=RunCheckpoints.resume(store, run_id),
+                                              world=request_data.get("world"),
+                                              candidates=request_data.get("candidates"))
+    
+    # 同一个运行的重复继续请求只执行一次
+    payload, status = execute_pipeline(manifest["pipeline"], flight, ("resume", run_id), pipeline, config, profile)
+    return jsonify(shape_payload(payload, manifest["pipeline"], *detail)), status
+
+@app.route('/api/runs/<run_id>/results')
+@app.route('/api/runs/<run_id>/results/<field>')
+def run_results(run_id, field=None):
+    """
+    按运行ID获取完整结果或其中一个字段（响应使用 detail=summary/final 时省略的中间产物）
+    已完成的运行读取保存的结果，未完成的运行返回已完成步骤的检查点；查询参数fields可以只取部分字段
+    """
+    store = get_artifact_store()
+    manifest = store.load_manifest(run_id)
+    if not manifest:
+        return jsonify({"error": "运行不存在"}), 404
+    results_path = store.get_file_path(run_id, "results.json")
+    if results_path:
+        with open(results_path, 'r', encoding='utf-8') as f:
+            results = json.load(f)
+    else:
+        results = store.load_checkpoints(run_id, manifest)
+    if field is not None:
+        if field not in results:
+            return jsonify({"error": f"运行 {run_id} 没有结果字段 {field}"}), 404
+        return jsonify({"run_id": run_id, "field": field, "value": results[field]})
+    if request.args.get("fields"):
+        names = [name.strip() for name in request.args["fields"].split(",")]
+        results = {name: results[name] for name in names if name in results}
+    return jsonify({
+        "run_id": run_id,
+        "pipeline": manifest.get("pipeline"),
+        "status": manifest.get("meta", {}).get("status"),
+        "complete": results_path is not None,
+        "results": results
+    })
+
+# 响应压缩 + 配置/模块/下载/运行结果接口的条件GET
+init_http_cache(app, etag_endpoints={"get_config", "get_modules", "get_module_prompt", "download_file",
+                                     "run_results"})
+startup.record("app_setup", (time.perf_counter() - _import_started) * 1000 - startup.phases[0]["duration_ms"])
+startup.mark("cold")
 
 if __name__ == '__main__':
+    # 调试模式下重新加载器的父进程不处理请求，只在实际服务的进程中预热
+    if load_config().get("startup", {}).get("warmup", True) and os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_warmup()
     app.run(debug=True, port=5000)
 
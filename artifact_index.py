@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+产物元数据索引（SQLite），写入产物时同步更新，列表查询使用游标分页
+"""
+
+import base64
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+INDEX_FILE = "index.sqlite3"
+
+SORT_COLUMNS = {
+    "time": "created_at",
+    "size": "size",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS artifacts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    pipeline TEXT,
+    sha256 TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    UNIQUE (run_id, name)
+);
+CREATE INDEX IF NOT EXISTS idx_artifacts_time ON artifacts (created_at, id);
+CREATE INDEX IF NOT EXISTS idx_artifacts_size ON artifacts (size, id);
+CREATE INDEX IF NOT EXISTS idx_artifacts_pipeline_time ON artifacts (pipeline, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_artifacts_pipeline_size ON artifacts (pipeline, size, id);
+CREATE INDEX IF NOT EXISTS idx_artifacts_run ON artifacts (run_id);
+"""
+
+
+def encode_cursor(sort_value, row_id):
+    """把(排序值, 行ID)编码为不透明的游标字符串"""
+    raw = json.dumps([sort_value, row_id], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """解析游标，格式错误时抛出ValueError"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        return sort_value, int(row_id)
+    except Exception:
+        raise ValueError(f"无效的游标: {cursor}")
+
+
+def parse_time(value):
+    """解析时间参数：支持Unix时间戳或ISO日期/时间"""
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        pass
+    try:
+        return datetime.fromisoformat(str(value)).timestamp()
+    except ValueError:
+        raise ValueError(f"无效的时间: {value}")
+
+
+def day_range(date_str):
+    """把YYYY-MM-DD转换为当天的[开始, 结束)时间戳"""
+    try:
+        day = datetime.strptime(date_str, "%Y-%m-%d")
+    except ValueError:
+        raise ValueError(f"无效的日期: {date_str}，应为YYYY-MM-DD")
+    return day.timestamp(), (day + timedelta(days=1)).timestamp()
+
+
+class ArtifactIndex:
+    """产物元数据索引，每个线程持有独立的SQLite连接"""
+
+    def __init__(self, root="output"):
+        self.path = os.path.join(root, INDEX_FILE)
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def is_empty(self):
+        """索引中是否没有任何记录"""
+        return self._connect().execute("SELECT 1 FROM artifacts LIMIT 1").fetchone() is None
+
+    def add_run(self, manifest):
+        """登记（或更新）一次运行的全部文件"""
+        created_at = manifest.get("created_at", time.time())
+        rows = [
+            (manifest["run_id"], name, manifest.get("pipeline"), info["sha256"], info["size"], created_at)
+            for name, info in manifest.get("files", {}).items()
+        ]
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT INTO artifacts (run_id, name, pipeline, sha256, size, created_at) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (run_id, name) DO UPDATE SET sha256 = excluded.sha256, size = excluded.size",
+                rows
+            )
+
+    def remove_runs(self, run_ids):
+        """删除运行对应的记录"""
+        if not run_ids:
+            return
+        with self._connect() as conn:
+            conn.executemany("DELETE FROM artifacts WHERE run_id = ?", [(run_id,) for run_id in run_ids])
+
+    def list(self, limit=50, cursor=None, pipeline=None, run_id=None, date=None,
+             since=None, until=None, sort="time", order="desc"):
+        """
+        分页列出产物
+        返回: (记录列表, 下一页游标或None)
+        """
+        if sort not in SORT_COLUMNS:
+            raise ValueError(f"无效的排序字段: {sort}，可选: {', '.join(SORT_COLUMNS)}")
+        if order not in ("asc", "desc"):
+            raise ValueError(f"无效的排序方向: {order}，可选: asc, desc")
+        try:
+            limit = max(1, min(int(limit), 500))
+        except (TypeError, ValueError):
+            raise ValueError(f"无效的limit: {limit}")
+        column = SORT_COLUMNS[sort]
+
+        where = []
+        params = []
+        if pipeline:
+            where.append("pipeline = ?")
+            params.append(pipeline)
+        if run_id:
+            where.append("run_id = ?")
+            params.append(run_id)
+        if date:
+            day_start, day_end = day_range(date)
+            where.append("created_at >= ? AND created_at < ?")
+            params.extend([day_start, day_end])
+        since = parse_time(since)
+        if since is not None:
+            where.append("created_at >= ?")
+            params.append(since)
+        until = parse_time(until)
+        if until is not None:
+            where.append("created_at < ?")
+            params.append(until)
+        if cursor:
+            sort_value, row_id = decode_cursor(cursor)
+            op = "<" if order == "desc" else ">"
+            where.append(f"({column} {op} ? OR ({column} = ? AND id {op} ?))")
+            params.extend([sort_value, sort_value, row_id])
+
+        direction = "DESC" if order == "desc" else "ASC"
+        sql = "SELECT id, run_id, name, pipeline, sha256, size, created_at FROM artifacts"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += f" ORDER BY {column} {direction}, id {direction} LIMIT ?"
+        params.append(limit + 1)
+
+        rows = self._connect().execute(sql, params).fetchall()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            next_cursor = encode_cursor(last[column], last["id"])
+        return [dict(row) for row in rows], next_cursor
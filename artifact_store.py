@@ -0,0 +1,313 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+产物存储：每次生成写入独立的运行目录，内容按哈希去重，原子写入
+"""
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+
+from artifact_index import ArtifactIndex
+
+OBJECTS_DIR = "objects"
+RUNS_DIR = "runs"
+MANIFEST_FILE = "manifest.json"
+
+RUN_ID_PATTERN = re.compile(r'^[0-9A-Za-z_-]{1,64}$')
+
+
+def new_run_id():
+    """生成按时间排序的运行ID"""
+    return time.strftime("%Y%m%d-%H%M%S") + "-" + uuid.uuid4().hex[:8]
+
+
+def is_valid_run_id(run_id):
+    """检查运行ID是否合法（防止路径穿越）"""
+    return bool(run_id) and bool(RUN_ID_PATTERN.match(run_id))
+
+
+def manifest_objects(manifest):
+    """清单引用的全部内容对象（文件和检查点）"""
+    yield from manifest.get("files", {}).values()
+    yield from manifest.get("checkpoints", {}).values()
+
+
+def atomic_write(path, data):
+    """先写临时文件再rename，保证读者只会看到完整文件"""
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class ArtifactStore:
+    """
+    目录结构:
+        <root>/objects/<sha256前2位>/<sha256>   内容寻址的文件本体（相同内容只存一份）
+        <root>/runs/<run_id>/<filename>         指向本体的硬链接（不支持硬链接时复制）
+        <root>/runs/<run_id>/manifest.json      本次运行的文件清单（含各步骤检查点引用的内容对象）
+        <root>/index.sqlite3                    元数据索引（用于分页列表）
+    """
+
+    def __init__(self, root="output", max_age_hours=None, max_total_mb=None, gc_interval=60):
+        self.root = root
+        self.max_age_hours = max_age_hours
+        self.max_total_mb = max_total_mb
+        self.gc_interval = gc_interval
+        self._lock = threading.RLock()
+        self._last_gc = 0.0
+        # 回收运行后的回调 callback(removed_run_ids)，用于清理引用这些运行的其他索引
+        self.gc_listeners = []
+        os.makedirs(os.path.join(root, OBJECTS_DIR), exist_ok=True)
+        os.makedirs(os.path.join(root, RUNS_DIR), exist_ok=True)
+        self.index = ArtifactIndex(root)
+        if self.index.is_empty():
+            self.rebuild_index()
+
+    def rebuild_index(self):
+        """从各运行的清单重建索引（首次启用索引或索引文件丢失时）"""
+        for run_id in self.list_runs():
+            manifest = self.load_manifest(run_id)
+            if manifest:
+                self.index.add_run(manifest)
+
+    def configure(self, storage_config):
+        """根据config.json中的storage配置更新回收策略"""
+        storage_config = storage_config or {}
+        self.max_age_hours = storage_config.get("max_age_hours", self.max_age_hours)
+        self.max_total_mb = storage_config.get("max_total_mb", self.max_total_mb)
+        self.gc_interval = storage_config.get("gc_interval", self.gc_interval)
+
+    def run_dir(self, run_id):
+        """运行目录路径"""
+        if not is_valid_run_id(run_id):
+            raise ValueError(f"非法的运行ID: {run_id}")
+        return os.path.join(self.root, RUNS_DIR, run_id)
+
+    def object_path(self, digest):
+        """内容对象路径"""
+        return os.path.join(self.root, OBJECTS_DIR, digest[:2], digest)
+
+    def put_object(self, data):
+        """写入内容对象，已存在则直接复用，返回sha256"""
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.object_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            atomic_write(path, data)
+        return digest
+
+    def _link_into_run(self, digest, target_path):
+        """把内容对象放入运行目录（硬链接优先，失败时复制），同样通过rename完成"""
+        target_dir = os.path.dirname(target_path)
+        tmp_path = os.path.join(target_dir, f".tmp-{uuid.uuid4().hex}")
+        try:
+            os.link(self.object_path(digest), tmp_path)
+        except OSError:
+            shutil.copyfile(self.object_path(digest), tmp_path)
+        os.replace(tmp_path, target_path)
+
+    def save_run(self, pipeline, files, run_id=None, meta=None):
+        """
+        保存一次运行的产物
+        files: {文件名: 内容}，空内容会被跳过
+        返回: (run_id, {文件名: 路径})
+        """
+        run_id = run_id or new_run_id()
+        run_dir = self.run_dir(run_id)
+        saved_files = {}
+
+        with self._lock:
+            os.makedirs(run_dir, exist_ok=True)
+            manifest = self.load_manifest(run_id) or {
+                "run_id": run_id,
+                "pipeline": pipeline,
+                "created_at": time.time(),
+                "files": {}
+            }
+            if meta:
+                manifest.setdefault("meta", {}).update(meta)
+
+            for filename, content in files.items():
+                if not isinstance(content, str) or not content.strip():
+                    continue
+                if os.path.basename(filename) != filename or filename.startswith('.'):
+                    raise ValueError(f"非法的文件名: {filename}")
+                data = content.encode('utf-8')
+                digest = self.put_object(data)
+                file_path = os.path.join(run_dir, filename)
+                self._link_into_run(digest, file_path)
+                manifest["files"][filename] = {"sha256": digest, "size": len(data)}
+                saved_files[filename] = file_path
+
+            manifest["updated_at"] = time.time()
+            atomic_write(os.path.join(run_dir, MANIFEST_FILE),
+                         json.dumps(manifest, ensure_ascii=False, indent=2))
+            self.index.add_run(manifest)
+
+        self.maybe_gc()
+        return run_id, saved_files
+
+    def save_checkpoint(self, run_id, pipeline, step, value):
+        """
+        保存流水线某一步的输出（JSON），内容写入对象存储，清单中只记录引用
+        返回: sha256
+        """
+        data = json.dumps(value, ensure_ascii=False).encode('utf-8')
+        run_dir = self.run_dir(run_id)
+        with self._lock:
+            os.makedirs(run_dir, exist_ok=True)
+            manifest = self.load_manifest(run_id) or {
+                "run_id": run_id,
+                "pipeline": pipeline,
+                "created_at": time.time(),
+                "files": {}
+            }
+            digest = self.put_object(data)
+            manifest.setdefault("checkpoints", {})[step] = {"sha256": digest, "size": len(data), "saved_at": time.time()}
+            manifest["updated_at"] = time.time()
+            atomic_write(os.path.join(run_dir, MANIFEST_FILE),
+                         json.dumps(manifest, ensure_ascii=False, indent=2))
+        return digest
+
+    def load_checkpoints(self, run_id, manifest=None):
+        """读取运行的全部检查点: {步骤名: 输出}，内容对象丢失的步骤被忽略"""
+        manifest = manifest or self.load_manifest(run_id) or {}
+        checkpoints = {}
+        for step, info in manifest.get("checkpoints", {}).items():
+            try:
+                with open(self.object_path(info["sha256"]), 'r', encoding='utf-8') as f:
+                    checkpoints[step] = json.load(f)
+            except (OSError, ValueError):
+                continue
+        return checkpoints
+
+    def load_manifest(self, run_id):
+        """读取运行清单，不存在时返回None"""
+        try:
+            manifest_path = os.path.join(self.run_dir(run_id), MANIFEST_FILE)
+        except ValueError:
+            return None
+        if not os.path.exists(manifest_path):
+            return None
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def get_file_path(self, run_id, filename):
+        """返回运行中某个文件的路径，只允许清单中登记过的文件"""
+        manifest = self.load_manifest(run_id)
+        if not manifest or filename not in manifest.get("files", {}):
+            return None
+        file_path = os.path.join(self.run_dir(run_id), filename)
+        return file_path if os.path.exists(file_path) else None
+
+    def list_runs(self):
+        """列出所有运行ID（按时间排序）"""
+        runs_root = os.path.join(self.root, RUNS_DIR)
+        if not os.path.exists(runs_root):
+            return []
+        return sorted(name for name in os.listdir(runs_root) if is_valid_run_id(name))
+
+    def maybe_gc(self):
+        """按gc_interval节流的垃圾回收"""
+        if not self.max_age_hours and not self.max_total_mb:
+            return None
+        now = time.time()
+        if now - self._last_gc < (self.gc_interval or 0):
+            return None
+        return self.gc(now=now)
+
+    def gc(self, now=None):
+        """
+        回收旧运行：先删除超过max_age_hours的运行，再按时间从旧到新删除直到总大小低于max_total_mb，
+        最后删除不再被任何运行引用的内容对象
+        """
+        now = now or time.time()
+        removed_runs = []
+
+        with self._lock:
+            self._last_gc = now
+            manifests = []
+            for run_id in self.list_runs():
+                manifest = self.load_manifest(run_id)
+                if manifest is None:
+                    # 没有清单的目录是写入中断留下的残留，超过一小时后清理
+                    run_dir = self.run_dir(run_id)
+                    if now - os.path.getmtime(run_dir) > 3600:
+                        shutil.rmtree(run_dir, ignore_errors=True)
+                        removed_runs.append(run_id)
+                    continue
+                manifests.append(manifest)
+            manifests.sort(key=lambda m: m.get("created_at", 0))
+
+            if self.max_age_hours:
+                cutoff = now - self.max_age_hours * 3600
+                while manifests and manifests[0].get("created_at", 0) < cutoff:
+                    removed_runs.append(self._remove_run(manifests.pop(0)["run_id"]))
+
+            if self.max_total_mb:
+                limit = self.max_total_mb * 1024 * 1024
+                object_sizes = {}
+                for manifest in manifests:
+                    for info in manifest_objects(manifest):
+                        object_sizes[info["sha256"]] = info["size"]
+                total = sum(object_sizes.values())
+                while manifests and total > limit:
+                    manifest = manifests.pop(0)
+                    removed_runs.append(self._remove_run(manifest["run_id"]))
+                    still_used = {info["sha256"] for m in manifests for info in manifest_objects(m)}
+                    for info in manifest_objects(manifest):
+                        if info["sha256"] in object_sizes and info["sha256"] not in still_used:
+                            total -= object_sizes.pop(info["sha256"])
+
+            referenced = {info["sha256"] for m in manifests for info in manifest_objects(m)}
+            removed_objects = self._remove_unreferenced_objects(referenced)
+            self.index.remove_runs(removed_runs)
+
+        if removed_runs:
+            for listener in self.gc_listeners:
+                listener(removed_runs)
+        return {"removed_runs": removed_runs, "removed_objects": removed_objects}
+
+    def _remove_run(self, run_id):
+        """删除运行目录"""
+        shutil.rmtree(self.run_dir(run_id), ignore_errors=True)
+        return run_id
+
+    def _remove_unreferenced_objects(self, referenced):
+        """删除未被引用的内容对象"""
+        removed = 0
+        objects_root = os.path.join(self.root, OBJECTS_DIR)
+        for prefix in os.listdir(objects_root):
+            prefix_dir = os.path.join(objects_root, prefix)
+            if not os.path.isdir(prefix_dir):
+                continue
+            for digest in os.listdir(prefix_dir):
+                if digest.startswith('.') or digest in referenced:
+                    continue
+                try:
+                    os.remove(os.path.join(prefix_dir, digest))
+                    removed += 1
+                except OSError:
+                    pass
+        return removed
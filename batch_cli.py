@@ -0,0 +1,261 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+批量生成：从JSONL文件读取游戏想法或关卡描述，不启动HTTP服务，直接调用 /api/generate 和 /api/generate-level 的流水线
+
+输入每行一个JSON对象，字段与对应接口的请求体相同，另外可以有:
+- id: 行ID（默认 line-<行号>），用于断点续跑
+- pipeline: script 或 level（默认取 --pipeline）
+也可以每行只写一个JSON字符串，作为 user_input
+
+每完成一行就向输出JSONL追加一条记录（状态、运行ID、产物文件、耗时、错误），生成的Lua文件照常保存在产物目录中。
+重新运行同一命令时跳过已成功的行；失败的行如果已有检查点，从失败的步骤继续
+
+使用方法:
+    python batch_cli.py ideas.jsonl --pipeline script --parallel 4
+    python batch_cli.py levels.jsonl --pipeline level --output levels.results.jsonl --include-results
+    python batch_cli.py levels.jsonl --pipeline level --record levels.cassette.jsonl    # 录制LLM流量
+    python batch_cli.py levels.jsonl --pipeline level --replay levels.cassette.jsonl    # 离线回放
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import app
+from log_utils import bind_request, flush_logging, setup_logging
+from run_checkpoint import RunCheckpoints
+
+# 设置Windows控制台编码
+if sys.platform == 'win32':
+    try:
+        sys.stdout.reconfigure(encoding='utf-8')
+    except:
+        pass
+
+# 流水线: (参数校验, 流水线函数)，与HTTP接口共用
+PIPELINES = {
+    "script": (app.script_params, app.run_script_pipeline),
+    "level": (app.level_params, app.run_level_pipeline),
+}
+
+
+def read_rows(path, default_pipeline):
+    """读取输入JSONL，返回 [(行ID, 流水线, 请求数据)]，跳过空行"""
+    rows, seen = [], set()
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                data = json.loads(line)
+            except ValueError as e:
+                raise ValueError(f"第{line_no}行不是合法的JSON: {e}")
+            if isinstance(data, str):
+                data = {"user_input": data}
+            if not isinstance(data, dict):
+                raise ValueError(f"第{line_no}行必须是JSON对象或字符串")
+            row_id = str(data.get("id") or f"line-{line_no}")
+            if row_id in seen:
+                raise ValueError(f"第{line_no}行的id重复: {row_id}")
+            seen.add(row_id)
+            pipeline = data.get("pipeline") or default_pipeline
+            if pipeline not in PIPELINES:
+                raise ValueError(f"第{line_no}行的pipeline无效: {pipeline}，可选值为 script、level")
+            rows.append((row_id, pipeline, data))
+    return rows
+
+
+def load_previous(path):
+    """读取已有的输出JSONL，返回 {行ID: 最后一条记录}（中断时写了一半的行忽略）"""
+    previous = {}
+    if not os.path.exists(path):
+        return previous
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            previous[record["id"]] = record
+    return previous
+
+
+def run_row(row_id, pipeline, data, config, previous=None, include_results=False):
+    """执行一行，返回输出记录（流水线异常也记录为失败，不向外抛出）"""
+    bind_request(row_id)
+    validate, run = PIPELINES[pipeline]
+    record = {"id": row_id, "pipeline": pipeline, "user_input": data.get("user_input")}
+    started = time.perf_counter()
+
+    params, error = validate(data, config)
+    if error:
+        record.update(status="error", error=error[0], elapsed_s=0.0)
+        return record
+
+    # 上次失败且有检查点时从失败的步骤继续
+    resume = None
+    if previous and previous.get("status") == "error" and previous.get("run_id"):
+        resume = RunCheckpoints.resume(app.get_artifact_store(config), previous["run_id"])
+        if resume is not None and pipeline == "script":
+            params["reuse"] = False
+    try:
+        payload, status = run(config=config, resume=resume, **params)
+    except Exception as e:
+        payload, status = {"error": f"{type(e).__name__}: {e}"}, 500
+
+    record.update({
+        "status": "ok" if payload.get("success") else "error",
+        "http_status": status,
+        "run_id": payload.get("run_id"),
+        "elapsed_s": round(time.perf_counter() - started, 3),
+    })
+    if payload.get("success"):
+        record["output_dir"] = payload.get("output_dir")
+        record["saved_files"] = payload.get("saved_files")
+        for key in ("resumed_steps", "reused"):
+            if payload.get(key):
+                record[key] = payload[key]
+        if include_results:
+            record["results"] = payload.get("results")
+    else:
+        record["error"] = payload.get("error")
+        record["failed_step"] = payload.get("failed_step")
+    return record
+
+
+def format_duration(seconds):
+    seconds = int(round(seconds))
+    if seconds >= 3600:
+        return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m{seconds % 60:02d}s"
+    return f"{seconds}s"
+
+
+class Progress:
+    """进度、吞吐量（条/分钟）和按当前吞吐量估算的剩余时间"""
+
+    def __init__(self, total):
+        self.total = total
+        self.done = 0
+        self.failed = 0
+        self.started = time.perf_counter()
+
+    def update(self, record):
+        self.done += 1
+        self.failed += record["status"] != "ok"
+        elapsed = time.perf_counter() - self.started
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        eta = (self.total - self.done) / rate if rate > 0 else 0.0
+        mark = "✅" if record["status"] == "ok" else "❌"
+        line = (f"[{self.done}/{self.total}] {mark} {record['id']} {record['elapsed_s']:.1f}s | "
+                f"已用 {format_duration(elapsed)} | {rate * 60:.1f} 条/分钟 | 预计剩余 {format_duration(eta)}")
+        if record["status"] != "ok":
+            line += f"\n    错误: {record.get('error')}"
+        return line
+
+    def summary(self):
+        elapsed = time.perf_counter() - self.started
+        rate = self.done / elapsed * 60 if elapsed > 0 else 0.0
+        return (f"完成 {self.done - self.failed} 条，失败 {self.failed} 条，"
+                f"总耗时 {format_duration(elapsed)}，吞吐量 {rate:.1f} 条/分钟")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="批量生成（JSONL输入，不启动HTTP服务）")
+    parser.add_argument("input", help="输入JSONL文件")
+    parser.add_argument("--pipeline", choices=sorted(PIPELINES), default="script",
+                        help="没有指定pipeline字段的行使用的流水线（默认script）")
+    parser.add_argument("--output", help="输出JSONL文件（默认 <输入文件名>.results.jsonl）")
+    parser.add_argument("--parallel", type=int, default=2, help="同时执行的行数（默认2）")
+    parser.add_argument("--config", default=app.CONFIG_FILE, help="配置文件（默认config.json）")
+    parser.add_argument("--output-dir", default=app.OUTPUT_DIR, help="产物目录（默认output）")
+    parser.add_argument("--include-results", action="store_true", help="在输出记录中包含各模块的完整结果")
+    parser.add_argument("--log-level", default="WARNING", help="日志级别（默认WARNING，进度单独输出）")
+    cassette = parser.add_mutually_exclusive_group()
+    cassette.add_argument("--record", metavar="CASSETTE", help="把LLM请求和返回录制到cassette文件")
+    cassette.add_argument("--replay", metavar="CASSETTE", help="从cassette文件回放LLM返回（不调用LLM）")
+    parser.add_argument("--replay-latency", type=float, metavar="SCALE",
+                        help="回放时按录制的耗时乘以SCALE等待（默认不等待）")
+    args = parser.parse_args(argv)
+
+    app.CONFIG_FILE = args.config
+    app.OUTPUT_DIR = args.output_dir
+    config = app.load_config()
+    if not config:
+        print(f"❌ 配置文件不存在或为空: {args.config}")
+        return 2
+    setup_logging(dict(config.get("logging") or {}, level=args.log_level))
+    if args.record or args.replay:
+        config["llm_cassette"] = {
+            "mode": "record" if args.record else "replay",
+            "path": args.record or args.replay,
+            "replay_latency": args.replay_latency is not None,
+            "latency_scale": args.replay_latency if args.replay_latency is not None else 1.0,
+        }
+        try:
+            app.get_cassette(config)
+        except ValueError as e:
+            print(f"❌ {e}")
+            return 2
+
+    try:
+        rows = read_rows(args.input, args.pipeline)
+    except (OSError, ValueError) as e:
+        print(f"❌ 读取输入失败: {e}")
+        return 2
+    output = args.output or os.path.splitext(args.input)[0] + ".results.jsonl"
+    previous = load_previous(output)
+    pending = [row for row in rows if previous.get(row[0], {}).get("status") != "ok"]
+    print(f"共 {len(rows)} 条，已完成 {len(rows) - len(pending)} 条，待处理 {len(pending)} 条，并发 {args.parallel}")
+    print(f"结果写入 {output}，产物目录 {args.output_dir}")
+
+    progress = Progress(len(pending))
+    written = set()
+    with open(output, 'a', encoding='utf-8') as out:
+        def write(future):
+            record = future.result()
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+            written.add(future)
+            print(progress.update(record), flush=True)
+
+        executor = ThreadPoolExecutor(max_workers=max(1, args.parallel))
+        futures = [executor.submit(run_row, row_id, pipeline, data, config, previous.get(row_id), args.include_results)
+                   for row_id, pipeline, data in pending]
+        try:
+            for future in as_completed(futures):
+                write(future)
+        except KeyboardInterrupt:
+            # 取消未开始的行，等待进行中的行完成并写入结果（再次Ctrl+C强制退出）
+            cancelled = sum(future.cancel() for future in futures)
+            running = [future for future in futures if not future.cancelled() and future not in written]
+            print(f"\n中断：已取消 {cancelled} 条，等待进行中的 {len(running)} 条完成", flush=True)
+            for future in as_completed(running):
+                if future not in written:
+                    write(future)
+        finally:
+            executor.shutdown(wait=True)
+
+    flush_logging()
+    print(progress.summary())
+    cassette = app.get_cassette(config)
+    if cassette is not None:
+        stats = cassette.stats()
+        print(f"cassette {stats['path']}: 录制 {stats['recorded']} 次，回放命中 {stats['hits']} 次，未命中 {stats['misses']} 次")
+    unfinished = len(pending) - progress.done
+    if unfinished:
+        print(f"还有 {unfinished} 条未处理，再次运行同一命令继续")
+    return 0 if progress.failed == 0 and not unfinished else 1
+
+
+if __name__ == '__main__':
+    try:
+        sys.exit(main())
+    except KeyboardInterrupt:
+        print("\n强制退出，进行中的行没有写入结果，再次运行同一命令会重新执行")
+        sys.exit(130)
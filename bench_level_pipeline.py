@@ -0,0 +1,268 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+关卡流水线纯Python部分的微基准测试
+覆盖 validate_layout、check_reachability、ascii_to_lua、extract_json_from_response
+
+使用方法:
+    python bench_level_pipeline.py                                  # 运行全部用例
+    python bench_level_pipeline.py --quick                          # 跳过大尺寸用例
+    python bench_level_pipeline.py --save-baseline bench_baseline.json
+    python bench_level_pipeline.py --compare bench_baseline.json --threshold 0.15
+"""
+
+import argparse
+import gc
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+# 设置Windows控制台编码
+if sys.platform == 'win32':
+    try:
+        sys.stdout.reconfigure(encoding='utf-8')
+    except:
+        pass
+
+from app import validate_layout, check_reachability, ascii_to_lua, extract_json_from_response
+
+GRID_SIZES = [(20, 12), (50, 30), (100, 100), (250, 250), (1000, 1000)]
+QUICK_GRID_SIZES = [(20, 12), (50, 30), (100, 100)]
+DENSITIES = {"sparse": 0.005, "dense": 0.05}
+MAP_KINDS = ["open", "maze"]
+SEED = 20240601
+
+
+# ==================== 测试数据生成 ====================
+
+def make_open_grid(width, height, rng):
+    """四周是墙、内部随机散布少量柱子的开阔地图"""
+    grid = [['#'] * width for _ in range(height)]
+    for y in range(1, height - 1):
+        for x in range(1, width - 1):
+            grid[y][x] = '#' if rng.random() < 0.08 else '.'
+    return grid
+
+
+def make_maze_grid(width, height, rng):
+    """随机深度优先生成的迷宫（只有一条路径相连，BFS最坏情况）"""
+    grid = [['#'] * width for _ in range(height)]
+    start = (1, 1)
+    grid[1][1] = '.'
+    stack = [start]
+    while stack:
+        x, y = stack[-1]
+        neighbors = [(x + dx, y + dy, dx, dy) for dx, dy in ((2, 0), (-2, 0), (0, 2), (0, -2))
+                     if 0 < x + dx < width - 1 and 0 < y + dy < height - 1 and grid[y + dy][x + dx] == '#']
+        if not neighbors:
+            stack.pop()
+            continue
+        nx, ny, dx, dy = rng.choice(neighbors)
+        grid[y + dy // 2][x + dx // 2] = '.'
+        grid[ny][nx] = '.'
+        stack.append((nx, ny))
+    return grid
+
+
+def make_layout(width, height, kind, density, rng):
+    """生成一个能通过validate_layout的布局及对应的intent"""
+    grid = make_maze_grid(width, height, rng) if kind == "maze" else make_open_grid(width, height, rng)
+    floor = [(x, y) for y in range(height) for x in range(width) if grid[y][x] == '.']
+
+    # 起点放在左上，门放在离起点最远的可达格子，制造最长的BFS路径
+    floor.sort(key=lambda c: (c[0] + c[1]))
+    sx, sy = floor[0]
+    door_x, door_y = floor[-1]
+    grid[sy][sx] = 'S'
+    grid[door_y][door_x] = 'D'
+
+    entities = {"player_start": {"x": sx, "y": sy}, "doors": [{"x": door_x, "y": door_y}],
+                "chests": [], "enemies": [], "npcs": []}
+    counts = {"enemy": 0, "npc": 0, "chest": 0, "door": 1}
+
+    middle = floor[1:-1]
+    rng.shuffle(middle)
+    entity_total = max(3, int(len(floor) * density))
+    for i, (x, y) in enumerate(middle[:entity_total]):
+        symbol, key, count_key = (('E', "enemies", "enemy"), ('N', "npcs", "npc"), ('C', "chests", "chest"))[i % 3]
+        grid[y][x] = symbol
+        entity = {"x": x, "y": y}
+        if symbol == 'E':
+            entity["type"] = "Skeleton_Warrior"
+        elif symbol == 'N':
+            entity["type"] = "Ghost_Nun"
+        entities[key].append(entity)
+        counts[count_key] += 1
+
+    layout = {
+        "grid_meta": {"width": width, "height": height, "meters_per_char": 1, "origin": "top_left_(0,0)"},
+        "grid_ascii": [''.join(row) for row in grid],
+        "entities": entities,
+        "design_notes": ["benchmark fixture"]
+    }
+    intent = {"grid": {"width": width, "height": height}, "counts": counts}
+    return intent, layout
+
+
+def make_json_texts(layout):
+    """基于布局生成各种形态的LLM输出文本：完整、代码块、带说明文字、不同程度的截断"""
+    body = json.dumps(layout, ensure_ascii=False)
+    pretty = json.dumps(layout, ensure_ascii=False, indent=2)
+    # 截断点选在字符串中间，触发修复逻辑
+    mid_string = body.rfind('"', 0, len(body) // 2) + 3
+    return {
+        "plain": body,
+        "fenced": f"```json\n{pretty}\n```",
+        "prose": f"这是生成的布局：\n{pretty}\n希望对你有帮助。",
+        "truncated_90": body[:int(len(body) * 0.9)],
+        "truncated_50": body[:len(body) // 2],
+        "truncated_mid_string": body[:mid_string],
+    }
+
+
+# ==================== 计时 ====================
+
+def measure(func, repeat, min_time):
+    """自动校准内循环次数，返回每次调用的耗时列表（秒）和峰值内存（字节）"""
+    gc.collect()
+    start = time.perf_counter()
+    func()
+    single = time.perf_counter() - start
+    number = max(1, int(min_time / single)) if single > 0 else 1000
+
+    timings = []
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for _ in range(number):
+                func()
+            timings.append((time.perf_counter() - start) / number)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return timings, peak, number
+
+
+def build_cases(sizes):
+    """生成所有基准用例: [(名称, 可调用对象)]"""
+    rng = random.Random(SEED)
+    cases = []
+    for width, height in sizes:
+        for kind in MAP_KINDS:
+            for density_name, density in DENSITIES.items():
+                intent, layout = make_layout(width, height, kind, density, rng)
+                tag = f"{width}x{height}/{kind}/{density_name}"
+                grid = layout["grid_ascii"]
+                start = layout["entities"]["player_start"]
+                doors = layout["entities"]["doors"]
+                assert validate_layout(intent, layout)[0], f"测试数据无效: {tag}"
+
+                cases.append((f"validate_layout/{tag}", lambda i=intent, l=layout: validate_layout(i, l)))
+                cases.append((f"check_reachability/{tag}",
+                              lambda g=grid, s=start, d=doors: check_reachability(g, s, d)))
+                cases.append((f"ascii_to_lua/{tag}",
+                              lambda l=layout: ascii_to_lua(l, 'Env.SetEnvironment("Foggy", "Night")')))
+
+        # JSON提取只与文本形态和大小有关，每个尺寸取一个开阔地图即可
+        _, layout = make_layout(width, height, "open", DENSITIES["sparse"], rng)
+        for variant, text in make_json_texts(layout).items():
+            cases.append((f"extract_json/{width}x{height}/{variant}",
+                          lambda t=text: extract_json_from_response(t)))
+    return cases
+
+
+# ==================== 基线对比 ====================
+
+def compare(results, baseline, threshold):
+    """与基线对比（使用最小值，受系统噪声影响最小），返回回退（变慢超过阈值）的用例列表"""
+    regressions = []
+    base_results = baseline.get("results", {})
+    for name, stats in results.items():
+        base = base_results.get(name)
+        if not base:
+            continue
+        ratio = stats["min_s"] / base["min_s"] if base["min_s"] else 1.0
+        stats["baseline_min_s"] = base["min_s"]
+        stats["ratio"] = ratio
+        if ratio > 1 + threshold:
+            regressions.append((name, ratio))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="关卡流水线微基准测试")
+    parser.add_argument("--quick", action="store_true", help="跳过250x250和1000x1000用例")
+    parser.add_argument("--filter", default="", help="只运行名称包含该字符串的用例")
+    parser.add_argument("--repeat", type=int, default=5, help="每个用例的重复轮数")
+    parser.add_argument("--min-time", type=float, default=0.2, help="每轮的最短计时时间（秒）")
+    parser.add_argument("--save-baseline", help="把结果保存为基线文件")
+    parser.add_argument("--compare", help="与基线文件对比")
+    parser.add_argument("--threshold", type=float, default=0.15, help="判定为回退的变慢比例（默认15%%）")
+    parser.add_argument("--json", dest="json_out", help="把结果写入JSON文件")
+    args = parser.parse_args(argv)
+
+    print("生成测试数据...", flush=True)
+    cases = [(name, func) for name, func in build_cases(QUICK_GRID_SIZES if args.quick else GRID_SIZES)
+             if args.filter in name]
+
+    results = {}
+    print(f"{'用例':<52} {'中位数':>12} {'最小值':>12} {'峰值内存':>12}")
+    for name, func in cases:
+        timings, peak, number = measure(func, args.repeat, args.min_time)
+        median = statistics.median(timings)
+        results[name] = {
+            "median_s": median,
+            "min_s": min(timings),
+            "stdev_s": statistics.stdev(timings) if len(timings) > 1 else 0.0,
+            "peak_bytes": peak,
+            "loops": number,
+        }
+        print(f"{name:<52} {median * 1000:>10.3f}ms {min(timings) * 1000:>10.3f}ms {peak / 1024:>10.1f}KB",
+              flush=True)
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.time(),
+        "results": results,
+    }
+
+    exit_code = 0
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n❌ {len(regressions)} 个用例比基线慢超过 {args.threshold * 100:.0f}%:")
+            for name, ratio in sorted(regressions, key=lambda r: -r[1]):
+                print(f"  {name}: {ratio:.2f}x")
+            exit_code = 1
+        else:
+            print(f"\n✅ 所有用例均未超过基线 {args.threshold * 100:.0f}% 的回退阈值")
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"基线已保存到 {args.save_baseline}")
+    if args.json_out:
+        with open(args.json_out, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
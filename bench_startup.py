@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+冷启动基准测试：从启动进程到可以处理请求、到预热完成，以及第一次生成请求的耗时
+
+每次试验在临时目录中启动一个新的app进程（LLM使用本地 mock_llm_server.py，不消耗API额度），
+分别测量不预热（cold）和后台预热（warm）两种模式:
+- import_ms: 新进程中 import app 的耗时
+- serving_ms: 启动进程到 /api/startup 第一次返回的耗时
+- ready_ms: 启动进程到预热完成的耗时（只有warm模式）
+- first_request_ms / second_request_ms: 第一次和第二次 /api/generate-level 的耗时
+
+使用方法:
+    python bench_startup.py
+    python bench_startup.py --trials 5 --json startup.json
+"""
+
+import argparse
+import json
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+# 设置Windows控制台编码
+if sys.platform == 'win32':
+    try:
+        sys.stdout.reconfigure(encoding='utf-8')
+    except:
+        pass
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+LEVEL_REQUEST = {"user_input": "一个20x12的地牢，有2个敌人和1个宝箱", "use_intent_parser": False}
+
+SERVER_CODE = """
+import sys
+sys.path.insert(0, {repo!r})
+import app
+if {warm!r}:
+    app.start_warmup()
+app.app.run(port={port}, threaded=True)
+"""
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def http(method, url, body=None, timeout=30):
+    data = json.dumps(body).encode('utf-8') if body is not None else None
+    req = urllib.request.Request(url, data=data, method=method, headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(req, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+def wait_for(func, timeout=30, interval=0.005):
+    """轮询直到func返回真值，返回 (结果, 耗时秒)"""
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        try:
+            result = func()
+            if result:
+                return result, time.perf_counter() - started
+        except OSError:
+            pass
+        time.sleep(interval)
+    raise TimeoutError("等待超时")
+
+
+def measure_import(trials):
+    """新进程中 import app 的耗时（毫秒），以及导入后是否加载了OpenAI SDK"""
+    code = ("import sys, time; sys.path.insert(0, %r); t = time.perf_counter(); import app; "
+            "print(round((time.perf_counter() - t) * 1000, 2), 'openai' in sys.modules)" % REPO_DIR)
+    samples, openai_loaded = [], None
+    for _ in range(trials):
+        out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, cwd=REPO_DIR, check=True)
+        ms, loaded = out.stdout.split()[-2:]
+        samples.append(float(ms))
+        openai_loaded = loaded == "True"
+    return statistics.median(samples), openai_loaded
+
+
+def run_trial(workdir, mock_url, warm):
+    """启动一个app进程，测量启动到可服务/预热完成以及前两次请求的耗时"""
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    config = json.load(open(os.path.join(REPO_DIR, "config.example.json"), encoding='utf-8'))
+    config["api_config"].update({"api_key": "bench", "base_url": mock_url})
+    config["modules"].setdefault("grid_planner", {"prompt_template": "", "json_mode": True})
+    config["logging"] = dict(config.get("logging", {}), level="WARNING")
+    config["idea_cache"] = dict(config.get("idea_cache", {}), enabled=False)
+    with open(os.path.join(workdir, "config.json"), "w", encoding='utf-8') as f:
+        json.dump(config, f, ensure_ascii=False)
+
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "-c", SERVER_CODE.format(repo=REPO_DIR, warm=warm, port=port)],
+                               cwd=workdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for(lambda: http("GET", base + "/api/startup", timeout=2))
+        result = {"serving_ms": round((time.perf_counter() - started) * 1000, 1)}
+        if warm:
+            report, _ = wait_for(lambda: (lambda r: r if r["ready"] else None)(http("GET", base + "/api/startup")))
+            result["ready_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            result["phases"] = {phase["name"]: phase["duration_ms"] for phase in report["phases"]}
+        for key in ("first_request_ms", "second_request_ms"):
+            request_started = time.perf_counter()
+            http("POST", base + "/api/generate-level", LEVEL_REQUEST)
+            result[key] = round((time.perf_counter() - request_started) * 1000, 1)
+        return result
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+def summarize(trials):
+    keys = [key for key in trials[0] if key != "phases"]
+    summary = {key: round(statistics.median(t[key] for t in trials), 1) for key in keys}
+    if "phases" in trials[0]:
+        summary["phases"] = {name: round(statistics.median(t["phases"].get(name, 0) for t in trials), 1)
+                             for name in trials[0]["phases"]}
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="冷启动基准测试")
+    parser.add_argument("--trials", type=int, default=3, help="每种模式的试验次数（取中位数）")
+    parser.add_argument("--json", help="把结果写入JSON文件")
+    args = parser.parse_args(argv)
+
+    mock_port = free_port()
+    mock = subprocess.Popen([sys.executable, os.path.join(REPO_DIR, "mock_llm_server.py"), "--port", str(mock_port)],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    mock_url = f"http://127.0.0.1:{mock_port}/v1"
+    results = {}
+    try:
+        wait_for(lambda: http("GET", mock_url + "/models", timeout=2))
+        import_ms, openai_loaded = measure_import(args.trials)
+        results["import"] = {"import_ms": import_ms, "openai_loaded_on_import": openai_loaded}
+        for mode in ("cold", "warm"):
+            trials = []
+            for _ in range(args.trials):
+                workdir = tempfile.mkdtemp(prefix="bench_startup_")
+                try:
+                    trials.append(run_trial(workdir, mock_url, warm=(mode == "warm")))
+                finally:
+                    shutil.rmtree(workdir, ignore_errors=True)
+            results[mode] = summarize(trials)
+    finally:
+        mock.terminate()
+        mock.wait(timeout=10)
+
+    print(f"import app: {results['import']['import_ms']} ms "
+          f"(导入时加载OpenAI SDK: {'是' if results['import']['openai_loaded_on_import'] else '否'})")
+    print(f"{'模式':<6}{'可服务(ms)':>12}{'预热完成(ms)':>14}{'第一次请求(ms)':>16}{'第二次请求(ms)':>16}")
+    for mode in ("cold", "warm"):
+        r = results[mode]
+        print(f"{mode:<6}{r['serving_ms']:>12}{r.get('ready_ms', '-'):>14}"
+              f"{r['first_request_ms']:>16}{r['second_request_ms']:>16}")
+    if "phases" in results["warm"]:
+        print("预热各阶段(ms): " + ", ".join(f"{k}={v}" for k, v in results["warm"]["phases"].items()))
+    if args.json:
+        with open(args.json, "w", encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    return results
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+pytest共享fixture
+"""
+
+import pytest
+
+import app
+from usage_stats import UsageStats
+
+# app中按需创建的单例（产物存储、相似想法索引、布局库、用量统计、实验统计、cassette）
+APP_SINGLETONS = ("_artifact_store", "_idea_index", "_layout_library", "_usage_stats", "_experiment_stats",
+                  "_cassette")
+
+
+class AppEnv:
+    """app_env的返回值：替换LLM调用和配置读写的快捷方法，替换的内容在测试结束后由monkeypatch还原"""
+
+    def __init__(self, monkeypatch, root):
+        self.monkeypatch = monkeypatch
+        self.root = root
+
+    def fake_llm(self, fake_call):
+        """替换模块调用 fake_call(module_name, prompt, config, system_prompt=None, n=1)"""
+        self.monkeypatch.setattr(app, "call_gpt_module", fake_call)
+
+    def fake_client(self, client):
+        """替换OpenAI客户端（仍经过call_gpt_module的参数组装、用量统计和cassette）"""
+        self.monkeypatch.setattr(app, "get_client", lambda api_config: client)
+
+    def use_config(self, config):
+        """load_config返回内存中的config，save_config不写文件；返回save_config收到的配置列表"""
+        saved = []
+        self.monkeypatch.setattr(app, "load_config", lambda: config)
+        self.monkeypatch.setattr(app, "save_config", saved.append)
+        return saved
+
+    def reset_usage_stats(self):
+        """换一个空的（只保存在内存中的）用量统计"""
+        self.monkeypatch.setattr(app, "_usage_stats", UsageStats(None))
+
+    @property
+    def store(self):
+        """tmp_path下的产物存储"""
+        return app.get_artifact_store()
+
+
+@pytest.fixture
+def app_env(monkeypatch, tmp_path):
+    """
+    隔离的app：输出目录换成tmp_path，各单例清空后按需在tmp_path下重新创建（用量统计只保存在内存中），
+    测试结束后全部还原
+    """
+    monkeypatch.setattr(app, "OUTPUT_DIR", str(tmp_path))
+    monkeypatch.setattr(app, "CONFIG_FILE", app.CONFIG_FILE)
+    for name in APP_SINGLETONS:
+        monkeypatch.setattr(app, name, None)
+    monkeypatch.setattr(app, "_n_unsupported", set())
+    env = AppEnv(monkeypatch, str(tmp_path))
+    env.reset_usage_stats()
+    return env
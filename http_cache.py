@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+HTTP响应压缩（gzip/brotli）与条件GET（ETag / If-None-Match）
+"""
+
+import gzip
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # brotli为可选依赖，未安装时只使用gzip
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = {
+    "application/json",
+    "application/javascript",
+    "text/html",
+    "text/css",
+    "text/plain",
+    "text/javascript",
+    "text/x-lua",
+}
+
+
+def _encoders(gzip_level, brotli_quality):
+    """可用的压缩方式，按优先级排列"""
+    encoders = []
+    if brotli is not None:
+        encoders.append(("br", lambda data: brotli.compress(data, quality=brotli_quality)))
+    encoders.append(("gzip", lambda data: gzip.compress(data, compresslevel=gzip_level, mtime=0)))
+    return encoders
+
+
+def init_http_cache(app, etag_endpoints=(), min_size=500, gzip_level=6, brotli_quality=5):
+    """
+    注册after_request钩子：
+    - etag_endpoints中的GET接口自动带上ETag，命中If-None-Match时返回304
+    - 可压缩的响应按Accept-Encoding使用brotli或gzip压缩（文件响应除外）
+    """
+    etag_endpoints = set(etag_endpoints)
+    encoders = _encoders(gzip_level, brotli_quality)
+    encoder_names = [name for name, _ in encoders]
+
+    @app.after_request
+    def _cache_and_compress(response):
+        if request.method not in ("GET", "HEAD", "POST") or response.status_code != 200:
+            return response
+
+        if request.method in ("GET", "HEAD") and request.endpoint in etag_endpoints:
+            if response.direct_passthrough:
+                # send_file已经处理过条件请求
+                pass
+            else:
+                if not response.get_etag()[0]:
+                    response.add_etag()
+                response.headers.setdefault("Cache-Control", "no-cache")
+                response.make_conditional(request)
+                if response.status_code == 304:
+                    return response
+
+        # send_file的文件响应（direct_passthrough）直接流式发送，压缩需要把整个文件读进内存
+        if response.is_streamed or response.direct_passthrough or "Content-Encoding" in response.headers:
+            return response
+        if response.mimetype not in COMPRESSIBLE_MIMETYPES:
+            return response
+
+        response.vary.add("Accept-Encoding")
+        encoding = request.accept_encodings.best_match(encoder_names)
+        if not encoding:
+            return response
+
+        data = response.get_data()
+        if len(data) < min_size:
+            return response
+
+        compress = dict(encoders)[encoding]
+        response.set_data(compress(data))
+        response.headers["Content-Encoding"] = encoding
+
+        # 压缩后的表示与原文语义等价，使用弱ETag（If-None-Match按弱比较，仍可命中304）
+        etag, is_weak = response.get_etag()
+        if etag and not is_weak:
+            response.set_etag(etag, weak=True)
+        return response
+
+    return _cache_and_compress
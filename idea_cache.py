@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+相似想法索引：基于字符n-gram + MinHash + LSH分桶，在本地查找与历史输入高度相似的想法，
+用于复用之前的流水线结果，不依赖任何外部服务
+"""
+
+import array
+import base64
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import defaultdict, namedtuple
+from operator import itemgetter
+
+INDEX_FILE = "idea_index.jsonl"
+
+# 签名算法版本，索引文件中版本不同的记录加载时按归一化文本重新计算签名
+SIGNATURE_VERSION = 2
+_NON_WORD_RE = re.compile(r'[\W_]+', re.UNICODE)
+
+IdeaMatch = namedtuple("IdeaMatch", ["run_id", "idea", "similarity", "pipeline", "config_version", "created_at"])
+
+
+def normalize_idea(text):
+    """统一全角半角、大小写，去掉空白和标点"""
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    return _NON_WORD_RE.sub("", text)
+
+
+def shingles(text, ngram=2):
+    """字符n-gram集合（文本短于n时整体作为一个元素）"""
+    if len(text) <= ngram:
+        return {text} if text else set()
+    return {text[i:i + ngram] for i in range(len(text) - ngram + 1)}
+
+
+def jaccard(a, b):
+    """Jaccard相似度"""
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def signature_similarity(a, b):
+    """两个MinHash签名相同位置取值相同的比例（Jaccard相似度的估计值）"""
+    return sum(1 for x, y in zip(a, b) if x == y) / len(a)
+
+
+class IdeaIndex:
+    """
+    相似想法索引
+    - 持久化为追加写入的JSONL文件，每条记录保存MinHash签名，启动时无需重新计算；
+      运行被回收后删除对应的记录并重写文件（remove_runs）
+    - 查询先走精确匹配，再通过LSH分桶找候选：每个分桶只看最近的bucket_scan条，命中按分桶大小加权后取前max_candidates个，
+      用签名估计相似度过滤后，再用n-gram集合计算精确的Jaccard相似度（在锁外计算）
+    - estimate_margin: 签名估计值比阈值低多少以内的候选才计算精确相似度（64个排列时估计值的标准差不超过0.0625）
+    """
+
+    def __init__(self, root="output", num_perm=64, bands=16, ngram=2, seed=1, max_candidates=32, bucket_scan=64,
+                 estimate_margin=0.2):
+        if num_perm % bands:
+            raise ValueError("num_perm必须能被bands整除")
+        self.path = os.path.join(root, INDEX_FILE) if root else None
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.ngram = ngram
+        self.max_candidates = max_candidates
+        self.bucket_scan = bucket_scan
+        self.estimate_margin = estimate_margin
+        self._salt = seed.to_bytes(8, 'little')
+        self._lock = threading.Lock()
+        self._entries = []
+        self._exact = {}
+        self._buckets = [dict() for _ in range(bands)]
+        if self.path and os.path.exists(self.path):
+            self._load()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def signature(self, shingle_set):
+        """
+        计算MinHash签名：每个n-gram做一次shake_128，输出切成num_perm个32位哈希值（相当于num_perm个独立的哈希函数，
+        不受PYTHONHASHSEED影响），签名的每一位取所有n-gram在该位置上的最小值
+        """
+        size = self.num_perm * 4
+        rows = [array.array('I', hashlib.shake_128(self._salt + s.encode('utf-8')).digest(size))
+                for s in shingle_set or ("",)]
+        return list(map(min, zip(*rows)))
+
+    def _band_keys(self, signature):
+        rows = self.rows
+        return [tuple(signature[i * rows:(i + 1) * rows]) for i in range(self.bands)]
+
+    def _insert(self, entry, signature):
+        entry_id = len(self._entries)
+        entry["signature"] = array.array('I', signature)
+        self._entries.append(entry)
+        self._exact.setdefault(entry["normalized"], []).append(entry_id)
+        for band, key in enumerate(self._band_keys(signature)):
+            self._buckets[band].setdefault(key, []).append(entry_id)
+
+    @staticmethod
+    def _record(entry):
+        """写入JSONL文件的一行（不含内存中的n-gram集合）"""
+        record = {key: value for key, value in entry.items() if key not in ("shingles", "signature")}
+        record["sig"] = base64.b64encode(entry["signature"].tobytes()).decode('ascii')
+        record["v"] = SIGNATURE_VERSION
+        return json.dumps(record, ensure_ascii=False) + "\n"
+
+    def _load(self):
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                    signature = array.array('I', base64.b64decode(record.pop("sig"))).tolist()
+                except Exception:
+                    # 写入中断留下的半行，跳过
+                    continue
+                if record.pop("v", 1) != SIGNATURE_VERSION or len(signature) != self.num_perm:
+                    signature = self.signature(shingles(record["normalized"], self.ngram))
+                record["shingles"] = None
+                self._insert(record, signature)
+
+    def add(self, idea, run_id, pipeline="script", config_version=None):
+        """登记一条想法及其运行ID"""
+        normalized = normalize_idea(idea)
+        if not normalized:
+            return
+        shingle_set = shingles(normalized, self.ngram)
+        signature = self.signature(shingle_set)
+        entry = {
+            "idea": idea,
+            "normalized": normalized,
+            "run_id": run_id,
+            "pipeline": pipeline,
+            "config_version": config_version,
+            "created_at": time.time(),
+        }
+        entry["signature"] = array.array('I', signature)
+        with self._lock:
+            if self.path:
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(self._record(entry))
+            entry["shingles"] = frozenset(shingle_set)
+            self._insert(entry, signature)
+
+    def remove_runs(self, run_ids):
+        """
+        删除这些运行登记的想法（运行被回收后调用），重建分桶并重写索引文件
+        返回删除的条数
+        """
+        run_ids = set(run_ids)
+        if not run_ids:
+            return 0
+        with self._lock:
+            kept = [entry for entry in self._entries if entry["run_id"] not in run_ids]
+            removed = len(self._entries) - len(kept)
+            if not removed:
+                return 0
+            self._entries = []
+            self._exact = {}
+            self._buckets = [dict() for _ in range(self.bands)]
+            for entry in kept:
+                self._insert(entry, entry["signature"].tolist())
+            if self.path:
+                temp_path = self.path + ".tmp"
+                with open(temp_path, 'w', encoding='utf-8') as f:
+                    f.writelines(self._record(entry) for entry in kept)
+                os.replace(temp_path, self.path)
+        return removed
+
+    def _entry_shingles(self, entry):
+        if entry.get("shingles") is None:
+            entry["shingles"] = frozenset(shingles(entry["normalized"], self.ngram))
+        return entry["shingles"]
+
+    def lookup(self, idea, threshold=0.85, pipeline="script", config_version=None, exclude=None):
+        """
+        查找最相似的历史想法，相似度低于threshold时返回None
+        config_version不为None时只匹配相同配置版本下生成的结果
+        exclude: 需要跳过的run_id集合（如已被回收的运行）
+        """
+        normalized = normalize_idea(idea)
+        if not normalized:
+            return None
+
+        def acceptable(entry):
+            if entry["pipeline"] != pipeline:
+                return False
+            if config_version is not None and entry.get("config_version") != config_version:
+                return False
+            return not exclude or entry["run_id"] not in exclude
+
+        # 签名和相似度计算都在锁外，锁内只取候选（不阻塞并发的查询和登记）
+        query_shingles = shingles(normalized, self.ngram)
+        query_signature = self.signature(query_shingles)
+
+        with self._lock:
+            # 完全相同（归一化后）的想法直接命中，取最新的一条
+            for entry_id in reversed(self._exact.get(normalized, [])):
+                entry = self._entries[entry_id]
+                if acceptable(entry):
+                    return self._match(entry, 1.0)
+
+            # 近似重复的想法很多时分桶会很大，每个分桶只看最近登记的bucket_scan条；
+            # 共同所在的分桶越小越能说明相似，命中按 1/分桶大小 计分，得分相同时取较新的
+            hits = defaultdict(float)
+            for band, key in enumerate(self._band_keys(query_signature)):
+                bucket = self._buckets[band].get(key)
+                if bucket:
+                    weight = 1.0 / len(bucket)
+                    for entry_id in bucket[-self.bucket_scan:]:
+                        hits[entry_id] += weight
+            candidates = []
+            for entry_id, _ in sorted(hits.items(), key=itemgetter(1, 0), reverse=True):
+                entry = self._entries[entry_id]
+                if acceptable(entry):
+                    candidates.append(entry)
+                    if len(candidates) >= self.max_candidates:
+                        break
+
+        best, best_key = None, None
+        floor = threshold - self.estimate_margin
+        for entry in candidates:
+            if signature_similarity(query_signature, entry["signature"]) < floor:
+                continue
+            score = jaccard(query_shingles, self._entry_shingles(entry))
+            # 相似度相同时取较新的结果
+            key = (score, entry["created_at"])
+            if score >= threshold and (best_key is None or key > best_key):
+                best, best_key = entry, key
+        return self._match(best, best_key[0]) if best else None
+
+    @staticmethod
+    def _match(entry, similarity):
+        return IdeaMatch(entry["run_id"], entry["idea"], round(similarity, 4), entry["pipeline"],
+                         entry.get("config_version"), entry["created_at"])
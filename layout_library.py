@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+预验证布局库（SQLite）：保存通过LayoutGuard验证的布局，按(宽, 高, 实体数量, 难度, 主题标签)索引
+常见的关卡需求可以直接从库中取布局，配合旋转/镜像变换增加多样性，不需要调用Grid Planner
+"""
+
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+
+LIBRARY_FILE = "layout_library.sqlite3"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS layouts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    width INTEGER NOT NULL,
+    height INTEGER NOT NULL,
+    enemy INTEGER NOT NULL,
+    npc INTEGER NOT NULL,
+    chest INTEGER NOT NULL,
+    door INTEGER NOT NULL,
+    difficulty TEXT NOT NULL,
+    theme TEXT NOT NULL,
+    sha256 TEXT NOT NULL UNIQUE,
+    layout TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_layouts_key ON layouts (width, height, enemy, npc, chest, door, difficulty, theme);
+"""
+
+# 主题关键字 -> 主题标签（按顺序匹配，未匹配的归为default）
+THEME_TAGS = [
+    ("graveyard", ("墓", "grave", "cemetery", "tomb")),
+    ("dungeon", ("地牢", "dungeon", "地下室", "cellar", "basement")),
+    ("castle", ("城堡", "castle", "palace", "宫殿")),
+    ("forest", ("森林", "树林", "forest", "wood")),
+    ("factory", ("工厂", "factory", "industrial")),
+    ("cave", ("洞", "cave", "cavern")),
+    ("village", ("村", "village", "town", "镇")),
+]
+
+# 变换: 名称 -> (新坐标函数(x, y, w, h), 是否交换宽高)
+TRANSFORMS = {
+    "identity": (lambda x, y, w, h: (x, y), False),
+    "mirror_x": (lambda x, y, w, h: (w - 1 - x, y), False),
+    "mirror_y": (lambda x, y, w, h: (x, h - 1 - y), False),
+    "rot180": (lambda x, y, w, h: (w - 1 - x, h - 1 - y), False),
+    "rot90": (lambda x, y, w, h: (h - 1 - y, x), True),
+    "rot270": (lambda x, y, w, h: (y, w - 1 - x), True),
+    "transpose": (lambda x, y, w, h: (y, x), True),
+    "anti_transpose": (lambda x, y, w, h: (h - 1 - y, w - 1 - x), True),
+}
+
+ENTITY_LISTS = ("doors", "chests", "enemies", "npcs")
+
+
+def theme_tag(theme):
+    """把自由文本的主题归一化为主题标签"""
+    text = (theme or "").lower()
+    for tag, keywords in THEME_TAGS:
+        if any(keyword in text for keyword in keywords):
+            return tag
+    return "default"
+
+
+def layout_key(intent_data):
+    """从intent中提取布局库的索引键"""
+    grid = intent_data.get("grid", {})
+    counts = intent_data.get("counts", {})
+    return {
+        "width": int(grid.get("width", 20)),
+        "height": int(grid.get("height", 12)),
+        "enemy": int(counts.get("enemy", 0)),
+        "npc": int(counts.get("npc", 0)),
+        "chest": int(counts.get("chest", 0)),
+        "door": int(counts.get("door", 0)),
+        "difficulty": str(intent_data.get("constraints", {}).get("difficulty", "medium")),
+        "theme": theme_tag(intent_data.get("theme")),
+    }
+
+
+def transform_layout(layout, name):
+    """对布局做旋转/镜像变换，网格和实体坐标同步变换"""
+    mapper, swap = TRANSFORMS[name]
+    grid = layout["grid_ascii"]
+    height = len(grid)
+    width = len(grid[0]) if height else 0
+    new_width, new_height = (height, width) if swap else (width, height)
+
+    cells = [[' '] * new_width for _ in range(new_height)]
+    for y, row in enumerate(grid):
+        for x, char in enumerate(row):
+            nx, ny = mapper(x, y, width, height)
+            cells[ny][nx] = char
+
+    def move(entity):
+        moved = dict(entity)
+        moved["x"], moved["y"] = mapper(entity.get("x", 0), entity.get("y", 0), width, height)
+        return moved
+
+    entities = dict(layout.get("entities", {}))
+    if entities.get("player_start"):
+        entities["player_start"] = move(entities["player_start"])
+    for key in ENTITY_LISTS:
+        if key in entities:
+            entities[key] = [move(entity) for entity in entities[key]]
+
+    result = dict(layout)
+    result["grid_meta"] = dict(layout.get("grid_meta", {}), width=new_width, height=new_height)
+    result["grid_ascii"] = [''.join(row) for row in cells]
+    result["entities"] = entities
+    return result
+
+
+def _layout_hash(layout):
+    body = json.dumps({"grid_ascii": layout.get("grid_ascii"), "entities": layout.get("entities")},
+                      ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(body.encode('utf-8')).hexdigest()
+
+
+class LayoutLibrary:
+    """预验证布局库，每个线程持有独立的SQLite连接"""
+
+    def __init__(self, root="output", max_per_key=50):
+        os.makedirs(root, exist_ok=True)
+        self.path = os.path.join(root, LIBRARY_FILE)
+        self.max_per_key = max_per_key
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def add(self, intent_data, layout):
+        """
+        登记一个已通过验证的布局，返回布局ID
+        相同布局只存一份；同一个索引键下超过max_per_key时不再收录
+        """
+        key = layout_key(intent_data)
+        grid = layout.get("grid_ascii", [])
+        if len(grid) != key["height"] or any(len(row) != key["width"] for row in grid):
+            return None
+        digest = _layout_hash(layout)
+        conn = self._connect()
+        with conn:
+            row = conn.execute("SELECT id FROM layouts WHERE sha256 = ?", (digest,)).fetchone()
+            if row:
+                return row["id"]
+            where, params = self._key_filter(key)
+            count = conn.execute(f"SELECT COUNT(*) FROM layouts WHERE {where}", params).fetchone()[0]
+            if count >= self.max_per_key:
+                return None
+            cursor = conn.execute(
+                "INSERT INTO layouts (width, height, enemy, npc, chest, door, difficulty, theme, sha256, layout, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key["width"], key["height"], key["enemy"], key["npc"], key["chest"], key["door"],
+                 key["difficulty"], key["theme"], digest, json.dumps(layout, ensure_ascii=False), time.time())
+            )
+            return cursor.lastrowid
+
+    @staticmethod
+    def _key_filter(key, swapped=False):
+        width, height = (key["height"], key["width"]) if swapped else (key["width"], key["height"])
+        where = ("width = ? AND height = ? AND enemy = ? AND npc = ? AND chest = ? AND door = ? "
+                 "AND difficulty = ? AND theme = ?")
+        return where, (width, height, key["enemy"], key["npc"], key["chest"], key["door"],
+                       key["difficulty"], key["theme"])
+
+    def candidates(self, intent_data, transforms=True):
+        """
+        列出能满足intent的(布局ID, 变换名)
+        同尺寸的布局可以做镜像/180度旋转（正方形时8种变换都可用），宽高互换的布局可以做90度旋转/转置
+        """
+        key = layout_key(intent_data)
+        conn = self._connect()
+        result = []
+        for swapped in ((False, True) if transforms and key["width"] != key["height"] else (False,)):
+            where, params = self._key_filter(key, swapped)
+            for row in conn.execute(f"SELECT id FROM layouts WHERE {where}", params):
+                for name, (_, swap) in TRANSFORMS.items():
+                    if not transforms and name != "identity":
+                        continue
+                    square = key["width"] == key["height"]
+                    if square or swap == swapped:
+                        result.append((row["id"], name))
+        return result
+
+    def get(self, layout_id):
+        """按ID读取布局"""
+        row = self._connect().execute("SELECT layout FROM layouts WHERE id = ?", (layout_id,)).fetchone()
+        return json.loads(row["layout"]) if row else None
+
+    def sample(self, intent_data, transforms=True, rng=None):
+        """
+        随机取一个满足intent的布局（已应用变换），没有时返回None
+        返回: (布局, 布局ID, 变换名)
+        """
+        options = self.candidates(intent_data, transforms)
+        if not options:
+            return None
+        layout_id, name = (rng or random).choice(options)
+        layout = transform_layout(self.get(layout_id), name)
+        with self._connect() as conn:
+            conn.execute("UPDATE layouts SET hits = hits + 1 WHERE id = ?", (layout_id,))
+        return layout, layout_id, name
+
+    def remove(self, layout_id):
+        """删除一个布局（例如变换后验证失败的布局）"""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM layouts WHERE id = ?", (layout_id,))
+
+    def stats(self):
+        """按索引键汇总库中的布局数量和命中次数"""
+        rows = self._connect().execute(
+            "SELECT width, height, enemy, npc, chest, door, difficulty, theme, "
+            "COUNT(*) AS layouts, SUM(hits) AS hits FROM layouts "
+            "GROUP BY width, height, enemy, npc, chest, door, difficulty, theme "
+            "ORDER BY hits DESC, layouts DESC"
+        ).fetchall()
+        return [dict(row) for row in rows]
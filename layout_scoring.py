@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+布局质量评分：在通过LayoutGuard验证的布局中挑出更好的关卡
+基于一次可达性分析（起点距离场 + 主路径 + 到主路径的距离场）计算各项指标，再按权重合成0~100分:
+- 主路径长度: 起点到最近的门的步数，门紧挨着起点时得分低
+- 死胡同数量: 只有一个可行走邻居的格子，超出宝箱支路所需的数量越多得分越低
+- 宝箱支路距离: 宝箱离主路径越远（最多3格）得分越高，在主路径上得0分
+- 敌人贴近主路径: 敌人离主路径2格以内得满分，越远得分越低
+- 开阔度: 可行走格子占内部面积的比例，越接近0.55得分越高
+"""
+
+from level_nav import distance_field, grid_size, walkable_mask
+
+DEFAULT_WEIGHTS = {
+    "main_path": 0.3,
+    "dead_ends": 0.15,
+    "chest_side_path": 0.2,
+    "enemy_proximity": 0.2,
+    "open_area": 0.15,
+}
+
+TARGET_OPEN_RATIO = 0.55
+
+
+def _mean(values):
+    return sum(values) / len(values) if values else None
+
+
+def analyze_layout(layout):
+    """计算布局的各项指标（只依赖网格和实体坐标）"""
+    grid = layout["grid_ascii"]
+    width, height = grid_size(grid)
+    size = width * height
+    mask = walkable_mask(grid)
+    entities = layout.get("entities") or {}
+
+    start = entities.get("player_start") or {}
+    start_field = distance_field(grid, [(start.get("x", -1), start.get("y", -1))], mask)
+
+    def cell(entity):
+        x, y = entity.get("x", -1), entity.get("y", -1)
+        return y * width + x if 0 <= x < width and 0 <= y < height else None
+
+    # 主路径: 从最近的可达门沿距离场下降回到起点
+    door_cells = [c for c in (cell(door) for door in entities.get("doors") or []) if c is not None]
+    reachable_doors = [c for c in door_cells if start_field[c] >= 0]
+    path = []
+    if reachable_doors:
+        current = min(reachable_doors, key=lambda c: (start_field[c], c))
+        path.append(current)
+        while start_field[current] > 0:
+            x = current % width
+            for neighbour, ok in ((current - 1, x > 0), (current + 1, x < width - 1),
+                                  (current - width, current >= width), (current + width, current + width < size)):
+                if ok and start_field[neighbour] == start_field[current] - 1:
+                    current = neighbour
+                    break
+            path.append(current)
+    path_field = distance_field(grid, [(c % width, c // width) for c in path], mask) if path else None
+
+    def path_distances(key):
+        cells = [cell(entity) for entity in entities.get(key) or []]
+        return [path_field[c] if path_field is not None and c is not None else -1 for c in cells]
+
+    dead_ends = 0
+    for i in range(size):
+        if not mask[i]:
+            continue
+        x = i % width
+        neighbours = ((x > 0 and mask[i - 1]) + (x < width - 1 and mask[i + 1]) +
+                      (i >= width and mask[i - width]) + (i + width < size and mask[i + width]))
+        if neighbours == 1:
+            dead_ends += 1
+
+    walkable = sum(mask)
+    interior = (width - 2) * (height - 2) if width > 2 and height > 2 else size
+    return {
+        "main_path_length": start_field[path[0]] if path else None,
+        "doors": len(door_cells),
+        "unreachable_doors": len(door_cells) - len(reachable_doors),
+        "dead_ends": dead_ends,
+        "chest_path_distances": path_distances("chests"),
+        "enemy_path_distances": path_distances("enemies"),
+        "open_area_ratio": round(walkable / interior, 4) if interior else 0.0,
+        "reachable_ratio": round(sum(1 for d in start_field if d >= 0) / walkable, 4) if walkable else 0.0,
+        "width": width,
+        "height": height,
+    }
+
+
+def score_components(metrics):
+    """各项指标换算为0~1的分量，不适用的指标（例如没有宝箱）为None"""
+    span = max(1, (metrics["width"] - 3) + (metrics["height"] - 3))
+    components = {}
+    if metrics["doors"]:
+        path = metrics["main_path_length"]
+        components["main_path"] = min(1.0, path / (0.8 * span)) if path is not None else 0.0
+    else:
+        components["main_path"] = None
+
+    chests = metrics["chest_path_distances"]
+    allowed_dead_ends = 1 + len(chests)
+    components["dead_ends"] = 1.0 / (1 + max(0, metrics["dead_ends"] - allowed_dead_ends))
+    components["chest_side_path"] = _mean([min(1.0, d / 3) if d >= 0 else 0.0 for d in chests])
+    components["enemy_proximity"] = _mean([
+        0.0 if d < 0 else 1.0 if d <= 2 else max(0.0, 1 - (d - 2) / 4)
+        for d in metrics["enemy_path_distances"]
+    ])
+    components["open_area"] = max(0.0, 1 - abs(metrics["open_area_ratio"] - TARGET_OPEN_RATIO) / TARGET_OPEN_RATIO)
+    return components
+
+
+def score_layout(layout, weights=None):
+    """
+    给布局打分
+    返回: {"score": 0~100, "metrics": 指标, "components": 各分量}
+    """
+    weights = dict(DEFAULT_WEIGHTS, **(weights or {}))
+    metrics = analyze_layout(layout)
+    components = score_components(metrics)
+    applicable = {name: value for name, value in components.items() if value is not None and weights.get(name)}
+    total_weight = sum(weights[name] for name in applicable)
+    score = sum(weights[name] * value for name, value in applicable.items()) / total_weight if total_weight else 0.0
+    return {
+        "score": round(100 * score, 1),
+        "metrics": metrics,
+        "components": {name: round(value, 3) if value is not None else None for name, value in components.items()},
+    }
+
+
+def rank_layouts(layouts, weights=None):
+    """
+    给多个候选布局打分并按分数从高到低排序（同分时保持原顺序）
+    返回: [{"index": 原下标, "score", "metrics", "components", "layout"}]
+    """
+    ranked = []
+    for index, layout in enumerate(layouts):
+        result = score_layout(layout, weights)
+        result["index"] = index
+        result["layout"] = layout
+        ranked.append(result)
+    ranked.sort(key=lambda r: (-r["score"], r["index"]))
+    return ranked
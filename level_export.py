@@ -0,0 +1,286 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+关卡紧凑导出格式：网格按字节打包（逐格或游程编码），附带实体表，整体base64后嵌入一个小的Lua加载器
+加载器在引擎中解码数据，按与 ascii_to_lua 相同的顺序调用 Env.AllocBlock / Env.PlaceItem / Env.SpawnNPC，
+大地图不再需要解析成千上万行的Lua调用
+
+二进制格式（大端序），版本2:
+    magic "LVPK" | version u8 | flags u8 | block_count u16
+    每个block: x u16 | y u16 | width u16 | height u16 | encoding u8 (0=逐格, 1=游程) | length u32 | payload
+        游程编码的payload为若干 (count u8, char u8)，按行优先顺序覆盖整个block
+    实体表: type_count u8 | 每个类型: length u8 + UTF-8 | entity_count u16
+        每个实体: symbol u8 | block u16 | x u16 | y u16 | type_index u8 (0xFF表示无类型)，坐标为block内坐标
+版本1的实体block序号为u8（最多256个block），unpack_level仍可读取
+"""
+
+import base64
+import struct
+
+MAGIC = b"LVPK"
+FORMAT_VERSION = 2
+ENCODING_RAW = 0
+ENCODING_RLE = 1
+NO_TYPE = 0xFF
+
+# 实体列表 -> 网格符号
+ENTITY_SYMBOLS = {"player_start": 'S', "doors": 'D', "chests": 'C', "enemies": 'E', "npcs": 'N'}
+
+# 每种格子对应的引擎调用，与 ascii_to_lua 保持一致（'.'和'S'不生成调用）
+CELL_CALLS = {
+    '#': ("PlaceItem", "Wall_Stone", None),
+    'D': ("PlaceItem", "Wall_Stone", None),
+    'C': ("PlaceItem", "Grave_Stone", None),
+    'E': ("SpawnNPC", "Skeleton_Warrior", "Enemy"),
+    'N': ("SpawnNPC", "Ghost_Nun", "Neutral"),
+}
+
+
+def encode_rle(cells):
+    """游程编码：(count, char)，单个游程最多255格"""
+    out = bytearray()
+    i = 0
+    while i < len(cells):
+        char = cells[i]
+        run = 1
+        while i + run < len(cells) and cells[i + run] == char and run < 255:
+            run += 1
+        out += bytes((run, char))
+        i += run
+    return bytes(out)
+
+
+def decode_rle(payload):
+    out = bytearray()
+    for i in range(0, len(payload), 2):
+        out += bytes((payload[i + 1],)) * payload[i]
+    return bytes(out)
+
+
+def layout_blocks(layout):
+    """单block关卡（整张地图一个AllocBlock，与 ascii_to_lua 对应）"""
+    grid = layout["grid_ascii"]
+    return [{"x": 0, "y": 0, "width": len(grid[0]) if grid else 0, "height": len(grid),
+             "grid_ascii": grid, "entities": layout.get("entities") or {}}]
+
+
+def world_blocks(tiles, tile_layouts):
+    """大地图分块关卡（每个区块一个AllocBlock，与 world_to_lua 对应）"""
+    return [{"x": tile["x"], "y": tile["y"], "width": tile["width"], "height": tile["height"],
+             "grid_ascii": layout["grid_ascii"], "entities": layout.get("entities") or {}}
+            for tile, layout in zip(tiles, tile_layouts)]
+
+
+def _entity_rows(blocks):
+    """把各block的实体列表展开为 (symbol, block, x, y, type)"""
+    rows = []
+    for index, block in enumerate(blocks):
+        for key, symbol in ENTITY_SYMBOLS.items():
+            entities = block["entities"].get(key)
+            if key == "player_start":
+                entities = [entities] if entities else []
+            for entity in entities or []:
+                rows.append((symbol, index, int(entity.get("x", 0)), int(entity.get("y", 0)), entity.get("type")))
+    return rows
+
+
+def pack_level(blocks):
+    """
+    把blocks打包为二进制数据
+    blocks: [{"x", "y", "width", "height", "grid_ascii", "entities"}]，每个block取逐格和游程编码中较小的一种
+    """
+    if len(blocks) > 0xFFFF:
+        raise ValueError("block数量超出格式上限")
+    out = bytearray(MAGIC)
+    out += struct.pack(">BBH", FORMAT_VERSION, 0, len(blocks))
+    for block in blocks:
+        cells = "".join(block["grid_ascii"]).encode('ascii')
+        if len(cells) != block["width"] * block["height"]:
+            raise ValueError(f"block尺寸与网格不一致: {block['width']}x{block['height']}")
+        rle = encode_rle(cells)
+        encoding, payload = (ENCODING_RLE, rle) if len(rle) < len(cells) else (ENCODING_RAW, cells)
+        out += struct.pack(">HHHHBI", block["x"], block["y"], block["width"], block["height"], encoding, len(payload))
+        out += payload
+
+    entities = _entity_rows(blocks)
+    types = sorted({row[4] for row in entities if row[4]})
+    if len(types) >= NO_TYPE or len(entities) > 0xFFFF:
+        raise ValueError("实体表超出格式上限")
+    out += struct.pack(">B", len(types))
+    for name in types:
+        encoded = name.encode('utf-8')[:255]
+        out += struct.pack(">B", len(encoded)) + encoded
+    out += struct.pack(">H", len(entities))
+    for symbol, index, x, y, type_name in entities:
+        type_index = types.index(type_name) if type_name else NO_TYPE
+        try:
+            out += struct.pack(">BHHHB", ord(symbol), index, x, y, type_index)
+        except struct.error:
+            raise ValueError(f"实体坐标超出格式范围: ({x},{y})")
+    return bytes(out)
+
+
+def unpack_level(data):
+    """
+    解析二进制数据
+    返回: {"version", "blocks": [{"x", "y", "width", "height", "grid_ascii"}], "entities": [{"symbol", "block", "x", "y", "type"}]}
+    """
+    if data[:4] != MAGIC:
+        raise ValueError("不是关卡导出数据")
+    version, _, block_count = struct.unpack_from(">BBH", data, 4)
+    if version > FORMAT_VERSION:
+        raise ValueError(f"不支持的导出格式版本: {version}")
+    pos = 8
+    blocks = []
+    for _ in range(block_count):
+        x, y, width, height, encoding, length = struct.unpack_from(">HHHHBI", data, pos)
+        pos += 13
+        payload = data[pos:pos + length]
+        pos += length
+        cells = decode_rle(payload) if encoding == ENCODING_RLE else payload
+        text = cells.decode('ascii')
+        blocks.append({"x": x, "y": y, "width": width, "height": height,
+                       "grid_ascii": [text[row * width:(row + 1) * width] for row in range(height)]})
+
+    type_count = data[pos]
+    pos += 1
+    types = []
+    for _ in range(type_count):
+        length = data[pos]
+        types.append(data[pos + 1:pos + 1 + length].decode('utf-8'))
+        pos += 1 + length
+    entity_count, = struct.unpack_from(">H", data, pos)
+    pos += 2
+    entities = []
+    entity_format = ">BBHHB" if version == 1 else ">BHHHB"
+    for _ in range(entity_count):
+        symbol, index, x, y, type_index = struct.unpack_from(entity_format, data, pos)
+        pos += struct.calcsize(entity_format)
+        entities.append({"symbol": chr(symbol), "block": index, "x": x, "y": y,
+                         "type": types[type_index] if type_index != NO_TYPE else None})
+    return {"version": version, "blocks": blocks, "entities": entities}
+
+
+def replay_calls(level):
+    """
+    按加载器的执行顺序列出引擎调用（用于和 ascii_to_lua 的输出对比）
+    每个调用: ("AllocBlock", block, w, h, x, y) / ("PlaceItem", block, asset, x, y) / ("SpawnNPC", block, type, x, y, role)
+    """
+    calls = []
+    for index, block in enumerate(level["blocks"]):
+        calls.append(("AllocBlock", index, block["width"], block["height"], block["x"], block["y"]))
+        for y, row in enumerate(block["grid_ascii"]):
+            for x, char in enumerate(row):
+                if char in CELL_CALLS:
+                    func, asset, role = CELL_CALLS[char]
+                    calls.append((func, index, asset, x, y, role) if role else (func, index, asset, x, y))
+    return calls
+
+
+LOADER_TEMPLATE = """-- Packed level (format v{version}, {size} bytes, {cells} cells in {blocks} block(s))
+local DATA = "{data}"
+
+local B64 = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/"
+local decode = {{}}
+for i = 1, 64 do decode[B64:byte(i)] = i - 1 end
+
+local parts = {{}}
+for i = 1, #DATA, 4 do
+    local a, b, c, d = DATA:byte(i, i + 3)
+    local v = decode[a] * 262144 + decode[b] * 4096 + (decode[c] or 0) * 64 + (decode[d] or 0)
+    parts[#parts + 1] = string.char(math.floor(v / 65536) % 256)
+    if c ~= 61 then parts[#parts + 1] = string.char(math.floor(v / 256) % 256) end
+    if d ~= 61 then parts[#parts + 1] = string.char(v % 256) end
+end
+local data = table.concat(parts)
+
+local pos = 1
+local function u8()
+    local v = data:byte(pos)
+    pos = pos + 1
+    return v
+end
+local function u16()
+    local hi, lo = data:byte(pos, pos + 1)
+    pos = pos + 2
+    return hi * 256 + lo
+end
+local function u32()
+    local hi = u16()
+    return hi * 65536 + u16()
+end
+
+assert(data:sub(1, 4) == "LVPK", "invalid packed level")
+pos = 5
+local version = u8()
+assert(version <= {version}, "unsupported packed level version " .. version)
+u8()
+
+local CELLS = {{
+    [35] = function(block, x, y) Env.PlaceItem(block, "Wall_Stone", x, y) end,
+    [68] = function(block, x, y) Env.PlaceItem(block, "Wall_Stone", x, y) end,
+    [67] = function(block, x, y) Env.PlaceItem(block, "Grave_Stone", x, y) end,
+    [69] = function(block, x, y) Env.SpawnNPC(block, "Skeleton_Warrior", x, y, "Enemy") end,
+    [78] = function(block, x, y) Env.SpawnNPC(block, "Ghost_Nun", x, y, "Neutral") end,
+}}
+
+local level = {{ version = version, blocks = {{}}, entities = {{}} }}
+local blockCount = u16()
+for b = 1, blockCount do
+    local bx = u16()
+    local by = u16()
+    local width = u16()
+    local height = u16()
+    local encoding = u8()
+    local length = u32()
+    local block = Env.AllocBlock(width, height, bx, by)
+    level.blocks[b] = {{ block = block, x = bx, y = by, width = width, height = height }}
+    local x, y = 0, 0
+    local function cell(char)
+        local place = CELLS[char]
+        if place then place(block, x, y) end
+        x = x + 1
+        if x == width then
+            x = 0
+            y = y + 1
+        end
+    end
+    local stop = pos + length
+    while pos < stop do
+        if encoding == 1 then
+            local count = u8()
+            local char = u8()
+            for _ = 1, count do cell(char) end
+        else
+            cell(u8())
+        end
+    end
+end
+
+local types = {{}}
+for t = 1, u8() do
+    local length = u8()
+    types[t] = data:sub(pos, pos + length - 1)
+    pos = pos + length
+end
+for e = 1, u16() do
+    local symbol = u8()
+    local block = u16() + 1
+    local ex = u16()
+    local ey = u16()
+    local typeIndex = u8()
+    level.entities[e] = {{ kind = string.char(symbol), block = block, x = ex, y = ey, type = types[typeIndex + 1] }}
+end
+
+return level"""
+
+
+def loader_lua(data, environment_lua=""):
+    """生成嵌入了base64数据的Lua加载器"""
+    level = unpack_level(data)
+    cells = sum(block["width"] * block["height"] for block in level["blocks"])
+    lua = LOADER_TEMPLATE.format(version=FORMAT_VERSION, size=len(data), cells=cells, blocks=len(level["blocks"]),
+                                 data=base64.b64encode(data).decode('ascii'))
+    if environment_lua:
+        lua = environment_lua + "\n\n" + lua
+    return lua
@@ -0,0 +1,276 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+关卡导航数据预计算：到玩家起点和每个门的距离场（BFS步数），以及由房间、走廊和岔路口组成的路点图
+导出为Lua表（LevelNav.lua），运行时敌人/NPC的寻路可以直接查表，不需要在引擎中搜索
+"""
+
+from collections import deque
+
+# 可行走字符（与 check_reachability 一致）
+WALKABLE = frozenset('. SCEND')
+UNREACHABLE = -1
+
+
+def grid_size(grid_ascii):
+    """网格宽高，行长度不一致时抛出ValueError"""
+    height = len(grid_ascii)
+    width = len(grid_ascii[0]) if height else 0
+    if any(len(row) != width for row in grid_ascii):
+        raise ValueError("网格每行长度必须一致")
+    return width, height
+
+
+def walkable_mask(grid_ascii):
+    """按行优先展开的可行走标记"""
+    return [char in WALKABLE for row in grid_ascii for char in row]
+
+
+def distance_field(grid_ascii, sources, mask=None):
+    """
+    多源BFS距离场，按行优先展开: field[y * width + x]，墙和不可达的格子为-1
+    sources: [(x, y)]，不可行走或越界的源点被忽略
+    """
+    width, height = grid_size(grid_ascii)
+    mask = mask if mask is not None else walkable_mask(grid_ascii)
+    field = [UNREACHABLE] * (width * height)
+    queue = deque()
+    for x, y in sources:
+        if 0 <= x < width and 0 <= y < height and mask[y * width + x] and field[y * width + x] < 0:
+            field[y * width + x] = 0
+            queue.append(y * width + x)
+    while queue:
+        index = queue.popleft()
+        next_distance = field[index] + 1
+        x = index % width
+        for neighbour, ok in ((index - 1, x > 0), (index + 1, x < width - 1),
+                              (index - width, index >= width), (index + width, index + width < width * height)):
+            if ok and mask[neighbour] and field[neighbour] < 0:
+                field[neighbour] = next_distance
+                queue.append(neighbour)
+    return field
+
+
+def _neighbours(index, width, size):
+    x = index % width
+    if x > 0:
+        yield index - 1
+    if x < width - 1:
+        yield index + 1
+    if index >= width:
+        yield index - width
+    if index + width < size:
+        yield index + width
+
+
+def _room_mask(mask, width, height):
+    """被某个全可行走的3x3窗口覆盖的格子属于房间，其余可行走格子属于走廊"""
+    room = [False] * (width * height)
+    if width < 3 or height < 3:
+        return room
+    runs = [i % width < width - 2 and mask[i] and mask[i + 1] and mask[i + 2] for i in range(width * height)]
+    for y in range(height - 2):
+        for x in range(width - 2):
+            i = y * width + x
+            if runs[i] and runs[i + width] and runs[i + 2 * width]:
+                for dy in range(3):
+                    start = i + dy * width
+                    room[start:start + 3] = (True, True, True)
+    return room
+
+
+def waypoint_graph(grid_ascii, mask=None):
+    """
+    路点图
+    - 区域: 房间（连通的房间格子）、岔路口（有3个以上可行走邻居的走廊格子）、走廊段（其余走廊格子）
+    - 每个区域一个路点（离区域中心最近的格子），相邻区域之间一条边，代价为两个路点之间的步数
+    返回: (waypoints, edges)，waypoints: [{"x", "y", "kind", "cells"}]，edges: [(a, b, cost)]（下标从0开始）
+    """
+    width, height = grid_size(grid_ascii)
+    size = width * height
+    mask = mask if mask is not None else walkable_mask(grid_ascii)
+    room = _room_mask(mask, width, height)
+    kinds = [None] * size
+    for i in range(size):
+        if mask[i]:
+            if room[i]:
+                kinds[i] = "room"
+            elif sum(1 for n in _neighbours(i, width, size) if mask[n]) >= 3:
+                kinds[i] = "junction"
+            else:
+                kinds[i] = "corridor"
+
+    # 同类相邻格子组成一个区域
+    labels = [-1] * size
+    regions = []
+    for i in range(size):
+        if kinds[i] is None or labels[i] >= 0:
+            continue
+        label = len(regions)
+        cells = [i]
+        labels[i] = label
+        for cell in cells:
+            for n in _neighbours(cell, width, size):
+                if labels[n] < 0 and kinds[n] == kinds[i]:
+                    labels[n] = label
+                    cells.append(n)
+        regions.append((kinds[i], cells))
+
+    waypoints = []
+    for kind, cells in regions:
+        cx = sum(c % width for c in cells) / len(cells)
+        cy = sum(c // width for c in cells) / len(cells)
+        best = min(cells, key=lambda c: ((c % width - cx) ** 2 + (c // width - cy) ** 2, c))
+        waypoints.append({"x": best % width, "y": best // width, "kind": kind, "cells": len(cells)})
+
+    pairs = set()
+    for i in range(size):
+        if labels[i] < 0:
+            continue
+        for n in (i + 1 if i % width < width - 1 else None, i + width if i + width < size else None):
+            if n is not None and labels[n] >= 0 and labels[n] != labels[i]:
+                pairs.add((min(labels[i], labels[n]), max(labels[i], labels[n])))
+
+    edges = []
+    for a, b in sorted(pairs):
+        # 只在两个区域内部做BFS，代价为路点之间的实际步数
+        start = waypoints[a]["y"] * width + waypoints[a]["x"]
+        goal = waypoints[b]["y"] * width + waypoints[b]["x"]
+        distance = {start: 0}
+        queue = deque([start])
+        while queue and goal not in distance:
+            cell = queue.popleft()
+            for n in _neighbours(cell, width, size):
+                if n not in distance and labels[n] in (a, b):
+                    distance[n] = distance[cell] + 1
+                    queue.append(n)
+        edges.append((a, b, distance.get(goal, UNREACHABLE)))
+    return waypoints, edges
+
+
+def build_navigation(layout, offset_x=0, offset_y=0):
+    """
+    计算布局的导航数据：起点和每个门的距离场，以及路点图
+    offset为布局在世界中的偏移（导出的坐标为世界坐标）
+    """
+    grid = layout["grid_ascii"]
+    width, height = grid_size(grid)
+    mask = walkable_mask(grid)
+    entities = layout.get("entities") or {}
+
+    targets = {}
+    start = entities.get("player_start")
+    if start:
+        targets["start"] = (start.get("x", -1), start.get("y", -1))
+    for n, door in enumerate(entities.get("doors") or [], 1):
+        targets[f"door_{n}"] = (door.get("x", -1), door.get("y", -1))
+
+    fields = {name: distance_field(grid, [target], mask) for name, target in targets.items()}
+    waypoints, edges = waypoint_graph(grid, mask)
+    for waypoint in waypoints:
+        waypoint["x"] += offset_x
+        waypoint["y"] += offset_y
+    return {
+        "width": width,
+        "height": height,
+        "origin": [offset_x, offset_y],
+        "targets": {name: [x + offset_x, y + offset_y] for name, (x, y) in targets.items()},
+        "fields": fields,
+        "waypoints": waypoints,
+        "edges": edges,
+    }
+
+
+def navigation_summary(nav):
+    """响应中返回的摘要（不含距离场本身）"""
+    start_field = nav["fields"].get("start")
+    return {
+        "fields": list(nav["fields"]),
+        "reachable_cells": sum(1 for d in start_field if d >= 0) if start_field else None,
+        "door_distances": {
+            name: nav["fields"]["start"][(y - nav["origin"][1]) * nav["width"] + x - nav["origin"][0]]
+            for name, (x, y) in nav["targets"].items() if name != "start" and start_field
+        },
+        "waypoints": nav["waypoints"],
+        "edges": nav["edges"],
+    }
+
+
+NAV_LUA_FUNCTIONS = """
+-- Distance lookup in world coordinates (-1 = wall or unreachable)
+function LevelNav.Distance(field, x, y)
+  local lx, ly = x - LevelNav.origin[1], y - LevelNav.origin[2]
+  if lx < 0 or ly < 0 or lx >= LevelNav.width or ly >= LevelNav.height then
+    return -1
+  end
+  return LevelNav.fields[field][ly * LevelNav.width + lx + 1]
+end
+
+-- Next cell toward the field's target (nil when already there or unreachable)
+function LevelNav.NextStep(field, x, y)
+  local d = LevelNav.Distance(field, x, y)
+  if d <= 0 then
+    return nil
+  end
+  for _, step in ipairs({{1, 0}, {-1, 0}, {0, 1}, {0, -1}}) do
+    local nx, ny = x + step[1], y + step[2]
+    local nd = LevelNav.Distance(field, nx, ny)
+    if nd >= 0 and nd < d then
+      return nx, ny
+    end
+  end
+  return nil
+end
+
+-- Waypoint graph adjacency: LevelNav.Neighbors(id) -> {{id, cost}, ...}
+function LevelNav.Neighbors(id)
+  if not LevelNav.adjacency then
+    LevelNav.adjacency = {}
+    for _, edge in ipairs(LevelNav.edges) do
+      local a, b, cost = edge[1], edge[2], edge[3]
+      LevelNav.adjacency[a] = LevelNav.adjacency[a] or {}
+      LevelNav.adjacency[b] = LevelNav.adjacency[b] or {}
+      table.insert(LevelNav.adjacency[a], {b, cost})
+      table.insert(LevelNav.adjacency[b], {a, cost})
+    end
+  end
+  return LevelNav.adjacency[id] or {}
+end
+
+return LevelNav"""
+
+
+def nav_to_lua(nav):
+    """导出为Lua模块（路点和边的编号从1开始，距离场为 field[y * width + x + 1]）"""
+    width = nav["width"]
+    lines = [
+        "-- Navigation data for Level.lua (precomputed, world coordinates)",
+        "local LevelNav = {",
+        f"  width = {width},",
+        f"  height = {nav['height']},",
+        f"  origin = {{{nav['origin'][0]}, {nav['origin'][1]}}},",
+        "  targets = {",
+    ]
+    for name, (x, y) in nav["targets"].items():
+        lines.append(f"    {name} = {{x = {x}, y = {y}}},")
+    lines.append("  },")
+    lines.append("  -- distance fields, row-major: field[y * width + x + 1], -1 = wall or unreachable")
+    lines.append("  fields = {")
+    for name, field in nav["fields"].items():
+        lines.append(f"    {name} = {{")
+        for y in range(nav["height"]):
+            lines.append("      " + ",".join(str(d) for d in field[y * width:(y + 1) * width]) + ",")
+        lines.append("    },")
+    lines.append("  },")
+    lines.append("  -- waypoint graph: rooms, corridor segments and junctions")
+    lines.append("  waypoints = {")
+    for waypoint in nav["waypoints"]:
+        lines.append(f"    {{x = {waypoint['x']}, y = {waypoint['y']}, kind = \"{waypoint['kind']}\", "
+                     f"cells = {waypoint['cells']}}},")
+    lines.append("  },")
+    lines.append("  edges = {")
+    for a, b, cost in nav["edges"]:
+        lines.append(f"    {{{a + 1}, {b + 1}, {cost}}},")
+    lines.append("  },")
+    lines.append("}")
+    return "\n".join(lines) + "\n" + NAV_LUA_FUNCTIONS
@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+LLM流量录制与回放（cassette）
+- record: 照常调用LLM，同时把每次请求的结果（模块、接口 chat/responses、模型、耗时、返回内容和用量）追加写入cassette文件
+- replay: 不调用LLM（不需要网络），按请求从cassette中返回录制的结果，可选按录制的耗时等待
+用于离线、可复现地对 /api/generate 和 /api/generate-level 的完整流程做基准测试和回归测试
+
+cassette文件为JSONL，每行一次调用:
+    {"key": 请求哈希, "module", "api", "model", "latency", "response": {...}}，调用失败时为 "error": 错误信息
+文件中不保存prompt正文，只保存请求哈希。请求哈希由模块名、接口、模型、消息（或input）、n 和 response_format 计算，
+temperature、max_tokens、reasoning 等参数不参与（调整这些参数后仍能回放）
+加载时按请求哈希建立索引；同一请求录制了多次时按录制顺序依次返回，用完后从头循环
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from types import SimpleNamespace
+
+# 参与请求哈希的参数
+KEY_PARAMS = ("model", "messages", "input", "n", "response_format")
+
+
+class CassetteMiss(ValueError):
+    """回放时cassette中没有对应的请求"""
+
+
+class RecordedError(Exception):
+    """回放录制时的调用失败（错误信息与录制时相同，调用方按同样的方式处理）"""
+
+
+def request_key(module_name, api, params):
+    """请求哈希"""
+    body = {name: params[name] for name in KEY_PARAMS if name in params}
+    text = json.dumps({"module": module_name, "api": api, **body}, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:24]
+
+
+def compact_response(api, response):
+    """只保留流水线用到的字段：输出文本、结束原因/状态和Token用量"""
+    usage = getattr(response, "usage", None)
+    if api == "chat":
+        details = getattr(usage, "completion_tokens_details", None)
+        return {
+            "choices": [{"content": choice.message.content, "finish_reason": choice.finish_reason}
+                        for choice in response.choices],
+            "usage": {
+                "prompt_tokens": getattr(usage, "prompt_tokens", None),
+                "completion_tokens": getattr(usage, "completion_tokens", None),
+                "reasoning_tokens": getattr(details, "reasoning_tokens", None),
+            },
+        }
+    details = getattr(usage, "output_tokens_details", None)
+    return {
+        "output_text": response.output_text,
+        "status": getattr(response, "status", None),
+        "usage": {
+            "input_tokens": getattr(usage, "input_tokens", None),
+            "output_tokens": getattr(usage, "output_tokens", None),
+            "reasoning_tokens": getattr(details, "reasoning_tokens", None),
+        },
+    }
+
+
+def replay_response(api, data):
+    """把录制的结果还原成与OpenAI SDK返回值相同结构的对象"""
+    usage = data.get("usage") or {}
+    if api == "chat":
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=choice["content"]),
+                                     finish_reason=choice["finish_reason"])
+                     for choice in data["choices"]],
+            usage=SimpleNamespace(
+                prompt_tokens=usage.get("prompt_tokens"),
+                completion_tokens=usage.get("completion_tokens"),
+                completion_tokens_details=SimpleNamespace(reasoning_tokens=usage.get("reasoning_tokens")),
+            ),
+        )
+    return SimpleNamespace(
+        output_text=data["output_text"],
+        status=data.get("status"),
+        usage=SimpleNamespace(
+            input_tokens=usage.get("input_tokens"),
+            output_tokens=usage.get("output_tokens"),
+            output_tokens_details=SimpleNamespace(reasoning_tokens=usage.get("reasoning_tokens")),
+        ),
+    )
+
+
+class Cassette:
+    """
+    一个cassette文件
+    - mode: record（追加录制，已有文件不会被清空）或 replay
+    - replay_latency: 回放时是否按录制的耗时等待，latency_scale 为耗时倍数
+    """
+
+    def __init__(self, path, mode="replay", replay_latency=False, latency_scale=1.0):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"cassette模式无效: {mode}，可选值为 record、replay")
+        self.path = path
+        self.mode = mode
+        self.replay_latency = replay_latency
+        self.latency_scale = latency_scale
+        self._lock = threading.Lock()
+        self._index = defaultdict(list)
+        self._cursors = defaultdict(int)
+        self.hits = 0
+        self.misses = 0
+        self.recorded = 0
+        if mode == "replay":
+            if not os.path.exists(path):
+                raise ValueError(f"cassette文件不存在: {path}")
+            self._load()
+
+    def _load(self):
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                self._index[entry["key"]].append(entry)
+
+    def client(self, module_name, client=None):
+        """包装一个模块调用使用的客户端（回放模式不需要真实客户端）"""
+        return CassetteClient(self, module_name, client)
+
+    def call(self, module_name, api, params, send=None):
+        """执行一次请求：录制模式调用send并记录结果，回放模式返回录制的结果"""
+        key = request_key(module_name, api, params)
+        if self.mode == "replay":
+            return self._replay(key, module_name, api, params)
+
+        started = time.perf_counter()
+        entry = {"key": key, "module": module_name, "api": api, "model": params.get("model")}
+        try:
+            response = send(**params)
+        except Exception as e:
+            entry.update(latency=round(time.perf_counter() - started, 4), error=str(e))
+            self._append(entry)
+            raise
+        entry.update(latency=round(time.perf_counter() - started, 4), response=compact_response(api, response))
+        self._append(entry)
+        return response
+
+    def _append(self, entry):
+        with self._lock:
+            self._index[entry["key"]].append(entry)
+            self.recorded += 1
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def _replay(self, key, module_name, api, params):
+        with self._lock:
+            entries = self._index.get(key)
+            if not entries:
+                self.misses += 1
+            else:
+                self.hits += 1
+                entry = entries[self._cursors[key] % len(entries)]
+                self._cursors[key] += 1
+        if not entries:
+            raise CassetteMiss(f"cassette中没有模块 {module_name} 的这个请求（模型 {params.get('model')}，"
+                               f"请求哈希 {key}），prompt或模型变化后需要重新录制")
+        if self.replay_latency and entry.get("latency"):
+            time.sleep(entry["latency"] * self.latency_scale)
+        if "error" in entry:
+            raise RecordedError(entry["error"])
+        return replay_response(api, entry["response"])
+
+    def stats(self):
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "path": self.path,
+                "entries": sum(len(entries) for entries in self._index.values()),
+                "recorded": self.recorded,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+class CassetteClient:
+    """
+    与OpenAI客户端接口相同的包装（chat.completions.create 和 responses.create），
+    调用经过cassette录制或回放
+    """
+
+    def __init__(self, cassette, module_name, client=None):
+        self.cassette = cassette
+        self.module_name = module_name
+        self.client = client
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._endpoint("chat")))
+        self.responses = SimpleNamespace(create=self._endpoint("responses"))
+
+    def _endpoint(self, api):
+        def create(**params):
+            send = None
+            if self.client is not None:
+                send = self.client.chat.completions.create if api == "chat" else self.client.responses.create
+            return self.cassette.call(self.module_name, api, params, send)
+        return create
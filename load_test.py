@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+端到端压测：以目标并发驱动 /api/generate 和 /api/generate-level，统计吞吐量、延迟分位数和错误率
+
+配合 mock_llm_server.py 使用时不会消耗真实API额度:
+    python mock_llm_server.py --port 8001 --latency lognormal:-0.5,0.4 --tokens-per-sec 80
+    （在API配置中把 Base URL 设为 http://127.0.0.1:8001/v1）
+    python app.py
+    python load_test.py --endpoint both --concurrency 8 --requests 200
+"""
+
+import argparse
+import json
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+# 设置Windows控制台编码
+if sys.platform == 'win32':
+    try:
+        sys.stdout.reconfigure(encoding='utf-8')
+    except:
+        pass
+
+SCRIPT_IDEAS = [
+    "玩家扮演一个盗贼，需要潜入城堡偷取宝物，避开守卫和陷阱",
+    "玩家需要在一个废弃的工厂中找到钥匙，打开大门逃离，但要小心巡逻的机器人守卫",
+    "玩家在迷雾森林中寻找失踪的妹妹，途中需要说服一位老猎人帮忙",
+    "玩家是一名新来的修女，需要在午夜前找出修道院里的幽灵",
+]
+
+LEVEL_IDEAS = [
+    "创建一个20x12的废弃墓地关卡，有2个敌人，1个NPC，1个宝箱，1个门，难度中等",
+    "生成一个简单的10x10地牢，有3个敌人和2个宝箱",
+    "一个30x20的城堡地下室，有4个敌人，2个NPC，3个宝箱，2个门，难度困难",
+]
+
+
+def percentile(sorted_values, pct):
+    """线性插值计算分位数"""
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * pct / 100.0
+    lower = int(k)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (k - lower)
+
+
+def build_request(endpoint, index, unique):
+    """构造第index个请求的路径和请求体"""
+    if endpoint == "generate":
+        idea = SCRIPT_IDEAS[index % len(SCRIPT_IDEAS)]
+        path, body = "/api/generate", {"user_input": idea}
+    else:
+        idea = LEVEL_IDEAS[index % len(LEVEL_IDEAS)]
+        path, body = "/api/generate-level", {"user_input": idea, "use_intent_parser": True}
+    if unique:
+        # 避免被去重/缓存命中，保证每个请求都走完整流水线
+        body["user_input"] = f"{body['user_input']} #{index}"
+    return path, body
+
+
+def send(base_url, path, body, timeout):
+    """发送一个请求，返回(状态码, 耗时秒, 错误信息)"""
+    data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+    req = urllib.request.Request(base_url + path, data=data, headers={"Content-Type": "application/json"})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            payload = json.loads(resp.read().decode('utf-8'))
+            status = resp.status
+            error = None if payload.get("success") else payload.get("error", "success=false")
+    except urllib.error.HTTPError as e:
+        status = e.code
+        try:
+            error = json.loads(e.read().decode('utf-8')).get("error")
+        except Exception:
+            error = str(e)
+    except Exception as e:
+        status = 0
+        error = f"{type(e).__name__}: {e}"
+    return status, time.perf_counter() - start, error
+
+
+def run_load(base_url, endpoints, concurrency, total_requests, duration, timeout, unique):
+    """按目标并发执行压测，返回每个请求的结果列表"""
+    results = []
+    results_lock = threading.Lock()
+    counter = {"next": 0}
+    deadline = time.perf_counter() + duration if duration else None
+
+    def next_index():
+        with results_lock:
+            index = counter["next"]
+            if total_requests and index >= total_requests:
+                return None
+            if deadline and time.perf_counter() >= deadline:
+                return None
+            counter["next"] += 1
+            return index
+
+    def worker():
+        while True:
+            index = next_index()
+            if index is None:
+                return
+            endpoint = endpoints[index % len(endpoints)]
+            path, body = build_request(endpoint, index, unique)
+            status, elapsed, error = send(base_url, path, body, timeout)
+            with results_lock:
+                results.append({"endpoint": endpoint, "status": status, "latency": elapsed, "error": error})
+                done = len(results)
+            if done % max(1, concurrency) == 0:
+                print(f"  已完成 {done} 个请求...", flush=True)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for _ in range(concurrency):
+            executor.submit(worker)
+    return results, time.perf_counter() - start
+
+
+def summarize(results, wall_time):
+    """汇总各接口的吞吐量、延迟分位数和错误率"""
+    summary = {}
+    for endpoint in sorted({r["endpoint"] for r in results}) + ["all"]:
+        rows = results if endpoint == "all" else [r for r in results if r["endpoint"] == endpoint]
+        latencies = sorted(r["latency"] for r in rows)
+        failures = [r for r in rows if r["status"] != 200 or r["error"]]
+        summary[endpoint] = {
+            "requests": len(rows),
+            "throughput_rps": len(rows) / wall_time if wall_time else 0.0,
+            "latency_ms": {
+                "mean": sum(latencies) / len(latencies) * 1000 if latencies else 0.0,
+                "p50": percentile(latencies, 50) * 1000,
+                "p90": percentile(latencies, 90) * 1000,
+                "p95": percentile(latencies, 95) * 1000,
+                "p99": percentile(latencies, 99) * 1000,
+                "max": latencies[-1] * 1000 if latencies else 0.0,
+            },
+            "error_rate": len(failures) / len(rows) if rows else 0.0,
+            "status_codes": dict(Counter(str(r["status"]) for r in rows)),
+            "top_errors": Counter(str(r["error"])[:120] for r in failures).most_common(3),
+        }
+    return summary
+
+
+def print_summary(summary, wall_time, concurrency):
+    """打印压测报告"""
+    print("\n" + "=" * 60)
+    print(f"压测完成: 总耗时 {wall_time:.2f}s, 并发 {concurrency}")
+    print("=" * 60)
+    for endpoint, stats in summary.items():
+        lat = stats["latency_ms"]
+        print(f"\n[{endpoint}] 请求数 {stats['requests']}, 吞吐量 {stats['throughput_rps']:.2f} req/s, "
+              f"错误率 {stats['error_rate'] * 100:.1f}%")
+        print(f"  延迟(ms): mean {lat['mean']:.0f} | p50 {lat['p50']:.0f} | p90 {lat['p90']:.0f} | "
+              f"p95 {lat['p95']:.0f} | p99 {lat['p99']:.0f} | max {lat['max']:.0f}")
+        print(f"  状态码: {stats['status_codes']}")
+        for error, count in stats["top_errors"]:
+            print(f"  ❌ x{count}: {error}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Lua AI生成系统端到端压测")
+    parser.add_argument("--url", default="http://127.0.0.1:5000", help="服务地址")
+    parser.add_argument("--endpoint", choices=["generate", "generate-level", "both"], default="both")
+    parser.add_argument("--concurrency", type=int, default=4, help="并发数")
+    parser.add_argument("--requests", type=int, default=50, help="总请求数（与--duration同时指定时先到先停）")
+    parser.add_argument("--duration", type=float, default=0, help="最长压测时间（秒），0表示不限")
+    parser.add_argument("--timeout", type=float, default=600, help="单个请求超时（秒）")
+    parser.add_argument("--no-unique", action="store_true", help="不给输入加序号（用于测试去重/缓存）")
+    parser.add_argument("--json", dest="json_out", help="把汇总结果写入JSON文件")
+    args = parser.parse_args(argv)
+
+    endpoints = ["generate", "generate-level"] if args.endpoint == "both" else [args.endpoint]
+    print(f"开始压测 {args.url} -> {', '.join(endpoints)}，并发 {args.concurrency}，请求数 {args.requests}")
+    results, wall_time = run_load(args.url.rstrip('/'), endpoints, args.concurrency, args.requests,
+                                  args.duration, args.timeout, not args.no_unique)
+    summary = summarize(results, wall_time)
+    print_summary(summary, wall_time, args.concurrency)
+
+    if args.json_out:
+        with open(args.json_out, 'w', encoding='utf-8') as f:
+            json.dump({"wall_time": wall_time, "concurrency": args.concurrency, "summary": summary},
+                      f, ensure_ascii=False, indent=2)
+        print(f"\n汇总结果已写入 {args.json_out}")
+
+    return 0 if summary.get("all", {}).get("error_rate", 1.0) < 1.0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
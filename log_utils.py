@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+结构化日志：请求线程只把日志记录放进队列，由后台线程格式化并写出，避免并发请求的输出互相穿插、阻塞在终端/管道I/O上
+- 每行带请求ID（X-Request-ID）和运行ID（run_id），用contextvars传递，线程池中用 in_context 包装任务
+- module_span 记录模块的开始、结束和耗时
+- log_payload 按采样率记录LLM原始输出等大段内容（默认不记录）
+- 支持文本和JSON（每行一个JSON对象）两种输出格式
+"""
+
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from profiling import stage
+
+LOGGER_NAME = "lua_gen"
+
+DEFAULT_SETTINGS = {
+    "level": "INFO",
+    "format": "text",
+    "payload_sample_rate": 0.0,
+    "payload_max_chars": 2000,
+}
+
+request_id_var = contextvars.ContextVar("request_id", default=None)
+run_id_var = contextvars.ContextVar("run_id", default=None)
+
+_state = {"listener": None, "handler": None, "settings": None}
+_setup_lock = threading.Lock()
+
+
+def new_request_id():
+    return uuid.uuid4().hex[:12]
+
+
+def bind_request(request_id=None):
+    """绑定当前请求的ID（未指定时生成一个），同时清除上一个请求遗留的运行ID"""
+    request_id = request_id or new_request_id()
+    request_id_var.set(request_id)
+    run_id_var.set(None)
+    return request_id
+
+
+def bind_run(run_id):
+    """绑定当前运行的ID（之后的日志都带上run_id）"""
+    run_id_var.set(run_id)
+
+
+def in_context(func):
+    """包装线程池任务，使其在提交时的上下文（请求ID、运行ID）中执行"""
+    context = contextvars.copy_context()
+    # 同一个Context不能同时在多个线程中进入，每次调用使用一份副本
+    return lambda *args, **kwargs: context.copy().run(func, *args, **kwargs)
+
+
+def init_request_logging(app):
+    """注册请求钩子：每个请求绑定请求ID（沿用合法的X-Request-ID请求头），并在响应头中返回"""
+    from flask import request
+
+    @app.before_request
+    def _bind_request_id():
+        incoming = request.headers.get("X-Request-ID", "")
+        valid = 0 < len(incoming) <= 64 and all(c.isalnum() or c in "-_." for c in incoming)
+        bind_request(incoming if valid else None)
+
+    @app.after_request
+    def _add_request_id(response):
+        response.headers["X-Request-ID"] = request_id_var.get() or ""
+        return response
+
+
+def get_logger(name=None):
+    return logging.getLogger(f"{LOGGER_NAME}.{name}" if name else LOGGER_NAME)
+
+
+class _ContextFilter(logging.Filter):
+    """在请求线程中给日志记录加上请求ID和运行ID"""
+
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        record.run_id = run_id_var.get()
+        return True
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """只在请求线程中合成消息文本，异常堆栈的格式化留给后台线程"""
+
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+class TextFormatter(logging.Formatter):
+    """时间 级别 [请求ID/运行ID] 消息 key=value..."""
+
+    def format(self, record):
+        ids = record.request_id or "-"
+        if record.run_id:
+            ids += "/" + record.run_id
+        line = f"{self.formatTime(record, '%H:%M:%S')} {record.levelname} [{ids}] {record.getMessage()}"
+        fields = getattr(record, "fields", None)
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    """每行一个JSON对象，fields中的字段放在顶层"""
+
+    def format(self, record):
+        data = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": record.request_id,
+            "run_id": record.run_id,
+            "msg": record.getMessage(),
+        }
+        data.update(getattr(record, "fields", None) or {})
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+def setup_logging(settings=None, stream=None):
+    """
+    配置日志（可重复调用，设置没变化时不做任何事）
+    settings: config.json中的logging配置；stream: 输出流（默认stdout）
+    """
+    settings = dict(DEFAULT_SETTINGS, **(settings or {}))
+    with _setup_lock:
+        _configure(settings, stream)
+
+
+def _configure(settings, stream):
+    state = _state
+    if state["listener"] is None or stream is not None:
+        if state["listener"] is not None:
+            state["listener"].stop()
+        log_queue = queue.SimpleQueue()
+        handler = logging.StreamHandler(stream or sys.stdout)
+        listener = logging.handlers.QueueListener(log_queue, handler)
+        queue_handler = _DeferredQueueHandler(log_queue)
+        queue_handler.addFilter(_ContextFilter())
+        logger = get_logger()
+        for old in list(logger.handlers):
+            logger.removeHandler(old)
+        logger.addHandler(queue_handler)
+        logger.propagate = False
+        listener.start()
+        if state["handler"] is None:
+            atexit.register(lambda: state["listener"] and state["listener"].stop())
+        state.update(listener=listener, handler=handler, settings=None)
+    if settings != state["settings"]:
+        state["handler"].setFormatter(JsonFormatter() if settings["format"] == "json" else TextFormatter())
+        get_logger().setLevel(str(settings["level"]).upper())
+        state["settings"] = settings
+
+
+def flush_logging():
+    """等待队列中的日志全部写出（测试和进程退出前使用）"""
+    listener = _state["listener"]
+    if listener is not None:
+        listener.stop()
+        listener.start()
+
+
+@contextmanager
+def module_span(logger, module, **fields):
+    """
+    记录模块的开始和结束（带耗时，单位毫秒），模块抛出异常时记录失败后继续抛出
+    请求开启了性能分析时同时作为一个阶段记录
+    """
+    logger.info("模块开始", extra={"fields": dict(module=module, event="start", **fields)})
+    started = time.perf_counter()
+    try:
+        with stage(module):
+            yield
+    except Exception as e:
+        elapsed = round((time.perf_counter() - started) * 1000, 1)
+        logger.warning("模块失败", extra={"fields": dict(
+            module=module, event="failed", duration_ms=elapsed, error=str(e), **fields)})
+        raise
+    elapsed = round((time.perf_counter() - started) * 1000, 1)
+    logger.info("模块完成", extra={"fields": dict(module=module, event="end", duration_ms=elapsed, **fields)})
+
+
+def log_payload(logger, label, payload):
+    """按采样率记录大段内容（超过payload_max_chars的部分截断）"""
+    settings = _state["settings"] or DEFAULT_SETTINGS
+    rate = settings["payload_sample_rate"]
+    if rate <= 0 or (rate < 1 and random.random() >= rate):
+        return
+    text = payload if isinstance(payload, str) else json.dumps(payload, ensure_ascii=False, default=str)
+    limit = settings["payload_max_chars"]
+    logger.info("载荷", extra={"fields": {
+        "payload_label": label,
+        "payload_chars": len(text),
+        "payload": text[:limit] + ("..." if len(text) > limit else "")
+    }})
@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Lua打包与压缩：把 main.lua 和它 require 的 Stage.lua、Cast.lua 合并成一个自包含文件，
+并基于Token去掉注释和空白，可选地缩短局部变量名
+
+- 打包: 每个模块包装为一个闭包，require("Stage") 改为调用打包文件内的加载函数（同样只执行一次并缓存返回值），
+  未打包的模块仍交给原来的 require
+- 压缩: 逐个重新输出Token，只在两个Token直接相连会被解析成别的Token时插入空格，字符串和数字原样保留
+- 局部变量重命名: 用语法分析器的作用域钩子解析每个名字引用的是哪个局部变量，
+  新名字不与任何全局变量名、关键字以及重命名时仍可见的局部变量冲突，全局变量和字段名不变
+"""
+
+from collections import Counter
+from functools import lru_cache
+from itertools import count, product
+
+from lua_syntax import KEYWORDS, Lexer, LuaSyntaxError, Parser, tokenize
+
+BUNDLE_REQUIRE = "__bundle_require"
+
+BUNDLE_HEADER = """local __bundle_modules, __bundle_loaded = {}, {}
+local function __bundle_require(name)
+  local loader = __bundle_modules[name]
+  if not loader then
+    return require(name)
+  end
+  if __bundle_loaded[name] == nil then
+    local result = loader(name)
+    if result == nil then
+      result = true
+    end
+    __bundle_loaded[name] = result
+  end
+  return __bundle_loaded[name]
+end
+"""
+
+_NAME_CHARS = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ"
+_NAME_TAIL_CHARS = _NAME_CHARS + "0123456789_"
+
+# 这些名字的局部变量不重命名（方法的隐式self、Lua 5.2+的_ENV）
+_FIXED_NAMES = {"self", "_ENV"}
+
+
+class _ScopeAnalyzer(Parser):
+    """记录每个局部变量的声明、可见范围以及每个名字引用指向的声明"""
+
+    def __init__(self, source):
+        super().__init__(source)
+        self.scopes = []
+        self.decls = []        # 声明的Token
+        self.events = []       # ("declare", id) / ("exit", [id, ...])，按源码顺序
+        self.refs = {}         # 引用Token的起始位置 -> 声明id
+        self.globals = set()
+
+    def enter_scope(self):
+        self.scopes.append(({}, []))
+
+    def exit_scope(self):
+        _, ids = self.scopes.pop()
+        self.events.append(("exit", ids))
+
+    def declare_local(self, token):
+        decl_id = len(self.decls)
+        self.decls.append(token)
+        names, ids = self.scopes[-1]
+        names[token.value] = decl_id
+        ids.append(decl_id)
+        self.events.append(("declare", decl_id))
+
+    def reference_name(self, token):
+        for names, _ in reversed(self.scopes):
+            if token.value in names:
+                self.refs[token.start] = names[token.value]
+                return
+        self.globals.add(token.value)
+
+
+def analyze_scopes(source):
+    analyzer = _ScopeAnalyzer(source)
+    analyzer.parse_chunk()
+    return analyzer
+
+
+def _short_names():
+    """a, b, ..., Z, aa, ab, ... 依次生成"""
+    for length in count(1):
+        for first in _NAME_CHARS:
+            for tail in product(_NAME_TAIL_CHARS, repeat=length - 1):
+                yield first + "".join(tail)
+
+
+def local_renames(source):
+    """
+    计算局部变量重命名表: {Token起始位置: 新名字}
+    按源码顺序分配名字，可见范围已经结束的局部变量的名字可以复用
+    """
+    analyzer = analyze_scopes(source)
+    reserved = set(KEYWORDS) | analyzer.globals | _FIXED_NAMES
+    new_names = {}
+    visible = Counter()
+    for event, value in analyzer.events:
+        if event == "exit":
+            for decl_id in value:
+                visible[new_names[decl_id]] -= 1
+            continue
+        token = analyzer.decls[value]
+        if token.value in _FIXED_NAMES or token.start == token.end:
+            name = token.value
+        else:
+            name = next(n for n in _short_names() if n not in reserved and not visible[n])
+        new_names[value] = name
+        visible[name] += 1
+
+    renames = {}
+    for decl_id, token in enumerate(analyzer.decls):
+        if token.start != token.end:
+            renames[token.start] = new_names[decl_id]
+    for start, decl_id in analyzer.refs.items():
+        renames[start] = new_names[decl_id]
+    return renames
+
+
+def _is_word_char(ch):
+    return ch.isalnum() or ch == "_"
+
+
+def _needs_space(left, right):
+    """两个Token直接相连时是否会被解析成别的Token"""
+    # Lua读数字时会吞掉后面所有的'.'和字母数字（如 1 .. x 写成 1..x 是非法数字）
+    if left[0].isdigit() or (left[0] == "." and left[1:2].isdigit()):
+        return _is_word_char(right[0]) or right[0] == "."
+    if _is_word_char(left[-1]):
+        return _is_word_char(right[0])
+    if _is_word_char(right[0]) or right[0] in "\"'":
+        return False
+    return _ops_need_space(left, right)
+
+
+@lru_cache(maxsize=4096)
+def _ops_need_space(left, right):
+    """两个以符号结尾/开头的Token，用词法分析器检查相连后是否仍是原来的两个Token"""
+    try:
+        # 前面加空格，避免以'#'开头时被当作首行的#!行跳过
+        tokens = list(Lexer(" " + left + right).tokens())
+    except LuaSyntaxError:
+        return True
+    return len(tokens) != 3 or tokens[0].value != left or tokens[1].value != right
+
+
+def minify_lua(source, rename_locals=False):
+    """去掉注释和多余空白（可选缩短局部变量名），不改变程序行为"""
+    renames = local_renames(source) if rename_locals else {}
+    parts = []
+    previous = None
+    for token in tokenize(source):
+        if token.type == "eof":
+            break
+        text = renames.get(token.start, token.value) if token.type == "name" else token.value
+        if previous is not None and _needs_space(previous, text):
+            parts.append(" ")
+        parts.append(text)
+        previous = text
+    return "".join(parts)
+
+
+def _strip_shebang(source):
+    if source.startswith("#"):
+        newline = source.find("\n")
+        return "" if newline < 0 else source[newline:]
+    return source
+
+
+def _string_value(token):
+    """简单字符串字面量的值（含转义或长字符串时返回None）"""
+    text = token.value
+    if token.type != "string" or text[0] not in "\"'" or "\\" in text:
+        return None
+    return text[1:-1]
+
+
+def rewrite_requires(source, module_names):
+    """
+    把对已打包模块的 require("X") / require "X" 改为调用打包文件内的加载函数
+    被局部变量遮蔽的require不改；返回 (新源码, 改写次数)
+    """
+    analyzer = analyze_scopes(source)
+    tokens = analyzer.tokens
+    edits = []
+    for i, token in enumerate(tokens):
+        if token.type != "name" or token.value != "require" or token.start in analyzer.refs:
+            continue
+        if i > 0 and tokens[i - 1].value in (".", ":") and tokens[i - 1].type == "op":
+            continue
+        following = tokens[i + 1]
+        if following.type == "op" and following.value == "(":
+            argument, closing = tokens[i + 2], tokens[i + 3]
+            if not (closing.type == "op" and closing.value == ")"):
+                continue
+        else:
+            argument = following
+        if _string_value(argument) in module_names:
+            edits.append(token)
+
+    for token in reversed(edits):
+        source = source[:token.start] + BUNDLE_REQUIRE + source[token.end:]
+    return source, len(edits)
+
+
+def bundle_lua(modules, main_source, minify=True, rename_locals=False):
+    """
+    打包
+    modules: {模块名: 源码}（例如 {"Stage": ..., "Cast": ...}），main_source: 入口文件源码
+    返回: (打包后的源码, 报告)；源码有语法错误时抛出LuaSyntaxError
+    """
+    names = set(modules)
+    for name in names:
+        if not name.replace("_", "").replace(".", "").isalnum():
+            raise ValueError(f"非法的模块名: {name}")
+    parts = [BUNDLE_HEADER]
+    rewritten = 0
+    for name, source in modules.items():
+        source, n = rewrite_requires(_strip_shebang(source), names)
+        rewritten += n
+        parts.append(f'__bundle_modules["{name}"] = function(...)\n{source}\nend\n')
+    main, n = rewrite_requires(_strip_shebang(main_source), names)
+    rewritten += n
+    parts.append(main)
+    bundle = "\n".join(parts)
+    if minify:
+        bundle = minify_lua(bundle, rename_locals=rename_locals)
+
+    input_bytes = {f"{name}.lua": len(source.encode('utf-8')) for name, source in modules.items()}
+    input_bytes["main.lua"] = len(main_source.encode('utf-8'))
+    total = sum(input_bytes.values())
+    bundle_bytes = len(bundle.encode('utf-8'))
+    report = {
+        "input_bytes": input_bytes,
+        "input_total_bytes": total,
+        "bundle_bytes": bundle_bytes,
+        "saved_ratio": round(1 - bundle_bytes / total, 4) if total else 0.0,
+        "requires_inlined": rewritten,
+        "minified": minify,
+        "locals_renamed": bool(minify and rename_locals),
+    }
+    return bundle, report
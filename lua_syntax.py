@@ -0,0 +1,684 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+纯Python实现的Lua词法/语法检查（Lua 5.1 ~ 5.4语法），不依赖Lua解释器
+用于在生成的Lua代码进入下游模块或写入磁盘前快速发现语法错误
+"""
+
+import re
+from collections import namedtuple
+
+KEYWORDS = {
+    "and", "break", "do", "else", "elseif", "end", "false", "for", "function", "goto", "if", "in",
+    "local", "nil", "not", "or", "repeat", "return", "then", "true", "until", "while",
+}
+
+# 按长度从长到短匹配
+OPERATORS = [
+    "...", "..", "==", "~=", "<=", ">=", "<<", ">>", "//", "::",
+    "+", "-", "*", "/", "%", "^", "#", "&", "~", "|", "<", ">", "=",
+    "(", ")", "{", "}", "[", "]", ";", ":", ",", ".",
+]
+
+# 二元运算符优先级 (左, 右)，与Lua官方lparser.c一致
+BINARY_PRIORITY = {
+    "or": (1, 1), "and": (2, 2),
+    "<": (3, 3), ">": (3, 3), "<=": (3, 3), ">=": (3, 3), "~=": (3, 3), "==": (3, 3),
+    "|": (4, 4), "~": (5, 5), "&": (6, 6), "<<": (7, 7), ">>": (7, 7),
+    "..": (9, 8),
+    "+": (10, 10), "-": (10, 10),
+    "*": (11, 11), "/": (11, 11), "//": (11, 11), "%": (11, 11),
+    "^": (14, 13),
+}
+UNARY_PRIORITY = 12
+UNARY_OPERATORS = {"not", "-", "#", "~"}
+
+BLOCK_END = {"end", "else", "elseif", "until", "eof"}
+
+Token = namedtuple("Token", ["type", "value", "line", "column", "start", "end"])
+
+_NAME_RE = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
+_HEX_RE = re.compile(r'0[xX](?:[0-9a-fA-F]*\.?[0-9a-fA-F]*)(?:[pP][+-]?[0-9]+)?')
+_DEC_RE = re.compile(r'(?:[0-9]+\.?[0-9]*|\.[0-9]+)(?:[eE][+-]?[0-9]+)?')
+_LONG_BRACKET_RE = re.compile(r'\[(=*)\[')
+_FENCE_BLOCK_RE = re.compile(r'```[ \t]*([A-Za-z0-9_+-]*)[ \t]*\r?\n(.*?)(?:\r?\n)?[ \t]*```', re.DOTALL)
+_FENCE_LINE_RE = re.compile(r'^[ \t]*```[ \t]*[A-Za-z0-9_+-]*[ \t]*$', re.MULTILINE)
+
+
+class LuaSyntaxError(Exception):
+    """Lua语法错误，带行号和列号（均从1开始）"""
+
+    def __init__(self, message, line, column, near=None):
+        self.message = message
+        self.line = line
+        self.column = column
+        self.near = near
+        detail = f"{line}:{column}: {message}"
+        if near:
+            detail += f" (near '{near}')"
+        super().__init__(detail)
+
+    def to_dict(self):
+        return {"line": self.line, "column": self.column, "message": self.message, "near": self.near}
+
+
+def strip_markdown_fences(text):
+    """
+    去除LLM输出中夹带的markdown代码块标记
+    - 整段被```lua ... ```包裹时取出内部代码
+    - 说明文字中夹着代码块时，取lua代码块（没有则取最长的代码块）
+    - 再删除残留的单独一行```
+    """
+    if not isinstance(text, str):
+        return text
+    blocks = _FENCE_BLOCK_RE.findall(text)
+    if blocks:
+        lua_blocks = [body for lang, body in blocks if lang.lower() == "lua"]
+        if lua_blocks:
+            text = "\n\n".join(lua_blocks)
+        else:
+            text = max((body for _, body in blocks), key=len)
+    text = _FENCE_LINE_RE.sub("", text)
+    return text.strip("\n") + "\n" if text.strip() else ""
+
+
+# ==================== 词法分析 ====================
+
+class Lexer:
+    """Lua词法分析器，跳过空白和注释"""
+
+    def __init__(self, source):
+        self.source = source
+        self.pos = 0
+        self.line = 1
+        self.line_start = 0
+        # 跳过首行的 #! 行
+        if source.startswith("#"):
+            newline = source.find("\n")
+            self.pos = len(source) if newline < 0 else newline
+
+    def error(self, message, pos=None):
+        pos = self.pos if pos is None else pos
+        line = self.source.count("\n", 0, pos) + 1
+        column = pos - (self.source.rfind("\n", 0, pos) + 1) + 1
+        raise LuaSyntaxError(message, line, column)
+
+    def _advance_lines(self, start, end):
+        """更新跨越多行的行号信息"""
+        newlines = self.source.count("\n", start, end)
+        if newlines:
+            self.line += newlines
+            self.line_start = self.source.rfind("\n", start, end) + 1
+
+    def _read_long_bracket(self, start, level, what):
+        """读取 [[...]] / [==[...]==] 形式的长字符串或长注释，返回结束位置"""
+        close = "]" + "=" * level + "]"
+        end = self.source.find(close, start)
+        if end < 0:
+            self.error(f"unfinished long {what}", start)
+        return end + len(close)
+
+    def _read_string(self, start):
+        """读取带引号的字符串，返回结束位置"""
+        source = self.source
+        quote = source[start]
+        i = start + 1
+        length = len(source)
+        while i < length:
+            ch = source[i]
+            if ch == quote:
+                return i + 1
+            if ch in "\n\r":
+                self.error("unfinished string", start)
+            if ch == "\\":
+                i += 1
+                if i >= length:
+                    break
+                esc = source[i]
+                if esc == "x":
+                    if not re.match(r'[0-9a-fA-F]{2}', source[i + 1:i + 3]):
+                        self.error("hexadecimal digit expected", i)
+                    i += 3
+                    continue
+                if esc == "u":
+                    match = re.match(r'\{[0-9a-fA-F]+\}', source[i + 1:])
+                    if not match:
+                        self.error("missing '{' or '}' in \\u{xxxx}", i)
+                    i += 1 + match.end()
+                    continue
+                if esc == "z":
+                    i += 1
+                    while i < length and source[i] in " \t\r\n\f\v":
+                        i += 1
+                    continue
+                if esc in "0123456789":
+                    match = re.match(r'[0-9]{1,3}', source[i:])
+                    if int(match.group(0)) > 255:
+                        self.error("decimal escape too large", i)
+                    i += match.end()
+                    continue
+                if esc in "\n\r":
+                    # 反斜杠后的 \r\n 或 \n\r 算一个转义换行
+                    i += 1
+                    if i < length and source[i] in "\n\r" and source[i] != esc:
+                        i += 1
+                    continue
+                if esc in "abfnrtv\\\"'":
+                    i += 1
+                    continue
+                self.error("invalid escape sequence", i - 1)
+            i += 1
+        self.error("unfinished string", start)
+
+    def tokens(self):
+        """生成Token序列，最后一个Token类型为eof"""
+        source = self.source
+        length = len(source)
+        while True:
+            # 跳过空白和注释
+            while self.pos < length:
+                ch = source[self.pos]
+                if ch == "\n":
+                    self.pos += 1
+                    self.line += 1
+                    self.line_start = self.pos
+                elif ch in " \t\r\f\v":
+                    self.pos += 1
+                elif source.startswith("--", self.pos):
+                    start = self.pos
+                    match = _LONG_BRACKET_RE.match(source, self.pos + 2)
+                    if match:
+                        self.pos = self._read_long_bracket(match.end(), len(match.group(1)), "comment")
+                        self._advance_lines(start, self.pos)
+                    else:
+                        newline = source.find("\n", self.pos)
+                        self.pos = length if newline < 0 else newline
+                else:
+                    break
+
+            start = self.pos
+            line = self.line
+            column = start - self.line_start + 1
+            if start >= length:
+                yield Token("eof", "<eof>", line, column, start, start)
+                return
+
+            ch = source[start]
+            match = _NAME_RE.match(source, start)
+            if match:
+                value = match.group(0)
+                self.pos = match.end()
+                yield Token("keyword" if value in KEYWORDS else "name", value, line, column, start, self.pos)
+                continue
+
+            if ch in "0123456789" or (ch == "." and start + 1 < length and source[start + 1] in "0123456789"):
+                match = _HEX_RE.match(source, start) or _DEC_RE.match(source, start)
+                end = match.end()
+                if match.re is _HEX_RE and end == start + 2:
+                    self.error("malformed number", start)
+                # 数字后面紧跟字母或数字是非法的，如 3abc
+                if end < length and (source[end].isalnum() or source[end] == "_"):
+                    self.error("malformed number", start)
+                self.pos = end
+                yield Token("number", source[start:end], line, column, start, end)
+                continue
+
+            if ch in "\"'":
+                self.pos = self._read_string(start)
+                self._advance_lines(start, self.pos)
+                yield Token("string", source[start:self.pos], line, column, start, self.pos)
+                continue
+
+            if ch == "[":
+                match = _LONG_BRACKET_RE.match(source, start)
+                if match:
+                    self.pos = self._read_long_bracket(match.end(), len(match.group(1)), "string")
+                    self._advance_lines(start, self.pos)
+                    yield Token("string", source[start:self.pos], line, column, start, self.pos)
+                    continue
+                if source.startswith("[=", start):
+                    self.error("invalid long string delimiter", start)
+
+            for op in OPERATORS:
+                if source.startswith(op, start):
+                    self.pos = start + len(op)
+                    yield Token("op", op, line, column, start, self.pos)
+                    break
+            else:
+                self.error(f"unexpected symbol '{ch}'", start)
+
+
+def tokenize(source):
+    """把Lua源码切分为Token列表（不含注释）"""
+    return list(Lexer(source).tokens())
+
+
+# ==================== 语法分析 ====================
+
+class FunctionState:
+    """当前正在解析的函数的状态"""
+
+    def __init__(self, is_vararg):
+        self.is_vararg = is_vararg
+        self.loop_depth = 0
+
+
+class Parser:
+    """
+    递归下降语法分析器，只做语法检查，不构建语法树
+    子类可以覆盖 enter_scope / exit_scope / declare_local / reference_name 做作用域分析
+    """
+
+    def __init__(self, source):
+        self.tokens = tokenize(source)
+        self.index = 0
+        self.token = self.tokens[0]
+        self.function = FunctionState(is_vararg=True)
+        self.block_depth = 0
+
+    # ---------- 作用域钩子（默认不做任何事） ----------
+
+    def enter_scope(self):
+        pass
+
+    def exit_scope(self):
+        pass
+
+    def declare_local(self, token):
+        pass
+
+    def reference_name(self, token):
+        pass
+
+    # ---------- 基础操作 ----------
+
+    def error(self, message, token=None):
+        token = token or self.token
+        raise LuaSyntaxError(message, token.line, token.column, token.value)
+
+    def next(self):
+        token = self.token
+        if self.index < len(self.tokens) - 1:
+            self.index += 1
+            self.token = self.tokens[self.index]
+        return token
+
+    def peek(self, offset=1):
+        return self.tokens[min(self.index + offset, len(self.tokens) - 1)]
+
+    def check(self, value):
+        return self.token.value == value and self.token.type in ("op", "keyword")
+
+    def accept(self, value):
+        if self.check(value):
+            return self.next()
+        return None
+
+    def expect(self, value, what=None, opener=None):
+        if self.check(value):
+            return self.next()
+        message = f"'{value}' expected"
+        if what:
+            message = f"'{value}' expected {what}"
+        if opener is not None and opener.line != self.token.line:
+            message += f" (to close '{opener.value}' at line {opener.line})"
+        self.error(message)
+
+    def expect_name(self):
+        if self.token.type != "name":
+            self.error("<name> expected")
+        return self.next()
+
+    def block_follow(self, with_until=True):
+        token = self.token
+        if token.type == "eof":
+            return True
+        if token.type != "keyword":
+            return False
+        if token.value == "until":
+            return with_until
+        return token.value in BLOCK_END
+
+    # ---------- 语句 ----------
+
+    def parse_chunk(self):
+        self.enter_scope()
+        self.block()
+        if self.token.type != "eof":
+            self.error("'<eof>' expected")
+        self.exit_scope()
+
+    def block(self):
+        self.block_depth += 1
+        while not self.block_follow():
+            if self.check("return"):
+                self.return_stat()
+                break
+            self.statement()
+        self.block_depth -= 1
+
+    def scoped_block(self):
+        self.enter_scope()
+        self.block()
+        self.exit_scope()
+
+    def return_stat(self):
+        self.next()
+        if not self.block_follow() and not self.check(";"):
+            self.explist()
+        self.accept(";")
+        if not self.block_follow():
+            self.error("'<eof>' expected" if self.block_depth == 1 else "'end' expected")
+
+    def statement(self):
+        token = self.token
+        value = token.value
+        if token.type == "op":
+            if value == ";":
+                self.next()
+                return
+            if value == "::":
+                self.next()
+                self.expect_name()
+                self.expect("::")
+                return
+        elif token.type == "keyword":
+            handler = {
+                "if": self.if_stat,
+                "while": self.while_stat,
+                "do": self.do_stat,
+                "for": self.for_stat,
+                "repeat": self.repeat_stat,
+                "function": self.function_stat,
+                "local": self.local_stat,
+                "break": self.break_stat,
+                "goto": self.goto_stat,
+            }.get(value)
+            if handler:
+                handler()
+                return
+        self.expr_stat()
+
+    def if_stat(self):
+        opener = self.next()
+        self.expr()
+        self.expect("then")
+        self.scoped_block()
+        while self.check("elseif"):
+            self.next()
+            self.expr()
+            self.expect("then")
+            self.scoped_block()
+        if self.accept("else"):
+            self.scoped_block()
+        self.expect("end", opener=opener)
+
+    def while_stat(self):
+        opener = self.next()
+        self.expr()
+        self.expect("do")
+        self.loop_block()
+        self.expect("end", opener=opener)
+
+    def do_stat(self):
+        opener = self.next()
+        self.scoped_block()
+        self.expect("end", opener=opener)
+
+    def loop_block(self, declared=()):
+        self.function.loop_depth += 1
+        self.enter_scope()
+        for name_token in declared:
+            self.declare_local(name_token)
+        self.block()
+        self.exit_scope()
+        self.function.loop_depth -= 1
+
+    def for_stat(self):
+        opener = self.next()
+        first = self.expect_name()
+        if self.accept("="):
+            self.expr()
+            self.expect(",")
+            self.expr()
+            if self.accept(","):
+                self.expr()
+            self.expect("do")
+            self.loop_block([first])
+        elif self.check(",") or self.check("in"):
+            names = [first]
+            while self.accept(","):
+                names.append(self.expect_name())
+            self.expect("in")
+            self.explist()
+            self.expect("do")
+            self.loop_block(names)
+        else:
+            self.error("'=' or 'in' expected")
+        self.expect("end", opener=opener)
+
+    def repeat_stat(self):
+        opener = self.next()
+        self.function.loop_depth += 1
+        # until条件可以访问循环体内声明的局部变量
+        self.enter_scope()
+        self.block()
+        self.expect("until", opener=opener)
+        self.expr()
+        self.exit_scope()
+        self.function.loop_depth -= 1
+
+    def function_stat(self):
+        self.next()
+        # funcname: Name {'.' Name} [':' Name]
+        self.reference_name(self.expect_name())
+        is_method = False
+        while self.check("."):
+            self.next()
+            self.expect_name()
+        if self.accept(":"):
+            self.expect_name()
+            is_method = True
+        self.function_body(is_method)
+
+    def local_stat(self):
+        self.next()
+        if self.accept("function"):
+            name = self.expect_name()
+            # local function f 在函数体内就能引用自身
+            self.declare_local(name)
+            self.function_body(False)
+            return
+        names = []
+        while True:
+            names.append(self.expect_name())
+            if self.accept("<"):
+                attrib = self.expect_name()
+                if attrib.value not in ("const", "close"):
+                    self.error(f"unknown attribute '{attrib.value}'", attrib)
+                self.expect(">")
+            if not self.accept(","):
+                break
+        if self.accept("="):
+            self.explist()
+        # local x = x 中右侧的x引用的是外层变量，所以声明放在表达式之后
+        for name in names:
+            self.declare_local(name)
+
+    def break_stat(self):
+        token = self.next()
+        if self.function.loop_depth == 0:
+            self.error("break outside a loop", token)
+
+    def goto_stat(self):
+        # Lua 5.1中goto不是关键字，后面跟'='等时按普通变量处理
+        if self.peek().type == "name":
+            self.next()
+            self.next()
+            return
+        self.expr_stat()
+
+    def expr_stat(self):
+        kind = self.suffixed_expr()
+        if self.check("=") or self.check(","):
+            if kind not in ("name", "index"):
+                self.error("syntax error")
+            while self.accept(","):
+                if self.suffixed_expr() not in ("name", "index"):
+                    self.error("syntax error")
+            self.expect("=")
+            self.explist()
+        elif kind != "call":
+            self.error("syntax error")
+
+    # ---------- 函数 ----------
+
+    def function_body(self, is_method):
+        opener = self.expect("(")
+        outer = self.function
+        self.function = FunctionState(is_vararg=False)
+        self.enter_scope()
+        if is_method:
+            self.declare_local(Token("name", "self", opener.line, opener.column, opener.start, opener.start))
+        if not self.check(")"):
+            while True:
+                if self.accept("..."):
+                    self.function.is_vararg = True
+                    break
+                self.declare_local(self.expect_name())
+                if not self.accept(","):
+                    break
+        self.expect(")")
+        self.block()
+        self.expect("end", "to close function", opener=opener)
+        self.exit_scope()
+        self.function = outer
+
+    # ---------- 表达式 ----------
+
+    def explist(self):
+        self.expr()
+        while self.accept(","):
+            self.expr()
+
+    def expr(self, limit=0):
+        token = self.token
+        if token.value in UNARY_OPERATORS and token.type in ("op", "keyword"):
+            self.next()
+            self.expr(UNARY_PRIORITY)
+        else:
+            self.simple_expr()
+        while True:
+            op = self.token
+            if op.type not in ("op", "keyword") or op.value not in BINARY_PRIORITY:
+                return
+            left, right = BINARY_PRIORITY[op.value]
+            if left <= limit:
+                return
+            self.next()
+            self.expr(right)
+
+    def simple_expr(self):
+        token = self.token
+        if token.type in ("number", "string"):
+            self.next()
+            return
+        if token.type == "keyword" and token.value in ("nil", "true", "false"):
+            self.next()
+            return
+        if self.check("..."):
+            if not self.function.is_vararg:
+                self.error("cannot use '...' outside a vararg function")
+            self.next()
+            return
+        if self.check("{"):
+            self.table_constructor()
+            return
+        if self.check("function"):
+            self.next()
+            self.function_body(False)
+            return
+        self.suffixed_expr()
+
+    def primary_expr(self):
+        token = self.token
+        if token.type == "name":
+            self.next()
+            self.reference_name(token)
+            return "name"
+        if self.check("("):
+            opener = self.next()
+            self.expr()
+            self.expect(")", opener=opener)
+            return "paren"
+        self.error("unexpected symbol")
+
+    def suffixed_expr(self):
+        """返回表达式类别: name / index / call / paren，用于判断能否被赋值"""
+        kind = self.primary_expr()
+        while True:
+            if self.check("."):
+                self.next()
+                self.expect_name()
+                kind = "index"
+            elif self.check("["):
+                opener = self.next()
+                self.expr()
+                self.expect("]", opener=opener)
+                kind = "index"
+            elif self.check(":"):
+                self.next()
+                self.expect_name()
+                self.call_args()
+                kind = "call"
+            elif self.check("(") or self.check("{") or self.token.type == "string":
+                self.call_args()
+                kind = "call"
+            else:
+                return kind
+
+    def call_args(self):
+        if self.token.type == "string":
+            self.next()
+        elif self.check("{"):
+            self.table_constructor()
+        elif self.check("("):
+            opener = self.next()
+            if not self.check(")"):
+                self.explist()
+            self.expect(")", opener=opener)
+        else:
+            self.error("function arguments expected")
+
+    def table_constructor(self):
+        opener = self.expect("{")
+        while not self.check("}"):
+            if self.check("["):
+                self.next()
+                self.expr()
+                self.expect("]")
+                self.expect("=")
+                self.expr()
+            elif self.token.type == "name" and self.peek().value == "=" and self.peek().type == "op":
+                self.next()
+                self.next()
+                self.expr()
+            else:
+                self.expr()
+            if not (self.accept(",") or self.accept(";")):
+                break
+        self.expect("}", opener=opener)
+
+
+def parse(source):
+    """检查Lua源码语法，出错时抛出LuaSyntaxError"""
+    Parser(source).parse_chunk()
+
+
+def check_lua_syntax(source):
+    """检查Lua源码语法，返回None表示通过，否则返回错误信息dict"""
+    try:
+        parse(source)
+    except LuaSyntaxError as e:
+        return e.to_dict()
+    return None
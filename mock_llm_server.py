@@ -0,0 +1,548 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+本地模拟LLM服务器（OpenAI兼容接口），用于压测和离线调试，不消耗真实API额度
+
+支持:
+- POST /v1/chat/completions（含stream、n参数）
+- POST /v1/responses（含stream）
+- GET  /v1/models
+- 可配置的延迟分布、按token速率输出、错误注入、截断注入
+- 按模块返回固定的合法输出（Grid Planner会根据intent中的尺寸和数量生成合法布局）
+
+使用方法:
+    python mock_llm_server.py --port 8001 --latency lognormal:-0.5,0.4 --tokens-per-sec 80 --error-rate 0.02
+    然后在API配置中把 Base URL 设为 http://127.0.0.1:8001/v1，API密钥随意填写
+"""
+
+import argparse
+import json
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+
+from flask import Flask, Response, jsonify, request
+
+# 设置Windows控制台编码
+if sys.platform == 'win32':
+    try:
+        sys.stdout.reconfigure(encoding='utf-8')
+    except:
+        pass
+
+app = Flask(__name__)
+
+SETTINGS = {
+    "latency": ("fixed", [0.0]),
+    "tokens_per_sec": 0.0,
+    "error_rate": 0.0,
+    "error_codes": [429, 500, 503],
+    "truncate_rate": 0.0,
+    "seed": None,
+}
+
+_rng = random.Random()
+_rng_lock = threading.Lock()
+
+_stats_lock = threading.Lock()
+STATS = {"requests": 0, "errors": 0, "truncated": 0, "by_module": {}}
+
+
+def parse_latency(spec):
+    """
+    解析延迟分布:
+        fixed:0.5            固定0.5秒
+        uniform:0.2,1.0      均匀分布
+        normal:0.8,0.2       正态分布（均值,标准差）
+        lognormal:-0.5,0.4   对数正态分布（mu,sigma）
+    """
+    kind, _, args = spec.partition(":")
+    params = [float(v) for v in args.split(",") if v.strip()] if args else []
+    expected = {"fixed": 1, "uniform": 2, "normal": 2, "lognormal": 2}
+    if kind not in expected or len(params) != expected[kind]:
+        raise argparse.ArgumentTypeError(f"无效的延迟分布: {spec}")
+    return kind, params
+
+
+def sample_latency():
+    """按配置的分布采样一次基础延迟（秒）"""
+    kind, params = SETTINGS["latency"]
+    with _rng_lock:
+        if kind == "fixed":
+            value = params[0]
+        elif kind == "uniform":
+            value = _rng.uniform(params[0], params[1])
+        elif kind == "normal":
+            value = _rng.gauss(params[0], params[1])
+        else:
+            value = _rng.lognormvariate(params[0], params[1])
+    return max(0.0, value)
+
+
+def roll(probability):
+    """以给定概率返回True"""
+    if probability <= 0:
+        return False
+    with _rng_lock:
+        return _rng.random() < probability
+
+
+def estimate_tokens(text):
+    """粗略估算token数（约4个字符一个token）"""
+    return max(1, len(text) // 4) if text else 0
+
+
+def split_tokens(text):
+    """把文本切成用于流式输出的小片段"""
+    return [text[i:i + 4] for i in range(0, len(text), 4)]
+
+
+# ==================== 固定输出 ====================
+
+MODULE_MARKERS = [
+    ("screenwriter", "Screenwriter Agent"),
+    ("stage_design", "Stage Design Agent"),
+    ("stage_programmer", "Stage Programmer Agent"),
+    ("casting_design", "Casting Design Agent"),
+    ("character_config", "Character Config Programmer Agent"),
+    ("executive_director", "Executive Director Agent"),
+    ("intent_parser", "level requirement parser"),
+    ("grid_planner", "level layout designer"),
+]
+
+
+def detect_module(prompt):
+    """
+    根据prompt中的角色描述判断是哪个模块
+    取最先出现的标记（开头的角色描述），后面的模块在prompt中会提到前面的模块（如"Screenwriter Agent"）
+    """
+    found = [(prompt.find(marker), module_name) for module_name, marker in MODULE_MARKERS if marker in prompt]
+    if found:
+        return min(found)[1]
+    if "grid_ascii" in prompt:
+        return "grid_planner"
+    if '"counts"' in prompt and "environment_lua" in prompt:
+        return "intent_parser"
+    return "unknown"
+
+
+BLUEPRINT = {
+    "premise": "玩家扮演一名盗贼，潜入城堡偷取宝物",
+    "player_goal": "找到宝库钥匙并带着宝物离开城堡",
+    "key_locations": ["城堡大门", "巡逻走廊", "宝库"],
+    "characters": ["玩家", "守卫", "老管家"],
+    "beats": ["潜入", "获取钥匙", "打开宝库", "逃离"],
+    "success_condition": "带着宝物到达出口",
+    "failure_condition": "被守卫抓住"
+}
+
+STAGE_DESIGN = {
+    "areas": [
+        {"id": "gate", "description": "城堡大门"},
+        {"id": "hall", "description": "巡逻走廊"},
+        {"id": "vault", "description": "宝库"}
+    ],
+    "triggers": [
+        {"id": "enter_vault", "area": "vault", "event": "player_enter"},
+        {"id": "reach_exit", "area": "gate", "event": "player_enter"}
+    ]
+}
+
+CASTING_DESIGN = {
+    "actors": [
+        {"uid": "guard_1", "role": "enemy", "template": "Skeleton_Warrior"},
+        {"uid": "butler", "role": "npc", "template": "Ghost_Nun"}
+    ],
+    "items": [
+        {"uid": "vault_key", "role": "quest_item"},
+        {"uid": "treasure", "role": "goal_item"}
+    ]
+}
+
+STAGE_LUA = """local Stage = {}
+
+function Stage.Setup(ctx)
+    Env.SetEnvironment("Foggy", "Night")
+    Stage.triggers = {
+        enter_vault = { area = "vault", event = "player_enter" },
+        reach_exit = { area = "gate", event = "player_enter" }
+    }
+    return Stage.triggers
+end
+
+return Stage
+"""
+
+CAST_LUA = """Cast = {}
+local actors = {}
+
+function Cast.SpawnAll(spawn_context)
+    actors.guard_1 = Env.SpawnNPC(spawn_context.block, "Skeleton_Warrior", 5, 3, "Enemy")
+    actors.butler = Env.SpawnNPC(spawn_context.block, "Ghost_Nun", 2, 2, "Neutral")
+    return actors
+end
+
+function Cast.Get(uid)
+    return actors[uid]
+end
+
+function Cast.Say(uid, text)
+    local actor = actors[uid]
+    if actor then
+        print(uid .. ": " .. text)
+    end
+end
+
+return Cast
+"""
+
+MAIN_LUA = """local Stage = require("Stage")
+local Cast = require("Cast")
+
+local state = { beat = 1, has_key = false, done = false }
+
+local function on_enter_vault()
+    if state.has_key then
+        state.beat = 3
+    end
+end
+
+local function main()
+    local triggers = Stage.Setup({})
+    Cast.SpawnAll({ block = nil })
+    Cast.Say("butler", "小心守卫...")
+    if triggers.enter_vault then
+        on_enter_vault()
+    end
+end
+
+main()
+"""
+
+INTENT = {
+    "language": "zh",
+    "theme": "废弃墓地",
+    "grid": {"width": 20, "height": 12, "meters_per_char": 1},
+    "counts": {"enemy": 2, "npc": 1, "chest": 1, "door": 1},
+    "constraints": {
+        "must_have_path_to_door": True,
+        "chest_on_side_path": True,
+        "difficulty": "medium",
+        "notes": []
+    },
+    "environment_lua": 'Env.SetEnvironment("Foggy", "Night")'
+}
+
+
+def _find_int(pattern, text, default):
+    match = re.search(pattern, text)
+    return int(match.group(1)) if match else default
+
+
+def build_grid_layout(prompt):
+    """根据prompt中intent的尺寸和数量生成一个能通过LayoutGuard的布局"""
+    width = max(5, _find_int(r'"width"\s*:\s*(\d+)', prompt, 20))
+    height = max(5, _find_int(r'"height"\s*:\s*(\d+)', prompt, 12))
+    counts = {
+        key: _find_int(rf'"{key}"\s*:\s*(\d+)', prompt, default)
+        for key, default in (("enemy", 2), ("npc", 1), ("chest", 1), ("door", 1))
+    }
+
+    # 大地图分块生成时的区块约束：边界通道格子，以及区块内是否有起点
+    tile = re.search(r'"tile"\s*:\s*\{.*?"player_start"\s*:\s*(\d+)\s*,\s*"gates"\s*:\s*\[(.*?)\]', prompt, re.S)
+    gates = [(int(x), int(y)) for x, y in re.findall(r'"x"\s*:\s*(\d+)\s*,\s*"y"\s*:\s*(\d+)', tile.group(2))] if tile else []
+    has_start = not tile or tile.group(1) != "0"
+
+    grid = [['#'] * width for _ in range(height)]
+    for y in range(1, height - 1):
+        for x in range(1, width - 1):
+            grid[y][x] = '.'
+    for x, y in gates:
+        grid[y][x] = '.'
+
+    # 中间一道带缺口的墙，让地图不只是一个空房间（区块模式下不加，避免挡住通道）
+    mid = width // 2
+    if width >= 9 and not tile:
+        for y in range(1, height - 1):
+            grid[y][mid] = '#'
+        grid[height // 2][mid] = '.'
+
+    entities = {"player_start": None, "doors": [], "chests": [], "enemies": [], "npcs": []}
+    if has_start:
+        entities["player_start"] = {"x": 1, "y": 1}
+        grid[1][1] = 'S'
+
+    free_cells = [
+        (x, y) for y in range(1, height - 1) for x in range(1, width - 1)
+        if grid[y][x] == '.' and (x, y) != (mid, height // 2) and (x, y) != (mid - 1, height // 2)
+        and (x, y) != (mid + 1, height // 2)
+    ]
+    free_cells.sort(key=lambda c: (-c[0], c[1]))
+
+    placements = (("door", 'D', "doors", None), ("chest", 'C', "chests", None),
+                  ("enemy", 'E', "enemies", "Skeleton_Warrior"), ("npc", 'N', "npcs", "Ghost_Nun"))
+    for key, symbol, entity_key, entity_type in placements:
+        for _ in range(counts[key]):
+            if not free_cells:
+                break
+            x, y = free_cells.pop(0)
+            grid[y][x] = symbol
+            entity = {"x": x, "y": y}
+            if entity_type:
+                entity["type"] = entity_type
+            entities[entity_key].append(entity)
+
+    return {
+        "grid_meta": {"width": width, "height": height, "meters_per_char": 1, "origin": "top_left_(0,0)"},
+        "grid_ascii": [''.join(row) for row in grid],
+        "entities": entities,
+        "design_notes": ["模拟服务器生成的布局", "中间墙体留有一个缺口"]
+    }
+
+
+def canned_output(module_name, prompt):
+    """返回模块对应的固定输出文本"""
+    if module_name == "screenwriter":
+        return json.dumps(BLUEPRINT, ensure_ascii=False)
+    if module_name == "stage_design":
+        return json.dumps(STAGE_DESIGN, ensure_ascii=False)
+    if module_name == "casting_design":
+        return json.dumps(CASTING_DESIGN, ensure_ascii=False)
+    if module_name == "stage_programmer":
+        return STAGE_LUA
+    if module_name == "character_config":
+        return CAST_LUA
+    if module_name == "executive_director":
+        return MAIN_LUA
+    if module_name == "intent_parser":
+        return json.dumps(INTENT, ensure_ascii=False)
+    if module_name == "grid_planner":
+        return json.dumps(build_grid_layout(prompt), ensure_ascii=False)
+    return json.dumps({"message": "mock response"}, ensure_ascii=False)
+
+
+# ==================== 请求处理 ====================
+
+def record(module_name, error=False, truncated=False):
+    """记录统计信息"""
+    with _stats_lock:
+        STATS["requests"] += 1
+        STATS["errors"] += int(error)
+        STATS["truncated"] += int(truncated)
+        STATS["by_module"][module_name] = STATS["by_module"].get(module_name, 0) + 1
+
+
+def maybe_inject_error(module_name):
+    """按错误率返回错误响应，否则返回None"""
+    if not roll(SETTINGS["error_rate"]):
+        return None
+    with _rng_lock:
+        status = _rng.choice(SETTINGS["error_codes"])
+    record(module_name, error=True)
+    time.sleep(sample_latency())
+    return jsonify({"error": {
+        "message": f"Injected mock error {status}",
+        "type": "mock_error",
+        "code": status
+    }}), status
+
+
+def prepare_text(module_name, prompt):
+    """生成输出文本，按截断率模拟输出被max_tokens截断"""
+    text = canned_output(module_name, prompt)
+    truncated = roll(SETTINGS["truncate_rate"])
+    if truncated:
+        text = text[:max(1, len(text) * 2 // 3)]
+    record(module_name, truncated=truncated)
+    return text, truncated
+
+
+def token_delay(token_count):
+    """按token速率计算输出耗时"""
+    rate = SETTINGS["tokens_per_sec"]
+    return token_count / rate if rate > 0 else 0.0
+
+
+def sse(data):
+    """格式化一条SSE事件"""
+    return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.route('/v1/models', methods=['GET'])
+def list_models():
+    """列出模型（供连接预热等场景使用）"""
+    return jsonify({"object": "list", "data": [
+        {"id": name, "object": "model", "created": 0, "owned_by": "mock"}
+        for name in ("gpt-4", "gpt-4o", "gpt-5.1", "gpt-5.1-codex")
+    ]})
+
+
+@app.route('/v1/chat/completions', methods=['POST'])
+def chat_completions():
+    """chat.completions 接口"""
+    body = request.get_json(force=True) or {}
+    messages = body.get("messages", [])
+    prompt = "\n".join(str(m.get("content", "")) for m in messages)
+    module_name = detect_module(prompt)
+    model = body.get("model", "gpt-4")
+
+    error = maybe_inject_error(module_name)
+    if error:
+        return error
+
+    n = max(1, int(body.get("n") or 1))
+    texts = [prepare_text(module_name, prompt) for _ in range(n)]
+    prompt_tokens = estimate_tokens(prompt)
+    completion_tokens = sum(estimate_tokens(text) for text, _ in texts)
+    completion_id = f"chatcmpl-mock-{uuid.uuid4().hex[:12]}"
+    created = int(time.time())
+
+    if body.get("stream"):
+        def generate():
+            time.sleep(sample_latency())
+            delay = token_delay(1)
+            for index, (text, truncated) in enumerate(texts):
+                for piece in split_tokens(text):
+                    if delay:
+                        time.sleep(delay)
+                    yield sse({
+                        "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                        "choices": [{"index": index, "delta": {"role": "assistant", "content": piece}, "finish_reason": None}]
+                    })
+                yield sse({
+                    "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                    "choices": [{"index": index, "delta": {}, "finish_reason": "length" if truncated else "stop"}]
+                })
+            yield "data: [DONE]\n\n"
+        return Response(generate(), mimetype="text/event-stream")
+
+    time.sleep(sample_latency() + token_delay(completion_tokens))
+    return jsonify({
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": created,
+        "model": model,
+        "choices": [{
+            "index": index,
+            "message": {"role": "assistant", "content": text},
+            "finish_reason": "length" if truncated else "stop"
+        } for index, (text, truncated) in enumerate(texts)],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+    })
+
+
+@app.route('/v1/responses', methods=['POST'])
+def responses():
+    """responses 接口（codex模型）"""
+    body = request.get_json(force=True) or {}
+    prompt = body.get("input", "")
+    if not isinstance(prompt, str):
+        prompt = json.dumps(prompt, ensure_ascii=False)
+    module_name = detect_module(prompt)
+    model = body.get("model", "gpt-5.1-codex")
+
+    error = maybe_inject_error(module_name)
+    if error:
+        return error
+
+    text, truncated = prepare_text(module_name, prompt)
+    input_tokens = estimate_tokens(prompt)
+    output_tokens = estimate_tokens(text)
+    response_id = f"resp_mock_{uuid.uuid4().hex[:12]}"
+    message_id = f"msg_mock_{uuid.uuid4().hex[:12]}"
+    status = "incomplete" if truncated else "completed"
+
+    def build_response(output_text, response_status):
+        return {
+            "id": response_id,
+            "object": "response",
+            "created_at": int(time.time()),
+            "model": model,
+            "status": response_status,
+            "incomplete_details": {"reason": "max_output_tokens"} if truncated else None,
+            "output": [{
+                "type": "message",
+                "id": message_id,
+                "status": "completed",
+                "role": "assistant",
+                "content": [{"type": "output_text", "text": output_text, "annotations": []}]
+            }],
+            "parallel_tool_calls": False,
+            "tool_choice": "auto",
+            "tools": [],
+            "reasoning": body.get("reasoning"),
+            "usage": {
+                "input_tokens": input_tokens,
+                "input_tokens_details": {"cached_tokens": 0},
+                "output_tokens": output_tokens,
+                "output_tokens_details": {"reasoning_tokens": 0},
+                "total_tokens": input_tokens + output_tokens
+            }
+        }
+
+    if body.get("stream"):
+        def generate():
+            sequence = 0
+            yield sse({"type": "response.created", "sequence_number": sequence,
+                       "response": build_response("", "in_progress")})
+            time.sleep(sample_latency())
+            delay = token_delay(1)
+            for piece in split_tokens(text):
+                if delay:
+                    time.sleep(delay)
+                sequence += 1
+                yield sse({"type": "response.output_text.delta", "sequence_number": sequence,
+                           "item_id": message_id, "output_index": 0, "content_index": 0, "delta": piece})
+            sequence += 1
+            yield sse({"type": "response.completed", "sequence_number": sequence,
+                       "response": build_response(text, status)})
+        return Response(generate(), mimetype="text/event-stream")
+
+    time.sleep(sample_latency() + token_delay(output_tokens))
+    return jsonify(build_response(text, status))
+
+
+@app.route('/mock/stats', methods=['GET'])
+def mock_stats():
+    """模拟服务器的请求统计"""
+    with _stats_lock:
+        return jsonify(json.loads(json.dumps(STATS)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="本地模拟LLM服务器（OpenAI兼容）")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=parse_latency, default=("fixed", [0.0]),
+                        help="基础延迟分布，如 fixed:0.5 / uniform:0.2,1.0 / normal:0.8,0.2 / lognormal:-0.5,0.4")
+    parser.add_argument("--tokens-per-sec", type=float, default=0.0, help="输出token速率，0表示不限速")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="错误注入概率 (0-1)")
+    parser.add_argument("--error-codes", default="429,500,503", help="注入的HTTP错误码，逗号分隔")
+    parser.add_argument("--truncate-rate", type=float, default=0.0, help="截断注入概率 (0-1)")
+    parser.add_argument("--seed", type=int, default=None, help="随机种子（用于复现）")
+    args = parser.parse_args(argv)
+
+    SETTINGS.update({
+        "latency": args.latency,
+        "tokens_per_sec": args.tokens_per_sec,
+        "error_rate": args.error_rate,
+        "error_codes": [int(code) for code in args.error_codes.split(",") if code.strip()],
+        "truncate_rate": args.truncate_rate,
+        "seed": args.seed,
+    })
+    if args.seed is not None:
+        _rng.seed(args.seed)
+
+    print(f"模拟LLM服务器启动: http://{args.host}:{args.port}/v1")
+    app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+单个请求的性能分析（按需开启）
+- 各阶段的墙钟耗时（LLM调用、extract_json_from_response、LayoutGuard、prompt构造等），线程池中的阶段也会记录
+- 请求线程的cProfile CPU分析
+未开启时 stage() 只多一次ContextVar读取
+"""
+
+import cProfile
+import io
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from functools import wraps
+
+active_profiler = ContextVar("active_profiler", default=None)
+
+_NO_PROFILE = nullcontext()
+
+
+def stage(name):
+    """记录一个阶段的耗时（当前请求没有开启性能分析时什么也不做）"""
+    profiler = active_profiler.get()
+    return profiler.span(name) if profiler is not None else _NO_PROFILE
+
+
+def staged(name):
+    """装饰器：把函数的每次调用记录为一个阶段"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class RequestProfiler:
+    """
+    一次请求的性能分析
+    用法: with RequestProfiler() as profiler: ...，结束后用 report() / cpu_text() 取结果
+    """
+
+    def __init__(self, cpu=True):
+        self.spans = []
+        self.cpu = cProfile.Profile() if cpu else None
+        self.cpu_error = None
+        self.wall_ms = None
+        self._lock = threading.Lock()
+        self._started = None
+        self._token = None
+
+    @contextmanager
+    def span(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            ended = time.perf_counter()
+            with self._lock:
+                self.spans.append({
+                    "name": name,
+                    "start_ms": round((started - self._started) * 1000, 2),
+                    "duration_ms": round((ended - started) * 1000, 2),
+                    "thread": threading.current_thread().name,
+                })
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        self._token = active_profiler.set(self)
+        if self.cpu is not None:
+            try:
+                self.cpu.enable()
+            except ValueError as e:
+                # Python 3.12+ 同一时间只能有一个cProfile在运行，此时只记录阶段耗时
+                self.cpu, self.cpu_error = None, str(e)
+        return self
+
+    def __exit__(self, *exc):
+        if self.cpu is not None:
+            self.cpu.disable()
+        active_profiler.reset(self._token)
+        self.wall_ms = round((time.perf_counter() - self._started) * 1000, 2)
+        return False
+
+    def stage_summary(self):
+        """按阶段名汇总: {名称: {"count", "total_ms", "max_ms"}}，按总耗时从大到小"""
+        summary = {}
+        for span in self.spans:
+            item = summary.setdefault(span["name"], {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+            item["count"] += 1
+            item["total_ms"] = round(item["total_ms"] + span["duration_ms"], 2)
+            item["max_ms"] = max(item["max_ms"], span["duration_ms"])
+        return dict(sorted(summary.items(), key=lambda kv: -kv[1]["total_ms"]))
+
+    def cpu_top(self, limit=30):
+        """CPU分析中累计耗时最多的函数"""
+        if self.cpu is None:
+            return []
+        stats = pstats.Stats(self.cpu)
+        rows = []
+        for (filename, line, function), (_, calls, tottime, cumtime, _) in stats.stats.items():
+            rows.append({
+                "function": f"{function} ({os.path.basename(filename)}:{line})",
+                "calls": calls,
+                "tottime_ms": round(tottime * 1000, 3),
+                "cumtime_ms": round(cumtime * 1000, 3),
+            })
+        rows.sort(key=lambda row: -row["cumtime_ms"])
+        return rows[:limit]
+
+    def cpu_text(self, limit=40):
+        """pstats格式的文本报告（按累计耗时排序）"""
+        if self.cpu is None:
+            return f"CPU分析不可用: {self.cpu_error}\n" if self.cpu_error else ""
+        out = io.StringIO()
+        pstats.Stats(self.cpu, stream=out).strip_dirs().sort_stats("cumulative").print_stats(limit)
+        return out.getvalue()
+
+    def report(self, limit=30):
+        return {
+            "wall_ms": self.wall_ms,
+            "stages": self.stage_summary(),
+            "spans": sorted(self.spans, key=lambda span: span["start_ms"]),
+            "cpu_top": self.cpu_top(limit),
+            "cpu_error": self.cpu_error,
+        }
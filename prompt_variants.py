@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Prompt变体A/B实验：模块可以配置多个prompt变体及流量权重，每次运行按运行ID分配变体，
+按变体统计耗时、Token用量、JSON解析成功率和LayoutGuard首次验证通过率
+
+模块配置示例:
+    "grid_planner": {
+        "prompt_template": "...",          # default变体
+        "prompt_variants": {
+            "default": {"weight": 3},
+            "short": {"weight": 1, "prompt_template": "...", "system_prompt": "..."}
+        }
+    }
+变体中未设置的字段沿用模块配置；没有列出default时default的权重为1，权重为0的变体不再分配流量
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextvars import ContextVar
+
+from artifact_store import atomic_write
+from usage_stats import _mean, percentile
+
+EXPERIMENTS_FILE = "prompt_experiments.jsonl"
+
+DEFAULT_VARIANT = "default"
+
+# 变体可以覆盖的模块配置字段
+VARIANT_FIELDS = ("prompt_template", "system_prompt")
+
+# 当前运行分配到的变体 {模块名: 变体名}，线程池任务用 log_utils.in_context 包装后同样可见
+active_variants = ContextVar("prompt_variants", default=None)
+
+
+def module_variants(module_config):
+    """模块的变体及权重 [(变体名, 权重)]，没有配置变体时返回空列表"""
+    variants = module_config.get("prompt_variants") or {}
+    if not variants:
+        return []
+    weights = [(DEFAULT_VARIANT, 1.0)] if DEFAULT_VARIANT not in variants else []
+    weights += [(name, float(variant.get("weight", 1))) for name, variant in variants.items()]
+    return [(name, weight) for name, weight in weights if weight > 0]
+
+
+def choose_variant(module_config, seed):
+    """按权重选择变体（同一个seed总是得到同一个变体，继续运行时变体不变）"""
+    weighted = module_variants(module_config)
+    if not weighted:
+        return None
+    total = sum(weight for _, weight in weighted)
+    digest = hashlib.sha256(seed.encode('utf-8')).digest()
+    point = int.from_bytes(digest[:8], "big") / 2 ** 64 * total
+    for name, weight in weighted:
+        point -= weight
+        if point < 0:
+            return name
+    return weighted[-1][0]
+
+
+def assign_variants(config, run_id):
+    """给一次运行的各模块分配变体 {模块名: 变体名}（只包含配置了变体的模块）"""
+    assignments = {}
+    for module_name, module_config in config.get("modules", {}).items():
+        variant = choose_variant(module_config, f"{run_id}:{module_name}")
+        if variant is not None:
+            assignments[module_name] = variant
+    return assignments
+
+
+def bind_variants(assignments):
+    """绑定当前运行的变体分配（之后的prompt构造和统计都使用这些变体）"""
+    active_variants.set(assignments or {})
+
+
+def current_variant(module_name):
+    """当前运行中模块分配到的变体，没有配置变体时为None"""
+    return (active_variants.get() or {}).get(module_name)
+
+
+def variant_field(module_config, module_name, field, default=None):
+    """当前变体中的字段，变体未设置时沿用模块配置"""
+    variant = current_variant(module_name)
+    if variant and variant != DEFAULT_VARIANT:
+        overrides = (module_config.get("prompt_variants") or {}).get(variant, {})
+        if field in overrides:
+            return overrides[field]
+    return module_config.get(field, default)
+
+
+class ExperimentStats:
+    """
+    按 (模块, 变体) 保存最近 window 个样本，样本追加写入JSONL文件
+    样本分两类: call（一次LLM调用）和 check（一次校验，如LayoutGuard首次验证）
+    """
+
+    def __init__(self, root="output", window=1000):
+        self.path = os.path.join(root, EXPERIMENTS_FILE) if root else None
+        self.window = window
+        self._lock = threading.Lock()
+        self._samples = defaultdict(lambda: deque(maxlen=self.window))
+        if self.path and os.path.exists(self.path):
+            self._load()
+
+    def _load(self):
+        total = 0
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    sample = json.loads(line)
+                except ValueError:
+                    continue
+                total += 1
+                self._samples[(sample["module"], sample["variant"])].append(sample)
+        kept = sum(len(samples) for samples in self._samples.values())
+        if total > kept * 2:
+            lines = [json.dumps(s, ensure_ascii=False) + "\n" for samples in self._samples.values() for s in samples]
+            atomic_write(self.path, "".join(lines).encode('utf-8'))
+
+    def _append(self, sample):
+        with self._lock:
+            self._samples[(sample["module"], sample["variant"])].append(sample)
+            if self.path:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(sample, ensure_ascii=False) + "\n")
+
+    def record_call(self, module, variant, latency, input_tokens=None, output_tokens=None, json_failed=None):
+        """记录一次LLM调用（json_failed为None表示该模块不是JSON模式）"""
+        self._append({
+            "kind": "call",
+            "module": module,
+            "variant": variant,
+            "time": time.time(),
+            "latency": round(latency, 4),
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "json_failed": json_failed,
+        })
+
+    def record_check(self, module, variant, check, passed):
+        """记录一次校验结果（如 layout_guard_first_attempt）"""
+        self._append({
+            "kind": "check",
+            "module": module,
+            "variant": variant,
+            "time": time.time(),
+            "check": check,
+            "passed": bool(passed),
+        })
+
+    def samples(self, module, variant):
+        with self._lock:
+            return list(self._samples.get((module, variant), ()))
+
+    def variants(self, module):
+        with self._lock:
+            return sorted(variant for name, variant in self._samples if name == module)
+
+    def summary(self, module, variant):
+        """某个变体的统计"""
+        samples = self.samples(module, variant)
+        calls = [s for s in samples if s["kind"] == "call"]
+        latencies = [s["latency"] for s in calls]
+        input_tokens = [s["input_tokens"] for s in calls if s.get("input_tokens") is not None]
+        output_tokens = [s["output_tokens"] for s in calls if s.get("output_tokens") is not None]
+        json_calls = [s for s in calls if s.get("json_failed") is not None]
+        checks = defaultdict(list)
+        for s in samples:
+            if s["kind"] == "check":
+                checks[s["check"]].append(1.0 if s["passed"] else 0.0)
+        return {
+            "calls": len(calls),
+            "latency_s": {"mean": _mean(latencies), "p50": percentile(latencies, 50), "p95": percentile(latencies, 95)},
+            "input_tokens_mean": _mean(input_tokens),
+            "output_tokens_mean": _mean(output_tokens),
+            "json_success_rate": _mean([0.0 if s["json_failed"] else 1.0 for s in json_calls]),
+            "checks": {name: {"samples": len(values), "pass_rate": _mean(values)} for name, values in checks.items()},
+        }
+
+    def compare(self, modules_config, min_samples=20):
+        """
+        各模块的变体对比（配置了变体或已有样本的模块）
+        样本数不少于min_samples的变体中，给出平均耗时最低的变体和JSON解析成功率/校验通过率最高的变体
+        """
+        report = {}
+        for module in sorted({name for name, config in modules_config.items() if module_variants(config)}
+                             | {name for name, _ in self._snapshot_keys()}):
+            weights = dict(module_variants(modules_config.get(module, {})))
+            entries = {}
+            for variant in sorted(set(weights) | set(self.variants(module))):
+                entry = self.summary(module, variant)
+                entry["weight"] = weights.get(variant, 0.0)
+                entries[variant] = entry
+            eligible = {name: entry for name, entry in entries.items() if entry["calls"] >= min_samples}
+            report[module] = {
+                "variants": entries,
+                "fastest": min(eligible, key=lambda name: eligible[name]["latency_s"]["mean"]) if eligible else None,
+                "most_reliable": max(eligible, key=lambda name: _reliability(eligible[name])) if eligible else None,
+            }
+        return report
+
+    def _snapshot_keys(self):
+        with self._lock:
+            return list(self._samples)
+
+
+def _reliability(entry):
+    """可靠性：JSON解析成功率和各项校验通过率中最低的一个（都没有时为1）"""
+    rates = [entry["json_success_rate"]] + [check["pass_rate"] for check in entry["checks"].values()]
+    rates = [rate for rate in rates if rate is not None]
+    return min(rates) if rates else 1.0
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+生成接口的响应详略（detail）
+- full: 返回全部结果（默认，与之前相同）
+- summary: 最终产物 + 状态和统计信息，中间产物（蓝图、场务设计、Intent、布局等）只返回获取地址
+- final: 只返回最终产物（Lua代码）
+也可以用 fields 指定只返回哪些结果字段。完整结果保存在运行目录中，之后按运行ID通过
+GET /api/runs/<run_id>/results/<字段> 获取
+"""
+
+DETAIL_LEVELS = ("final", "summary", "full")
+
+# 各流水线的最终产物
+FINAL_FIELDS = {
+    "script": ("stage_lua", "cast_lua", "main_lua"),
+    "level": ("level_lua",),
+}
+
+# summary中原样返回的字段（状态和统计信息）
+SUMMARY_FIELDS = ("prompt_variants", "lua_checks", "bundle", "layout_source", "layout_score", "layout_candidates",
+                  "navigation", "world")
+
+# summary中去掉大字段后返回的字段 {字段: 去掉的子字段}
+SUMMARY_TRIMMED = {
+    "validated_result": ("layout",),
+    "level_export": ("data_base64",),
+}
+
+
+def results_url(run_id, field=None):
+    """按运行ID获取完整结果（或某个字段）的地址"""
+    url = f"/api/runs/{run_id}/results"
+    return f"{url}/{field}" if field else url
+
+
+def parse_detail(data, config):
+    """
+    读取请求中的 detail 和 fields（未指定detail时使用配置 response.detail）
+    返回: ((detail, fields), None)，参数无效时返回 (None, (错误信息, HTTP状态码))
+    """
+    detail = data.get("detail") or config.get("response", {}).get("detail", "full")
+    if detail not in DETAIL_LEVELS:
+        return None, (f"无效的detail: {detail}，可选值为 {'、'.join(DETAIL_LEVELS)}", 400)
+    fields = data.get("fields")
+    if isinstance(fields, str):
+        fields = [name.strip() for name in fields.split(",") if name.strip()]
+    if fields is not None and not (isinstance(fields, list) and all(isinstance(name, str) for name in fields)):
+        return None, ("fields必须是字段名列表或逗号分隔的字符串", 400)
+    return (detail, fields), None
+
+
+def shape_results(results, pipeline, run_id, detail="full", fields=None):
+    """按详略裁剪结果（返回新的字典，不修改传入的结果，进行中请求合并时多个请求共享同一份结果）"""
+    if fields is not None:
+        return {name: results[name] for name in fields if name in results}
+    if detail == "full":
+        return results
+    final = FINAL_FIELDS.get(pipeline, ())
+    shaped = {name: results[name] for name in final if name in results}
+    if detail == "final":
+        return shaped
+    for name, value in results.items():
+        if name in final:
+            continue
+        if name in SUMMARY_FIELDS:
+            shaped[name] = value
+        elif name in SUMMARY_TRIMMED and isinstance(value, dict):
+            shaped[name] = {key: item for key, item in value.items() if key not in SUMMARY_TRIMMED[name]}
+        else:
+            shaped[name] = reference(run_id, name, value)
+    return shaped
+
+
+def reference(run_id, field, value):
+    """中间产物的引用：获取地址，JSON解析失败的输出附带错误信息和原始文本长度（原始文本只保存在结果文件中）"""
+    ref = {"ref": results_url(run_id, field)}
+    if isinstance(value, dict) and value.get("error") == "Failed to parse JSON":
+        ref.update(error=value["error"], error_message=value.get("error_message"),
+                   raw_chars=len(value.get("raw") or ""))
+    return ref
+
+
+def shape_payload(payload, pipeline, detail="full", fields=None):
+    """按详略裁剪生成接口的响应（失败的响应原样返回）"""
+    if not payload.get("success") or (detail == "full" and fields is None):
+        return payload
+    shaped = dict(payload, results=shape_results(payload.get("results") or {}, pipeline, payload["run_id"],
+                                                 detail, fields))
+    shaped["detail"] = "fields" if fields is not None else detail
+    shaped["results_url"] = results_url(payload["run_id"])
+    return shaped
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+流水线检查点：每个模块完成后立即把输出持久化到运行目录，失败后可以从第一个未完成的模块继续
+"""
+
+from artifact_store import new_run_id
+from log_utils import get_logger
+
+log = get_logger("checkpoint")
+
+
+class RunCheckpoints:
+    """
+    一次流水线运行的检查点
+    - step(name, func): 已有检查点时直接返回保存的输出，否则执行func并保存
+    - mark(status, ...): 在运行清单的meta中记录运行状态（running/failed/completed）
+    """
+
+    def __init__(self, store, pipeline, run_id=None, checkpoints=None, meta=None):
+        self.store = store
+        self.pipeline = pipeline
+        self.run_id = run_id or new_run_id()
+        self.checkpoints = checkpoints or {}
+        self.meta = meta or {}
+        self.current = None
+        self.restored = []
+
+    @classmethod
+    def start(cls, store, pipeline, request_data):
+        """新建运行，记录请求参数（继续运行时使用）"""
+        run = cls(store, pipeline)
+        run.mark("running", request=request_data)
+        return run
+
+    @classmethod
+    def resume(cls, store, run_id):
+        """加载已有运行的检查点，运行不存在或没有记录请求参数时返回None"""
+        manifest = store.load_manifest(run_id)
+        if not manifest or "request" not in manifest.get("meta", {}):
+            return None
+        return cls(store, manifest["pipeline"], run_id,
+                   checkpoints=store.load_checkpoints(run_id, manifest), meta=manifest["meta"])
+
+    @property
+    def request(self):
+        return self.meta.get("request", {})
+
+    def step(self, name, func, keep=None):
+        """
+        执行一个步骤，已完成的步骤直接使用检查点
+        keep: 判断输出是否值得保存的函数（例如JSON解析失败的输出不保存，继续运行时重新生成）
+        """
+        if name in self.checkpoints:
+            log.info("使用检查点: %s", name)
+            self.restored.append(name)
+            return self.checkpoints[name]
+        self.current = name
+        value = func()
+        if keep is None or keep(value):
+            self.save(name, value)
+        self.current = None
+        return value
+
+    def save(self, name, value):
+        """保存（或覆盖）一个检查点"""
+        self.store.save_checkpoint(self.run_id, self.pipeline, name, value)
+        self.checkpoints[name] = value
+
+    def mark(self, status, **meta):
+        """更新运行状态"""
+        meta["status"] = status
+        self.meta.update(meta)
+        self.store.save_run(self.pipeline, {}, run_id=self.run_id, meta=meta)
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+启动耗时记录：导入、应用初始化和后台预热各阶段的耗时，供 /api/startup 和 bench_startup.py 使用
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+
+class StartupTimeline:
+    """
+    启动各阶段的耗时（毫秒）
+    - phase(name): 记录一个阶段，阶段抛出的异常记入errors后不再向外抛出（预热失败不影响服务）
+    - mark(state): 切换状态（cold: 未预热，warming: 预热中，ready: 预热完成）
+    """
+
+    def __init__(self, started=None):
+        self.started = started if started is not None else time.perf_counter()
+        self.phases = []
+        self.errors = {}
+        self.details = {}
+        self.state = "starting"
+        self.ready_ms = None
+        self._lock = threading.Lock()
+
+    def elapsed_ms(self):
+        return round((time.perf_counter() - self.started) * 1000, 2)
+
+    def record(self, name, duration_ms, at_ms=None):
+        with self._lock:
+            self.phases.append({
+                "name": name,
+                "at_ms": self.elapsed_ms() if at_ms is None else at_ms,
+                "duration_ms": round(duration_ms, 2),
+            })
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            with self._lock:
+                self.errors[name] = str(e)
+        finally:
+            self.record(name, (time.perf_counter() - started) * 1000)
+
+    def mark(self, state):
+        with self._lock:
+            self.state = state
+            if state == "ready":
+                self.ready_ms = self.elapsed_ms()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "state": self.state,
+                "ready": self.state == "ready",
+                "uptime_ms": self.elapsed_ms(),
+                "ready_ms": self.ready_ms,
+                "phases": list(self.phases),
+                "errors": dict(self.errors),
+                "details": dict(self.details),
+            }
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+测试产物存储（运行目录隔离、内容去重、垃圾回收）
+"""
+
+import os
+import tempfile
+import time
+
+from artifact_store import ArtifactStore
+
+
+def test_runs_are_isolated_and_deduplicated():
+    """不同运行互不覆盖，相同内容只存一份"""
+    with tempfile.TemporaryDirectory() as root:
+        store = ArtifactStore(root)
+        run_a, files_a = store.save_run("script", {"main.lua": "print(1)", "Stage.lua": "local s = 1"})
+        run_b, files_b = store.save_run("script", {"main.lua": "print(2)", "Stage.lua": "local s = 1"})
+
+        assert run_a != run_b
+        with open(store.get_file_path(run_a, "main.lua"), encoding='utf-8') as f:
+            assert f.read() == "print(1)"
+        with open(store.get_file_path(run_b, "main.lua"), encoding='utf-8') as f:
+            assert f.read() == "print(2)"
+
+        manifest_a = store.load_manifest(run_a)
+        manifest_b = store.load_manifest(run_b)
+        assert manifest_a["files"]["Stage.lua"]["sha256"] == manifest_b["files"]["Stage.lua"]["sha256"]
+        object_count = sum(len(files) for _, _, files in os.walk(os.path.join(root, "objects")))
+        assert object_count == 3
+
+
+def test_rejects_unknown_files_and_bad_run_ids():
+    """只能下载清单中登记过的文件"""
+    with tempfile.TemporaryDirectory() as root:
+        store = ArtifactStore(root)
+        run_id, _ = store.save_run("level", {"Level.lua": "-- level", "Empty.lua": "  "})
+        assert store.get_file_path(run_id, "Empty.lua") is None
+        assert store.get_file_path(run_id, "manifest.json") is None
+        assert store.get_file_path("../" + run_id, "Level.lua") is None
+
+
+def test_gc_by_age_and_size():
+    """按年龄和总大小回收旧运行及其不再被引用的内容"""
+    with tempfile.TemporaryDirectory() as root:
+        store = ArtifactStore(root)
+        old_run, _ = store.save_run("level", {"Level.lua": "a" * 1000})
+        new_run, _ = store.save_run("level", {"Level.lua": "b" * 1000})
+
+        removed = []
+        store.gc_listeners.append(removed.extend)
+        store.max_age_hours = 1
+        result = store.gc(now=time.time() + 7200)
+        assert set(result["removed_runs"]) == {old_run, new_run}
+        assert removed == result["removed_runs"]
+        assert result["removed_objects"] == 2
+
+        runs = [store.save_run("level", {"Level.lua": str(i) * 600 * 1024})[0] for i in range(3)]
+        store.max_age_hours = None
+        store.max_total_mb = 1
+        result = store.gc()
+        assert result["removed_runs"] == runs[:2]
+        assert store.list_runs() == runs[2:]
+
+
+def test_index_pagination_and_filters():
+    """索引随写入更新，游标分页不重复不遗漏，回收后同步删除"""
+    with tempfile.TemporaryDirectory() as root:
+        store = ArtifactStore(root)
+        level_runs = [store.save_run("level", {"Level.lua": "x" * (i + 1)})[0] for i in range(7)]
+        store.save_run("script", {"main.lua": "print(1)", "Cast.lua": "return {}"})
+
+        seen = []
+        cursor = None
+        while True:
+            rows, cursor = store.index.list(limit=3, cursor=cursor, pipeline="level")
+            seen.extend(row["run_id"] for row in rows)
+            if not cursor:
+                break
+        assert sorted(seen) == sorted(level_runs)
+        assert len(seen) == len(set(seen))
+
+        rows, _ = store.index.list(sort="size", order="desc", limit=1)
+        assert rows[0]["size"] == 9
+
+        rows, _ = store.index.list(run_id=level_runs[0])
+        assert [row["name"] for row in rows] == ["Level.lua"]
+
+        store.max_total_mb = 1e-9
+        store.gc()
+        assert store.index.is_empty()
+
+        # 索引丢失时从清单重建
+        store.save_run("level", {"Level.lua": "y"})
+        os.remove(store.index.path)
+        assert len(ArtifactStore(root).index.list()[0]) == 1
+
+
+if __name__ == '__main__':
+    test_runs_are_isolated_and_deduplicated()
+    test_rejects_unknown_files_and_bad_run_ids()
+    test_gc_by_age_and_size()
+    test_index_pagination_and_filters()
+    print("✅ 产物存储测试通过")
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+测试批量生成命令行（读取JSONL、并发执行、输出记录、断点续跑）
+"""
+
+import io
+import json
+import os
+import sys
+from contextlib import redirect_stdout
+
+import batch_cli
+from mock_llm_server import build_grid_layout
+from testkit import run_tests
+
+
+def flaky_llm(flaky_inputs):
+    """假的LLM调用（flaky_inputs中的关卡第一次调用Grid Planner时失败）"""
+    failed = set()
+
+    def fake_call(module_name, prompt, config, system_prompt=None, n=1):
+        if module_name == "intent_parser":
+            return {"theme": prompt, "grid": {"width": 10, "height": 8},
+                    "counts": {"enemy": 1, "npc": 0, "chest": 1, "door": 1}}
+        for text in flaky_inputs:
+            if text in prompt and text not in failed:
+                failed.add(text)
+                raise ValueError("模拟的接口错误")
+        return build_grid_layout(prompt)
+
+    return fake_call
+
+
+def write_jsonl(path, rows):
+    with open(path, 'w', encoding='utf-8') as f:
+        for row in rows:
+            f.write((json.dumps(row, ensure_ascii=False) if row is not None else "") + "\n")
+
+
+def test_read_rows(tmp_path):
+    """字符串行、默认ID、空行；重复ID和无效流水线报错"""
+    path = str(tmp_path / "in.jsonl")
+    write_jsonl(path, ["盗贼潜入城堡", None, {"id": "lvl", "user_input": "地牢", "pipeline": "level"}])
+    assert batch_cli.read_rows(path, "script") == [
+        ("line-1", "script", {"user_input": "盗贼潜入城堡"}),
+        ("lvl", "level", {"id": "lvl", "user_input": "地牢", "pipeline": "level"}),
+    ]
+    for bad in ([{"id": "a", "user_input": "x"}, {"id": "a", "user_input": "y"}], [{"user_input": "x", "pipeline": "z"}]):
+        write_jsonl(path, bad)
+        try:
+            batch_cli.read_rows(path, "script")
+            assert False, "应该报错"
+        except ValueError:
+            pass
+
+
+def test_batch_run_and_resume(app_env):
+    """第一次运行失败的行在第二次运行时从检查点继续，成功的行不再执行"""
+    root = app_env.root
+    config = {"api_config": {"api_key": "k"}, "modules": {"intent_parser": {"prompt_template": "解析: {user_input}", "json_mode": True},
+                                                    "grid_planner": {"json_mode": True}},
+              "idea_cache": {"enabled": False}, "logging": {"level": "ERROR"}}
+    with open(os.path.join(root, "config.json"), 'w', encoding='utf-8') as f:
+        json.dump(config, f)
+    source = os.path.join(root, "levels.jsonl")
+    write_jsonl(source, [
+        {"id": "small", "user_input": "10x8的地牢"},
+        {"id": "flaky", "user_input": "不稳定的墓地"},
+        {"id": "bad", "user_input": "城堡", "candidates": 99},
+    ])
+    argv = [source, "--pipeline", "level", "--parallel", "2", "--config", os.path.join(root, "config.json"),
+            "--output-dir", os.path.join(root, "output"), "--log-level", "CRITICAL"]
+    output = os.path.join(root, "levels.results.jsonl")
+
+    app_env.fake_llm(flaky_llm(["不稳定的墓地"]))
+    with redirect_stdout(io.StringIO()) as out:
+        assert batch_cli.main(argv + ["--include-results"]) == 1
+        first = batch_cli.load_previous(output)
+        assert first["small"]["status"] == "ok" and "Level.lua" in first["small"]["saved_files"]
+        assert first["small"]["results"]["validated_result"]["status"] == "valid"
+        assert first["flaky"]["status"] == "error" and first["flaky"]["run_id"]
+        assert first["bad"]["error"] == "candidates必须在1到8之间"
+        assert "条/分钟" in out.getvalue() and "预计剩余" in out.getvalue()
+
+        assert batch_cli.main(argv) == 1
+        second = batch_cli.load_previous(output)
+    assert second["flaky"]["status"] == "ok" and second["flaky"]["run_id"] == first["flaky"]["run_id"]
+    assert second["flaky"]["resumed_steps"] == ["intent"]
+    assert os.path.exists(os.path.join(second["flaky"]["output_dir"], "Level.lua"))
+    with open(output, encoding='utf-8') as f:
+        assert [json.loads(line)["id"] for line in f].count("small") == 1
+
+
+if __name__ == '__main__':
+    sys.exit(run_tests(__file__, "✅ 批量生成命令行测试通过"))
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+测试响应压缩与条件GET
+"""
+
+import gzip
+import io
+
+from flask import Flask, jsonify, send_file
+
+from http_cache import init_http_cache
+
+
+def create_test_app():
+    """创建只包含两个接口的测试应用"""
+    app = Flask(__name__)
+
+    @app.route('/bundle')
+    def bundle():
+        return jsonify({"prompt_template": "x" * 5000})
+
+    @app.route('/download')
+    def download():
+        return send_file(io.BytesIO(b"print(1)\n" * 1000), mimetype="text/x-lua", etag="lua-v1")
+
+    @app.route('/small')
+    def small():
+        return jsonify({"ok": True})
+
+    init_http_cache(app, etag_endpoints={"bundle", "download"})
+    return app
+
+
+def test_gzip_roundtrip_and_304():
+    """压缩内容可还原，压缩与未压缩响应的ETag都能命中304"""
+    client = create_test_app().test_client()
+
+    plain = client.get('/bundle')
+    assert plain.headers.get("Content-Encoding") is None
+    assert plain.headers["ETag"]
+
+    compressed = client.get('/bundle', headers={"Accept-Encoding": "gzip"})
+    assert compressed.headers["Content-Encoding"] in ("gzip", "br")
+    assert "Accept-Encoding" in compressed.headers["Vary"]
+    if compressed.headers["Content-Encoding"] == "gzip":
+        assert gzip.decompress(compressed.data) == plain.data
+    assert len(compressed.data) < len(plain.data)
+
+    for etag in (plain.headers["ETag"], compressed.headers["ETag"]):
+        cached = client.get('/bundle', headers={"Accept-Encoding": "gzip", "If-None-Match": etag})
+        assert cached.status_code == 304
+        assert cached.data == b""
+
+
+def test_small_responses_and_unlisted_endpoints():
+    """小响应不压缩，未登记的接口不加ETag"""
+    client = create_test_app().test_client()
+    response = client.get('/small', headers={"Accept-Encoding": "gzip"})
+    assert response.headers.get("Content-Encoding") is None
+    assert response.headers.get("ETag") is None
+
+
+class SizedFileWrapper:
+    """带长度的wsgi.file_wrapper（部分WSGI服务器提供），这样的文件响应不算流式响应"""
+
+    def __init__(self, file, buffer_size=8192):
+        self.file = file
+
+    def __len__(self):
+        return 1  # 整个文件作为一个数据块
+
+    def __iter__(self):
+        yield self.file.read()
+
+
+def test_file_responses_are_not_compressed():
+    """send_file的文件响应直接发送，不读进内存压缩，条件请求仍由send_file处理"""
+    client = create_test_app().test_client()
+    for environ in ({}, {"wsgi.file_wrapper": SizedFileWrapper}):
+        response = client.get('/download', headers={"Accept-Encoding": "gzip"}, environ_overrides=environ)
+        assert response.headers.get("Content-Encoding") is None
+        assert response.data == b"print(1)\n" * 1000
+        cached = client.get('/download', headers={"If-None-Match": response.headers["ETag"]},
+                            environ_overrides=environ)
+        assert cached.status_code == 304
+
+if __name__ == '__main__':
+    test_gzip_roundtrip_and_304()
+    test_small_responses_and_unlisted_endpoints()
+    test_file_responses_are_not_compressed()
+    print("✅ 响应压缩与条件GET测试通过")
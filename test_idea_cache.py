@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+测试相似想法索引（归一化、LSH查找、持久化）
+"""
+
+import json
+import os
+import random
+import tempfile
+import time
+
+from idea_cache import INDEX_FILE, IdeaIndex, normalize_idea
+
+BASE_IDEA = "玩家扮演一个盗贼，需要潜入城堡偷取宝物，避开守卫和陷阱"
+EXTRA_CHARS = "夜晚白天雨雪风暴村庄骑士巫师钥匙地图宝箱龙剑盾"
+
+
+def near_duplicates(count, rng):
+    """在同一个想法中随机插入1~3个字，得到大量近似重复的想法"""
+    ideas = []
+    for _ in range(count):
+        chars = list(BASE_IDEA)
+        for _ in range(rng.randint(1, 3)):
+            chars.insert(rng.randrange(len(chars)), rng.choice(EXTRA_CHARS))
+        ideas.append("".join(chars))
+    return ideas
+
+
+def test_normalize_ignores_punctuation_and_width():
+    """全角半角、大小写和标点不影响归一化结果"""
+    assert normalize_idea("盗贼，潜入 城堡！ABC") == normalize_idea("盗贼,潜入城堡!abc")
+
+
+def test_lookup_finds_near_duplicates():
+    """相似想法能找到，无关想法、不同配置版本和被排除的运行不命中"""
+    index = IdeaIndex(None)
+    index.add("玩家扮演一个盗贼，需要潜入城堡偷取宝物，避开守卫和陷阱", "run-a", config_version="v1")
+    index.add("玩家在迷雾森林中寻找失踪的妹妹", "run-b", config_version="v1")
+
+    match = index.lookup("玩家扮演一个盗贼，需要潜入城堡偷取宝物，避开守卫与陷阱", threshold=0.8)
+    assert match is not None and match.run_id == "run-a"
+    assert 0.8 <= match.similarity < 1.0
+
+    assert index.lookup("玩家扮演骑士，在雪山上和巨龙战斗", threshold=0.5) is None
+    assert index.lookup("玩家在迷雾森林中寻找失踪的妹妹", config_version="v2") is None
+    assert index.lookup("玩家在迷雾森林中寻找失踪的妹妹", exclude={"run-b"}) is None
+    assert index.lookup("玩家在迷雾森林中寻找失踪的妹妹", pipeline="level") is None
+
+
+def test_index_persists():
+    """重新加载后仍能查到之前登记的想法"""
+    with tempfile.TemporaryDirectory() as root:
+        IdeaIndex(root).add("一个废弃工厂里的逃脱故事", "run-a")
+        reloaded = IdeaIndex(root)
+        assert len(reloaded) == 1
+        assert reloaded.lookup("一个废弃工厂里的逃脱故事。").run_id == "run-a"
+        assert reloaded.lookup("一个废弃工厂里的逃脱故事啊", threshold=0.8).run_id == "run-a"
+
+
+def test_lookup_among_many_near_duplicates():
+    """大量近似重复的想法中仍能找到真正相似的那条，查询只对有限的候选计算相似度"""
+    rng = random.Random(0)
+    index = IdeaIndex(None)
+    for i, idea in enumerate(near_duplicates(5000, rng)):
+        index.add(idea, f"run-{i}")
+    target = BASE_IDEA[:10] + "龙" + BASE_IDEA[10:20] + "剑" + BASE_IDEA[20:]
+    index.add(target, "run-target")
+    for i, idea in enumerate(near_duplicates(2000, rng)):
+        index.add(idea, f"run-late-{i}")
+
+    query = target[:25] + "盾" + target[25:]
+    started = time.perf_counter()
+    match = index.lookup(query, threshold=0.85)
+    elapsed = time.perf_counter() - started
+    assert match is not None and match.run_id == "run-target"
+    assert elapsed < 0.05
+
+
+def test_remove_runs_compacts_file():
+    """删除回收的运行后重写索引文件，重新加载后不再包含这些运行"""
+    with tempfile.TemporaryDirectory() as root:
+        index = IdeaIndex(root)
+        index.add("一个废弃工厂里的逃脱故事", "run-a")
+        index.add("玩家在迷雾森林中寻找失踪的妹妹", "run-b")
+        assert index.remove_runs(["run-a", "run-x"]) == 1
+        assert index.remove_runs([]) == 0
+        assert index.lookup("一个废弃工厂里的逃脱故事") is None
+        assert index.lookup("玩家在迷雾森林中寻找失踪的妹妹").run_id == "run-b"
+        with open(os.path.join(root, INDEX_FILE), 'r', encoding='utf-8') as f:
+            assert [json.loads(line)["run_id"] for line in f] == ["run-b"]
+        assert len(IdeaIndex(root)) == 1
+
+
+def test_old_signatures_are_recomputed():
+    """旧版本签名的记录加载时按归一化文本重新计算签名"""
+    with tempfile.TemporaryDirectory() as root:
+        record = {"idea": "一个废弃工厂里的逃脱故事", "normalized": normalize_idea("一个废弃工厂里的逃脱故事"),
+                  "run_id": "run-a", "pipeline": "script", "config_version": None, "created_at": 1.0,
+                  "sig": "AAAAAA=="}
+        with open(os.path.join(root, INDEX_FILE), 'w', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        assert IdeaIndex(root).lookup("一个废弃工厂里的逃脱故事啊", threshold=0.8).run_id == "run-a"
+
+
+if __name__ == '__main__':
+    test_normalize_ignores_punctuation_and_width()
+    test_lookup_finds_near_duplicates()
+    test_index_persists()
+    test_lookup_among_many_near_duplicates()
+    test_remove_runs_compacts_file()
+    test_old_signatures_are_recomputed()
+    print("✅ 相似想法索引测试通过")
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+测试Grid Planner多候选生成（一次调用用n参数生成全部候选，不支持n时改为并行调用）
+"""
+
+import json
+import sys
+from types import SimpleNamespace
+
+import app
+from mock_llm_server import build_grid_layout
+from testkit import run_tests
+
+LAYOUT = json.dumps(build_grid_layout('"intent": {"grid": {"width": 12, "height": 8}}'))
+
+
+class FakeClient:
+    """记录请求参数的假客户端；reject_n为True时像不支持n参数的模型一样报错"""
+
+    def __init__(self, reject_n=False):
+        self.calls = []
+        self.reject_n = reject_n
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+        self.responses = SimpleNamespace(create=self.create_response)
+
+    def create(self, **params):
+        self.calls.append(params)
+        n = params.get("n", 1)
+        if self.reject_n and n > 1:
+            raise Exception("Error code: 400 - Unsupported parameter: 'n' is not supported with this model.")
+        choices = [SimpleNamespace(message=SimpleNamespace(content="不是JSON" if i == 1 else LAYOUT),
+                                   finish_reason="stop") for i in range(n)]
+        usage = SimpleNamespace(prompt_tokens=900, completion_tokens=300 * n, completion_tokens_details=None)
+        return SimpleNamespace(choices=choices, usage=usage)
+
+    def create_response(self, **params):
+        self.calls.append(params)
+        usage = SimpleNamespace(input_tokens=900, output_tokens=300, output_tokens_details=None)
+        return SimpleNamespace(output_text=LAYOUT, usage=usage, status="completed")
+
+
+def make_config(model="gpt-4o"):
+    return {
+        "api_config": {"api_key": "k", "base_url": "http://llm.test/v1", "model": model},
+        "modules": {"grid_planner": {"json_mode": True}},
+    }
+
+
+def test_single_call(app_env):
+    """一次调用生成全部候选，每个候选单独解析JSON，用量按候选分摊记录"""
+    client = FakeClient()
+    app_env.fake_client(client)
+    drafts, mode = app.generate_layout_candidates("prompt", make_config(), 3)
+    samples = app.get_usage_stats().samples("grid_planner")
+    assert mode == "single_call" and len(client.calls) == 1 and client.calls[0]["n"] == 3
+    assert drafts[0]["grid_ascii"] and not app.is_json_success(drafts[1])
+    assert [s["output_tokens"] for s in samples] == [300, 300, 300]
+    assert [s["json_failed"] for s in samples] == [False, True, False]
+
+
+def test_fallback_when_n_rejected(app_env):
+    """接口拒绝n参数时改为并行调用，之后同一模型直接并行"""
+    client = FakeClient(reject_n=True)
+    app_env.fake_client(client)
+    drafts, mode = app.generate_layout_candidates("prompt", make_config(), 3)
+    assert mode == "parallel" and len(drafts) == 3 and len(client.calls) == 4
+    app.generate_layout_candidates("prompt", make_config(), 2)
+    assert len(client.calls) == 6 and all("n" not in params for params in client.calls[4:])
+
+
+def test_responses_api_uses_parallel_calls(app_env):
+    """responses API（codex模型）不尝试n参数；关闭single_call时同样并行"""
+    client = FakeClient()
+    app_env.fake_client(client)
+    drafts, mode = app.generate_layout_candidates("prompt", make_config("gpt-5.1-codex"), 2)
+    assert mode == "parallel" and len(client.calls) == 2 and "input" in client.calls[0]
+
+    config = make_config()
+    config["layout_scoring"] = {"single_call": False}
+    assert app.generate_layout_candidates("prompt", config, 2)[1] == "parallel"
+
+
+def test_n_unsupported_error_detection():
+    assert app.is_n_unsupported_error("Unsupported parameter: 'n' is not supported with this model.")
+    assert app.is_n_unsupported_error("Invalid 'n': integer above maximum value. Expected a value <= 1")
+    assert not app.is_n_unsupported_error("The model `gpt-9` does not exist")
+
+
+if __name__ == '__main__':
+    sys.exit(run_tests(__file__, "✅ 多候选生成测试通过"))
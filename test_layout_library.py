@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+测试预验证布局库（收录、查询、旋转/镜像变换）
+"""
+
+import sys
+import tempfile
+
+import app
+from app import validate_layout
+from layout_library import LayoutLibrary, TRANSFORMS, theme_tag, transform_layout
+from testkit import run_tests
+
+INTENT = {
+    "theme": "废弃墓地",
+    "grid": {"width": 6, "height": 4},
+    "counts": {"enemy": 1, "npc": 0, "chest": 1, "door": 1},
+    "constraints": {"difficulty": "medium"},
+}
+
+LAYOUT = {
+    "grid_meta": {"width": 6, "height": 4, "meters_per_char": 1},
+    "grid_ascii": [
+        "######",
+        "#S.E.#",
+        "#C#..D",
+        "######",
+    ],
+    "entities": {
+        "player_start": {"x": 1, "y": 1},
+        "doors": [{"x": 5, "y": 2}],
+        "chests": [{"x": 1, "y": 2}],
+        "enemies": [{"x": 3, "y": 1, "type": "Skeleton_Warrior"}],
+        "npcs": [],
+    },
+}
+
+
+def test_transforms_keep_layout_valid():
+    """所有变换后的布局都能通过验证"""
+    for name, (_, swap) in TRANSFORMS.items():
+        layout = transform_layout(LAYOUT, name)
+        width, height = (4, 6) if swap else (6, 4)
+        intent = dict(INTENT, grid={"width": width, "height": height})
+        assert validate_layout(intent, layout)[0], name
+    assert transform_layout(transform_layout(LAYOUT, "rot90"), "rot270")["grid_ascii"] == LAYOUT["grid_ascii"]
+
+
+def test_library_add_and_sample():
+    """收录后可以按索引键取出，宽高互换的需求通过90度旋转满足"""
+    with tempfile.TemporaryDirectory() as root:
+        library = LayoutLibrary(root)
+        layout_id = library.add(INTENT, LAYOUT)
+        assert library.add(INTENT, LAYOUT) == layout_id
+
+        layout, sampled_id, transform = library.sample(INTENT)
+        assert sampled_id == layout_id and transform in ("identity", "mirror_x", "mirror_y", "rot180")
+        assert validate_layout(INTENT, layout)[0]
+
+        rotated_intent = dict(INTENT, grid={"width": 4, "height": 6})
+        layout, _, transform = library.sample(rotated_intent)
+        assert TRANSFORMS[transform][1] and validate_layout(rotated_intent, layout)[0]
+
+        assert library.sample(dict(INTENT, theme="城堡")) is None
+        assert library.sample(dict(INTENT, counts={"enemy": 2, "npc": 0, "chest": 1, "door": 1})) is None
+        assert library.stats()[0]["layouts"] == 1
+
+
+def test_theme_tag():
+    """主题文本归一化为标签"""
+    assert theme_tag("废弃墓地") == "graveyard"
+    assert theme_tag("Dark Dungeon") == "dungeon"
+    assert theme_tag("") == "default"
+
+
+def test_pipeline_falls_back_when_intent_is_not_numeric(app_env):
+    """intent中的尺寸或数量不是数字时跳过布局库，改为调用Grid Planner"""
+    calls = []
+
+    def fake_call(module_name, prompt, config, system_prompt=None, n=1):
+        calls.append(module_name)
+        if module_name == "intent_parser":
+            return dict(INTENT, counts=dict(INTENT["counts"], npc=None))
+        return LAYOUT
+
+    app_env.fake_llm(fake_call)
+    config = {"api_config": {"api_key": "k"}, "modules": {"intent_parser": {}, "grid_planner": {}}}
+    payload, status = app.run_level_pipeline("小墓地", config, layout_source="library")
+    assert status == 200, payload
+    assert calls[:2] == ["intent_parser", "grid_planner"]
+
+
+if __name__ == '__main__':
+    sys.exit(run_tests(__file__, "✅ 布局库测试通过"))
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+测试布局质量评分（各项指标、候选排名、评分速度）
+"""
+
+import time
+
+from app import layout_score_result
+from layout_scoring import analyze_layout, rank_layouts, score_layout
+from mock_llm_server import build_grid_layout
+
+# 门紧挨着起点，宝箱在主路径旁边，敌人离主路径很远
+NEAR = {
+    "grid_ascii": [
+        "##########",
+        "#SD......#",
+        "#........#",
+        "#.C...E..#",
+        "##########",
+    ],
+    "entities": {"player_start": {"x": 1, "y": 1}, "doors": [{"x": 2, "y": 1}],
+                 "chests": [{"x": 2, "y": 3}], "enemies": [{"x": 6, "y": 3}]},
+}
+
+# 绕墙走到门，敌人在主路径上，宝箱在门旁边的支路上
+FAR = {
+    "grid_ascii": [
+        "##########",
+        "#S.......#",
+        "#.#####.C#",
+        "#...E...D#",
+        "##########",
+    ],
+    "entities": {"player_start": {"x": 1, "y": 1}, "doors": [{"x": 8, "y": 3}],
+                 "chests": [{"x": 8, "y": 2}], "enemies": [{"x": 4, "y": 3}]},
+}
+
+
+def test_metrics():
+    """主路径长度、到主路径的距离、死胡同和开阔度"""
+    near = analyze_layout(NEAR)
+    assert near["main_path_length"] == 1
+    assert near["chest_path_distances"] == [2]
+    assert near["enemy_path_distances"] == [6]
+    assert near["dead_ends"] == 0 and near["open_area_ratio"] == 1.0
+
+    far = analyze_layout(FAR)
+    assert far["main_path_length"] == 9
+    assert far["enemy_path_distances"] == [0]
+    assert far["chest_path_distances"] == [1]
+    assert far["unreachable_doors"] == 0 and far["reachable_ratio"] == 1.0
+
+
+def test_unreachable_entities():
+    """不可达的门没有主路径，不可达的宝箱记为-1"""
+    walled = {
+        "grid_ascii": ["#######", "#S.#.D#", "#..#C.#", "#######"],
+        "entities": {"player_start": {"x": 1, "y": 1}, "doors": [{"x": 5, "y": 1}], "chests": [{"x": 4, "y": 2}]},
+    }
+    metrics = analyze_layout(walled)
+    assert metrics["main_path_length"] is None and metrics["unreachable_doors"] == 1
+    assert metrics["chest_path_distances"] == [-1]
+    result = score_layout(walled)
+    assert result["components"]["main_path"] == 0.0 and result["components"]["chest_side_path"] == 0.0
+
+
+def test_score_and_rank():
+    """门更远、敌人守着主路径的布局得分更高；排名保留原下标，同分保持原顺序"""
+    near, far = score_layout(NEAR), score_layout(FAR)
+    assert 0 <= near["score"] < far["score"] <= 100
+    assert near["components"]["enemy_proximity"] == 0.0 and far["components"]["enemy_proximity"] == 1.0
+
+    ranking = rank_layouts([NEAR, FAR, NEAR])
+    assert [r["index"] for r in ranking] == [1, 0, 2]
+    assert ranking[0]["layout"] is FAR
+
+    # 权重为0的指标不参与计算
+    only_path = score_layout(NEAR, {"dead_ends": 0, "chest_side_path": 0, "enemy_proximity": 0, "open_area": 0})
+    assert only_path["score"] == round(100 * only_path["components"]["main_path"], 1)
+
+
+def test_score_result_uses_draft_positions():
+    """selected和ranking中的index是所有候选中的下标（未通过验证的候选也占位置）"""
+    ranking = rank_layouts([NEAR, FAR])
+    result = layout_score_result(ranking[0], ranking, candidates=4, positions=[1, 3])
+    assert result["selected"] == 3
+    assert [r["index"] for r in result["ranking"]] == [3, 1]
+    assert layout_score_result(ranking[0], ranking)["selected"] == 1
+
+
+def test_not_applicable_components():
+    """没有门、宝箱、敌人时对应的指标为None"""
+    empty = {"grid_ascii": ["#####", "#S..#", "#####"], "entities": {"player_start": {"x": 1, "y": 1}}}
+    components = score_layout(empty)["components"]
+    assert components["main_path"] is None
+    assert components["chest_side_path"] is None and components["enemy_proximity"] is None
+
+
+def test_scoring_speed():
+    """常规尺寸的布局每秒至少能评分几百个"""
+    layout = build_grid_layout('"intent": {"grid": {"width": 20, "height": 12}}')
+    start = time.perf_counter()
+    for _ in range(200):
+        score_layout(layout)
+    assert time.perf_counter() - start < 1.0
+
+
+if __name__ == '__main__':
+    test_metrics()
+    test_unreachable_entities()
+    test_score_and_rank()
+    test_score_result_uses_draft_positions()
+    test_not_applicable_components()
+    test_scoring_speed()
+    print("✅ 布局质量评分测试通过")
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+测试关卡紧凑导出（打包/解析往返，加载器调用与 ascii_to_lua / world_to_lua 一致）
+"""
+
+import base64
+import re
+import struct
+import sys
+
+import app
+from app import ascii_to_lua, world_to_lua
+from level_export import (FORMAT_VERSION, MAGIC, pack_level, unpack_level, replay_calls, loader_lua,
+                          layout_blocks, world_blocks)
+from lua_syntax import check_lua_syntax
+from mock_llm_server import build_grid_layout
+from testkit import build_tiles, run_tests
+
+LAYOUT = build_grid_layout('"intent": {"grid": {"width": 40, "height": 30}, '
+                           '"counts": {"enemy": 6, "npc": 2, "chest": 3, "door": 2}}')
+
+
+def lua_calls(source):
+    """从 ascii_to_lua / world_to_lua 生成的Lua代码中提取引擎调用（block变量替换为block序号）"""
+    calls, blocks = [], {}
+    for line in source.splitlines():
+        match = re.match(r'local (\w+) = Env\.AllocBlock\((.*)\)$', line)
+        if match:
+            blocks[match.group(1)] = len(blocks)
+            calls.append(("AllocBlock", blocks[match.group(1)], *map(int, match.group(2).split(','))))
+            continue
+        match = re.match(r'Env\.(PlaceItem|SpawnNPC)\((.*)\)$', line)
+        if match:
+            args = [arg.strip().strip('"') for arg in match.group(2).split(',')]
+            calls.append((match.group(1), blocks[args[0]], args[1], int(args[2]), int(args[3]), *args[4:]))
+    return calls
+
+
+def test_round_trip():
+    """打包后解析得到相同的网格和实体"""
+    data = pack_level(layout_blocks(LAYOUT))
+    assert data[:4] == MAGIC and data[4] == FORMAT_VERSION
+    level = unpack_level(data)
+    assert level["blocks"][0]["grid_ascii"] == LAYOUT["grid_ascii"]
+    enemies = [e for e in level["entities"] if e["symbol"] == 'E']
+    assert [(e["x"], e["y"], e["type"]) for e in enemies] == \
+        [(e["x"], e["y"], e["type"]) for e in LAYOUT["entities"]["enemies"]]
+    assert [e for e in level["entities"] if e["symbol"] == 'S'][0]["type"] is None
+    assert len(data) < len("".join(LAYOUT["grid_ascii"]))
+
+
+def test_raw_encoding_when_rle_is_larger():
+    """游程编码更大时使用逐格编码"""
+    layout = {"grid_ascii": ["#.#.#", ".#.#.", "#.#.#"], "entities": {}}
+    level = unpack_level(pack_level(layout_blocks(layout)))
+    assert level["blocks"][0]["grid_ascii"] == layout["grid_ascii"]
+
+
+def test_replay_matches_ascii_to_lua():
+    """加载器的调用顺序和参数与 ascii_to_lua 完全一致"""
+    level = unpack_level(pack_level(layout_blocks(LAYOUT)))
+    assert replay_calls(level) == lua_calls(ascii_to_lua(LAYOUT))
+
+
+def test_replay_matches_world_to_lua():
+    """分块关卡每个区块一个AllocBlock，调用与 world_to_lua 一致"""
+    tiles, _, _, layouts = build_tiles()
+    level = unpack_level(pack_level(world_blocks(tiles, layouts)))
+    assert replay_calls(level) == lua_calls(world_to_lua(tiles, layouts))
+
+
+def test_loader_lua():
+    """加载器是合法的Lua，嵌入的数据可以还原"""
+    data = pack_level(layout_blocks(LAYOUT))
+    lua = loader_lua(data, 'Env.SetEnvironment("Fog", "Night")')
+    assert check_lua_syntax(lua) is None
+    assert lua.startswith('Env.SetEnvironment("Fog", "Night")')
+    embedded = re.search(r'local DATA = "([^"]+)"', lua).group(1)
+    assert base64.b64decode(embedded) == data
+
+
+def test_rejects_unknown_data():
+    """魔数不对或版本过新时报错"""
+    data = pack_level(layout_blocks(LAYOUT))
+    for bad in (b"XXXX" + data[4:], data[:4] + bytes((FORMAT_VERSION + 1,)) + data[5:]):
+        try:
+            unpack_level(bad)
+        except ValueError:
+            continue
+        raise AssertionError("应当拒绝无效数据")
+
+
+def test_many_blocks_with_entities():
+    """超过255个区块的大地图也能导出实体（block序号为u16）"""
+    blocks = [{"x": i * 2, "y": 0, "width": 2, "height": 1, "grid_ascii": ["#D"],
+               "entities": {"doors": [{"x": 1, "y": 0}]}} for i in range(300)]
+    level = unpack_level(pack_level(blocks))
+    assert len(level["entities"]) == 300 and level["entities"][-1]["block"] == 299
+
+
+def test_reads_version_1():
+    """仍可读取实体block序号为u8的版本1数据"""
+    data = (MAGIC + struct.pack(">BBH", 1, 0, 1) + struct.pack(">HHHHBI", 0, 0, 2, 1, 0, 2) + b"#D"
+            + struct.pack(">BH", 0, 1) + struct.pack(">BBHHB", ord('D'), 0, 1, 0, 0xFF))
+    level = unpack_level(data)
+    assert level["version"] == 1 and level["blocks"][0]["grid_ascii"] == ["#D"]
+    assert level["entities"] == [{"symbol": "D", "block": 0, "x": 1, "y": 0, "type": None}]
+
+
+def test_pipeline_survives_unparsable_layout(app_env):
+    """最后一次的布局是JSON解析失败的输出时，紧凑导出失败只记录警告，不影响响应"""
+    def fake_call(module_name, prompt, config, system_prompt=None, n=1):
+        return app.extract_json_from_response("不是JSON")
+
+    config = {"api_config": {"api_key": "k"}, "layout_library": {"enabled": False},
+              "modules": {"grid_planner": {"json_mode": True}}}
+    app_env.fake_llm(fake_call)
+    payload, status = app.run_level_pipeline("墓地", config, use_intent_parser=False)
+    assert status == 200 and "level_export" not in payload["results"]
+
+
+if __name__ == '__main__':
+    sys.exit(run_tests(__file__, "✅ 关卡紧凑导出测试通过"))
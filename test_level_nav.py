@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+测试关卡导航数据（距离场、路点图、Lua导出）
+"""
+
+import re
+
+from app import check_reachability
+from level_nav import build_navigation, distance_field, nav_to_lua, navigation_summary, waypoint_graph
+from lua_syntax import check_lua_syntax
+
+# 两个房间，中间一条1格宽的走廊
+GRID = [
+    "#############",
+    "#S..#####...#",
+    "#...........#",
+    "#...#####..D#",
+    "#############",
+]
+LAYOUT = {"grid_ascii": GRID, "entities": {"player_start": {"x": 1, "y": 1}, "doors": [{"x": 11, "y": 3}]}}
+
+
+def test_distance_field():
+    """BFS步数，墙为-1"""
+    field = distance_field(GRID, [(1, 1)])
+    width = len(GRID[0])
+    assert field[1 * width + 1] == 0
+    assert field[3 * width + 11] == 12
+    assert field[0] == -1
+    assert distance_field(GRID, [(0, 0)]) == [-1] * len(field)
+
+
+def test_check_reachability():
+    """起点到门的可达性检查与原来一致"""
+    assert check_reachability(GRID, {"x": 1, "y": 1}, [{"x": 11, "y": 3}])
+    blocked = [row[:6] + "#" + row[7:] for row in GRID]
+    assert not check_reachability(blocked, {"x": 1, "y": 1}, [{"x": 11, "y": 3}])
+    assert not check_reachability(GRID, {"x": 99, "y": 1}, [{"x": 11, "y": 3}])
+    assert check_reachability(GRID, None, [{"x": 11, "y": 3}])
+
+
+def test_waypoint_graph():
+    """两个房间之间是一条走廊：3个路点，2条边"""
+    waypoints, edges = waypoint_graph(GRID)
+    assert sorted(w["kind"] for w in waypoints) == ["corridor", "room", "room"]
+    corridor = [i for i, w in enumerate(waypoints) if w["kind"] == "corridor"][0]
+    assert len(edges) == 2 and all(corridor in edge[:2] and edge[2] > 0 for edge in edges)
+
+
+def test_navigation_lua():
+    """Lua导出语法正确，距离场按 y * width + x + 1 索引，带世界坐标偏移"""
+    nav = build_navigation(LAYOUT, offset_x=10, offset_y=20)
+    assert nav["targets"] == {"start": [11, 21], "door_1": [21, 23]}
+    summary = navigation_summary(nav)
+    assert summary["door_distances"] == {"door_1": 12}
+    lua = nav_to_lua(nav)
+    assert check_lua_syntax(lua) is None
+    start_rows = re.search(r"start = \{\n(.*?)\n    \},", lua, re.S).group(1).split("\n")
+    assert len(start_rows) == len(GRID)
+    assert start_rows[1].split(",")[1].strip() == "0"
+    assert "origin = {10, 20}" in lua and "return LevelNav" in lua
+
+
+if __name__ == '__main__':
+    test_distance_field()
+    test_check_reachability()
+    test_waypoint_graph()
+    test_navigation_lua()
+    print("✅ 导航数据测试通过")
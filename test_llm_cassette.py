@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+测试LLM流量录制与回放（cassette）
+"""
+
+import sys
+import time
+from types import SimpleNamespace
+
+import app
+from llm_cassette import Cassette, CassetteMiss, RecordedError, request_key
+from testkit import CountingClient, run_tests
+
+
+def cassette_config(app_env, client, mode, path, **options):
+    """用假客户端替换真实客户端、清空用量统计，返回开启cassette的配置"""
+    app_env.fake_client(client)
+    app_env.reset_usage_stats()
+    return {
+        "api_config": {"api_key": "k", "model": "gpt-4o"},
+        "modules": {"grid_planner": {"json_mode": True}, "stage_programmer": {"model": "gpt-5.1-codex"}},
+        "llm_cassette": {"mode": mode, "path": path, **options},
+    }
+
+
+def test_record_then_replay(app_env, tmp_path):
+    """录制后回放得到相同的输出和用量，回放时不调用客户端"""
+    path = str(tmp_path / "llm.jsonl")
+    client = CountingClient()
+    config = cassette_config(app_env, client, "record", path)
+    recorded = [app.call_gpt_module("grid_planner", "prompt", config),
+                app.call_gpt_module("grid_planner", "prompt", config, n=2),
+                app.call_gpt_module("stage_programmer", "prompt", config)]
+    assert client.calls == 3
+
+    client = CountingClient()
+    config = cassette_config(app_env, client, "replay", path)
+    replayed = [app.call_gpt_module("grid_planner", "prompt", config),
+                app.call_gpt_module("grid_planner", "prompt", config, n=2),
+                app.call_gpt_module("stage_programmer", "prompt", config)]
+    samples = app.get_usage_stats().samples("grid_planner")
+    stats = app.get_cassette(config).stats()
+    assert client.calls == 0 and replayed == recorded
+    assert replayed[1] == [{"call": 2, "choice": 0}, {"call": 2, "choice": 1}]
+    assert samples[0]["output_tokens"] == 40 and samples[0]["reasoning_tokens"] == 8
+    assert [s["truncated"] for s in samples[1:]] == [False, True]
+    assert stats["hits"] == 3 and stats["entries"] == 3
+
+
+def test_replay_order_and_miss(app_env, tmp_path):
+    """同一请求录制多次时按顺序返回、用完后循环；没有录制的请求报错"""
+    path = str(tmp_path / "llm.jsonl")
+    config = cassette_config(app_env, CountingClient(), "record", path)
+    for _ in range(2):
+        app.call_gpt_module("grid_planner", "prompt", config)
+    config = cassette_config(app_env, CountingClient(), "replay", path)
+    assert [app.call_gpt_module("grid_planner", "prompt", config)["call"] for _ in range(3)] == [1, 2, 1]
+    try:
+        app.call_gpt_module("grid_planner", "another prompt", config)
+        assert False, "应该报错"
+    except ValueError as e:
+        assert "cassette中没有模块 grid_planner" in str(e)
+    assert app.get_cassette(config).stats()["misses"] == 1
+
+
+def test_recorded_error_and_latency(tmp_path):
+    """录制时的调用失败回放时同样失败；replay_latency按录制的耗时等待"""
+    path = str(tmp_path / "llm.jsonl")
+    cassette = Cassette(path, "record")
+    client = cassette.client("grid_planner", CountingClient(fail_with="Error code: 429 - rate limited"))
+    try:
+        client.chat.completions.create(model="gpt-4o", messages=[])
+        assert False, "应该报错"
+    except Exception as e:
+        assert "429" in str(e)
+
+    slow = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(
+        create=lambda **params: time.sleep(0.05) or CountingClient().create(**params))))
+    cassette.client("grid_planner", slow).chat.completions.create(model="gpt-4o", messages=[{"content": "x"}])
+
+    replay = Cassette(path, "replay", replay_latency=True, latency_scale=2)
+    try:
+        replay.client("grid_planner").chat.completions.create(model="gpt-4o", messages=[])
+        assert False, "应该报错"
+    except RecordedError as e:
+        assert str(e) == "Error code: 429 - rate limited"
+    started = time.perf_counter()
+    replay.client("grid_planner").chat.completions.create(model="gpt-4o", messages=[{"content": "x"}])
+    assert time.perf_counter() - started >= 0.1
+
+
+def test_request_key():
+    """采样参数不参与请求哈希，prompt、模型和n参与"""
+    params = {"model": "gpt-4o", "messages": [{"role": "user", "content": "a"}], "temperature": 0.5}
+    key = request_key("grid_planner", "chat", params)
+    assert key == request_key("grid_planner", "chat", dict(params, temperature=0.9, max_tokens=100))
+    assert key != request_key("grid_planner", "chat", dict(params, model="gpt-4o-mini"))
+    assert key != request_key("grid_planner", "chat", dict(params, n=2))
+    assert key != request_key("intent_parser", "chat", params)
+    try:
+        Cassette("missing.jsonl", "replay")
+        assert False, "应该报错"
+    except ValueError as e:
+        assert not isinstance(e, CassetteMiss) and "不存在" in str(e)
+
+
+if __name__ == '__main__':
+    sys.exit(run_tests(__file__, "✅ LLM录制与回放测试通过"))
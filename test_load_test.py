@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+测试端到端压测脚本（分位数、请求构造、汇总；对真实启动的app和模拟LLM服务器压测）
+"""
+
+import json
+import sys
+import threading
+from contextlib import contextmanager
+
+import pytest
+from werkzeug.serving import make_server
+
+import app
+import load_test
+import mock_llm_server
+from testkit import run_tests
+
+# 模拟服务器按prompt开头的角色描述判断模块，只需要最短的模板
+MODULES = {
+    "screenwriter": {"prompt_template": "You are the Screenwriter Agent.\n{user_input}", "json_mode": True},
+    "stage_design": {"prompt_template": "You are the Stage Design Agent.\n{blueprint}", "json_mode": True},
+    "stage_programmer": {"prompt_template": "You are the Stage Programmer Agent.\n{stage_design}"},
+    "casting_design": {"prompt_template": "You are the Casting Design Agent.\n{blueprint}\n{stage_design}",
+                       "json_mode": True},
+    "character_config": {"prompt_template": "You are the Character Config Programmer Agent.\n{casting_design}"},
+    "executive_director": {"prompt_template": "You are the Executive Director Agent.\n{blueprint}\n{stage_lua}\n"
+                                              "{cast_lua}"},
+    "intent_parser": {"json_mode": True},
+    "grid_planner": {"json_mode": True},
+}
+
+
+@contextmanager
+def serve(flask_app):
+    """在空闲端口上启动服务器，返回地址，退出时关闭"""
+    server = make_server("127.0.0.1", 0, flask_app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_port}"
+    finally:
+        server.shutdown()
+        thread.join()
+
+
+def test_percentile():
+    """线性插值，空列表返回0"""
+    assert load_test.percentile([], 50) == 0.0
+    assert load_test.percentile([1.0, 2.0, 3.0, 4.0], 50) == 2.5
+    assert load_test.percentile([1.0, 2.0, 3.0, 4.0], 100) == 4.0
+
+
+def test_build_request():
+    """按序号轮流选择输入，unique时加序号避免去重"""
+    assert load_test.build_request("generate", 5, False) == (
+        "/api/generate", {"user_input": load_test.SCRIPT_IDEAS[1]})
+    path, body = load_test.build_request("generate-level", 4, True)
+    assert path == "/api/generate-level" and body["use_intent_parser"] is True
+    assert body["user_input"] == f"{load_test.LEVEL_IDEAS[1]} #4"
+
+
+def test_summarize():
+    """按接口和总体统计请求数、错误率和状态码；success=false也算失败"""
+    results = [{"endpoint": "generate", "status": 200, "latency": 0.1, "error": None},
+               {"endpoint": "generate", "status": 200, "latency": 0.3, "error": "success=false"},
+               {"endpoint": "generate-level", "status": 500, "latency": 0.2, "error": "boom"}]
+    summary = load_test.summarize(results, 2.0)
+    assert summary["generate"]["requests"] == 2 and summary["generate"]["error_rate"] == 0.5
+    assert summary["all"]["throughput_rps"] == 1.5
+    assert summary["all"]["status_codes"] == {"200": 2, "500": 1}
+    assert summary["generate-level"]["latency_ms"]["max"] == pytest.approx(200)
+
+
+def test_load_against_mock_server(app_env, monkeypatch, tmp_path):
+    """app通过模拟LLM服务器运行两条流水线，压测全部成功，--json写出汇总"""
+    monkeypatch.setattr(mock_llm_server, "SETTINGS", dict(mock_llm_server.SETTINGS, latency=("fixed", [0.0]),
+                                                          error_rate=0.0, truncate_rate=0.0))
+    with serve(mock_llm_server.app) as llm_url, serve(app.app) as app_url:
+        app_env.use_config({"api_config": {"api_key": "mock", "base_url": f"{llm_url}/v1", "model": "gpt-4o"},
+                            "modules": MODULES})
+        results, wall_time = load_test.run_load(app_url, ["generate", "generate-level"], 2, 4, 0, 60, True)
+        assert len(results) == 4 and wall_time > 0
+        assert all(r["status"] == 200 and r["error"] is None for r in results), results
+
+        out = tmp_path / "summary.json"
+        assert load_test.main(["--url", app_url, "--endpoint", "generate-level", "--concurrency", "1",
+                               "--requests", "1", "--json", str(out)]) == 0
+    summary = json.loads(out.read_text(encoding="utf-8"))["summary"]
+    assert summary["all"]["requests"] == 1 and summary["all"]["error_rate"] == 0.0
+
+
+if __name__ == '__main__':
+    sys.exit(run_tests(__file__, "✅ 压测脚本测试通过"))
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+测试结构化日志（请求ID/运行ID、线程池中的上下文传递、模块耗时、载荷采样、JSON输出）
+"""
+
+import io
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from log_utils import (bind_request, bind_run, flush_logging, get_logger, in_context, log_payload, module_span,
+                       setup_logging)
+
+
+def capture(settings):
+    stream = io.StringIO()
+    setup_logging(settings, stream=stream)
+    return stream
+
+
+def json_lines(stream):
+    flush_logging()
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+def teardown_function(_):
+    setup_logging(stream=sys.stdout)
+
+
+def test_json_lines_carry_ids():
+    """每行带请求ID和运行ID，线程池任务继承提交时的ID"""
+    stream = capture({"format": "json"})
+    log = get_logger("test")
+    bind_request("req-1")
+    log.info("第一行")
+    bind_run("run-1")
+
+    def work(n):
+        log.info("任务 %d", n)
+        return n
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        assert sorted(executor.map(in_context(work), range(4))) == [0, 1, 2, 3]
+    lines = json_lines(stream)
+    assert lines[0]["request_id"] == "req-1" and lines[0]["run_id"] is None
+    assert len(lines) == 5 and all(line["request_id"] == "req-1" for line in lines)
+    assert all(line["run_id"] == "run-1" for line in lines[1:])
+    assert sorted(line["msg"] for line in lines[1:]) == [f"任务 {n}" for n in range(4)]
+
+    bind_request()
+    get_logger("test").info("新请求")
+    line = json_lines(stream)[-1]
+    assert line["request_id"] not in (None, "req-1") and line["run_id"] is None
+
+
+def test_module_span():
+    """模块开始、结束（带耗时）和失败"""
+    stream = capture({"format": "json"})
+    log = get_logger("test")
+    with module_span(log, "grid_planner", attempt=1):
+        pass
+    try:
+        with module_span(log, "intent_parser"):
+            raise ValueError("坏的JSON")
+    except ValueError:
+        pass
+    start, end, _, failed = json_lines(stream)[-4:]
+    assert (start["module"], start["event"], start["attempt"]) == ("grid_planner", "start", 1)
+    assert end["event"] == "end" and end["duration_ms"] >= 0
+    assert failed["event"] == "failed" and failed["error"] == "坏的JSON" and failed["level"] == "WARNING"
+
+
+def test_payload_sampling():
+    """采样率为0时不记录，为1时全部记录并截断"""
+    stream = capture({"format": "json", "payload_sample_rate": 0})
+    log = get_logger("test")
+    log_payload(log, "screenwriter", {"x": 1})
+    assert json_lines(stream) == []
+
+    stream = capture({"format": "json", "payload_sample_rate": 1, "payload_max_chars": 10})
+    log_payload(log, "screenwriter", "x" * 50)
+    line = json_lines(stream)[0]
+    assert line["payload_chars"] == 50 and line["payload"] == "x" * 10 + "..."
+
+
+def test_text_format_and_exception():
+    """文本格式带ID和字段，异常堆栈在后台线程中格式化"""
+    stream = capture({"format": "text", "level": "INFO"})
+    bind_request("req-2")
+    bind_run("run-2")
+    log = get_logger("test")
+    log.debug("不输出")
+    try:
+        raise RuntimeError("出错了")
+    except RuntimeError:
+        log.exception("未预期的错误")
+    flush_logging()
+    output = stream.getvalue()
+    assert "不输出" not in output
+    assert "ERROR [req-2/run-2] 未预期的错误" in output
+    assert "Traceback" in output and "RuntimeError: 出错了" in output
+
+
+if __name__ == '__main__':
+    for test in (test_json_lines_carry_ids, test_module_span, test_payload_sampling, test_text_format_and_exception):
+        test()
+        teardown_function(test)
+    print("✅ 结构化日志测试通过")
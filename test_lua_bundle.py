@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+测试Lua打包与压缩（Token序列不变、局部变量重命名后作用域解析不变、require改写）
+"""
+
+from lua_bundle import BUNDLE_REQUIRE, analyze_scopes, bundle_lua, minify_lua
+from lua_syntax import check_lua_syntax, tokenize
+
+STAGE = """-- 场景模块
+local Stage = {}
+local count = 0  --[[ 块注释 ]]
+local function add(kind, x, y)
+  count = count + 1
+  Env.PlaceItem(block, kind, x, y)
+  return count
+end
+function Stage.Build(n)
+  for i = 1, n do add("Wall_Stone", i, i * 2) end
+  local s = [[long
+string]] .. "esc\\"q" .. 5 - -3 .. 1 .. #Stage
+  return count, s
+end
+return Stage
+"""
+
+CAST = """#!/usr/bin/env lua
+local Stage = require("Stage")
+Cast = {}
+local Actor = {}
+function Actor:hit(d) self.hp = self.hp - d; return self.hp end
+function Cast.SpawnAll(ctx) return Stage.Build(ctx.n) end
+"""
+
+MAIN = """local Stage = require("Stage")
+require "Cast"
+local json = require("json")  -- 未打包的模块
+local x = 1
+local function outer(...)
+  local x = x + 1
+  local f = function(y) local x = x * y; return x, count end
+  do local a = 100; print(a) end
+  return f(3), select("#", ...)
+end
+local count = outer()
+for k = 1, 3 do
+  if k == 2 then goto continue end
+  print(k // 2, k % 2, 2^k, 5. .. "")
+  ::continue::
+end
+"""
+
+
+def token_values(source):
+    return [(token.type, token.value) for token in tokenize(source)]
+
+
+def resolution(source):
+    """每个名字Token解析到的声明（按Token序号），全局变量为None"""
+    analyzer = analyze_scopes(source)
+    order = {token.start: i for i, token in enumerate(analyzer.tokens)}
+    decls = [order.get(token.start) for token in analyzer.decls]
+    return sorted((order[start], decls[decl_id]) for start, decl_id in analyzer.refs.items()), analyzer.globals
+
+
+def test_minify_keeps_tokens():
+    """压缩后Token序列不变，注释和空白被去掉"""
+    for source in (STAGE, CAST, MAIN):
+        minified = minify_lua(source)
+        assert check_lua_syntax(minified) is None
+        assert token_values(minified) == token_values(source)
+        assert "--" not in minified and "\n" not in minified.replace("[[long\nstring]]", "")
+        assert len(minified) < len(source)
+
+
+def test_minify_spacing():
+    """只在相连会改变Token时保留空格"""
+    assert minify_lua("local a = b - -c") == "local a=b- -c"
+    assert minify_lua("x = 1 .. y .. 5. .. z") == "x=1 ..y..5. ..z"
+    assert minify_lua("t[ [[s]] ] = #t") == "t[ [[s]]]=#t"
+    assert minify_lua("if a then return end") == "if a then return end"
+
+
+def test_rename_locals_keeps_scoping():
+    """重命名后每个引用仍指向同一个声明，全局变量和字段名不变"""
+    for source in (STAGE, CAST, MAIN):
+        renamed = minify_lua(source, rename_locals=True)
+        assert check_lua_syntax(renamed) is None
+        assert resolution(renamed) == resolution(source)
+        assert len(renamed) < len(minify_lua(source))
+    renamed = minify_lua(MAIN, rename_locals=True)
+    for kept in ("print", "select", "count", "goto continue", "::continue::"):
+        assert kept in renamed
+    assert "self.hp" in minify_lua(CAST, rename_locals=True)
+
+
+def test_bundle():
+    """已打包模块的require改为打包文件内的加载函数，其他require不变"""
+    bundle, report = bundle_lua({"Stage": STAGE, "Cast": CAST}, MAIN)
+    assert check_lua_syntax(bundle) is None
+    assert report["requires_inlined"] == 3
+    assert bundle.count(BUNDLE_REQUIRE + '("Stage")') == 2 and BUNDLE_REQUIRE + '"Cast"' in bundle
+    assert 'require("json")' in bundle
+    assert report["input_total_bytes"] == sum(len(s.encode('utf-8')) for s in (STAGE, CAST, MAIN))
+    assert report["bundle_bytes"] == len(bundle.encode('utf-8'))
+
+    bundle, report = bundle_lua({"Stage": STAGE, "Cast": CAST}, MAIN, rename_locals=True)
+    assert check_lua_syntax(bundle) is None and report["locals_renamed"]
+
+
+def test_shadowed_require_not_rewritten():
+    """被局部变量遮蔽的require不改写"""
+    main = 'local require = function(n) return n end\nlocal s = require("Stage")\n'
+    bundle, report = bundle_lua({"Stage": STAGE}, main, minify=False)
+    assert report["requires_inlined"] == 0 and 'require("Stage")' in bundle
+
+
+if __name__ == '__main__':
+    test_minify_keeps_tokens()
+    test_minify_spacing()
+    test_rename_locals_keeps_scoping()
+    test_bundle()
+    test_shadowed_require_not_rewritten()
+    print("✅ Lua打包与压缩测试通过")
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+测试纯Python的Lua语法检查
+"""
+
+from lua_syntax import check_lua_syntax, strip_markdown_fences, tokenize
+
+VALID_SOURCES = [
+    "local a <const> = 1\nlocal t = {1, 2; x = 3, ['y'] = 4,}\nprint(#t, -a, not a, ~a, a // 2, a >> 1, a .. [[long\nstring]])",
+    "for i = 1, 10, 2 do if i > 5 then break end end\nfor k, v in pairs(t) do goto continue ::continue:: end",
+    "local function f(...) local a, b = ... return a end\nrepeat local x = 1 until x == 1",
+    "obj:method 'str' {1}\nf{a=1}.b = 2\na.b[c].d = function(self, x) return self end\nfunction M.a.b:c(x) return self.x end",
+    "--[==[ comment\n]==] x = 0x1Fp2 + 1e10 + .5 + 3. + 0xA.8\nreturn",
+    "local s = 'a\\z\n   b\\x41\\65\\u{48}\\n'",
+    "local s = 'a\\\r\nb\\\n\rc\\\nd'\r\nprint(s)",
+    "#!/usr/bin/lua\nprint(1)",
+    "do local x; x = 1; end; ;;",
+]
+
+INVALID_SOURCES = [
+    ("local x = ", 1, "unexpected symbol"),
+    ("if x then\n  print(1)\n", 3, "'end' expected"),
+    ("print('abc)", 1, "unfinished string"),
+    ("print('a\\\n\nb')", 1, "unfinished string"),
+    ("print('a\\\r\rb')", 1, "unfinished string"),
+    ("local t = {1, 2\nprint(t)", 2, "'}' expected"),
+    ("function f() return ... end", 1, "cannot use '...' outside a vararg function"),
+    ("break", 1, "break outside a loop"),
+    ("f() = 1", 1, "syntax error"),
+    ("x = 3abc", 1, "malformed number"),
+    ("local function f()\n  return 1\n  print(2)\nend", 3, "'end' expected"),
+    ("return 1\nx = 2", 2, "'<eof>' expected"),
+]
+
+
+def test_valid_sources():
+    """合法代码全部通过"""
+    for source in VALID_SOURCES:
+        assert check_lua_syntax(source) is None, source
+
+
+def test_invalid_sources_report_position():
+    """非法代码返回正确的行号和错误信息"""
+    for source, line, message in INVALID_SOURCES:
+        error = check_lua_syntax(source)
+        assert error is not None, source
+        assert error["line"] == line, (source, error)
+        assert error["message"].startswith(message), (source, error)
+
+
+def test_tokens_skip_comments():
+    """注释不产生Token，位置从1开始计数"""
+    tokens = tokenize("-- comment\nlocal x = 1 --[[ block ]] + 2")
+    assert [t.value for t in tokens] == ["local", "x", "=", "1", "+", "2", "<eof>"]
+    assert (tokens[0].line, tokens[0].column) == (2, 1)
+
+
+def test_strip_markdown_fences():
+    """去掉包裹或夹带的代码块标记"""
+    assert strip_markdown_fences("```lua\nprint(1)\n```") == "print(1)\n"
+    assert strip_markdown_fences("代码如下：\n```lua\nlocal a = 1\n```\n以上。") == "local a = 1\n"
+    assert strip_markdown_fences("print(1)\n```") == "print(1)\n"
+    assert strip_markdown_fences("print(1)") == "print(1)\n"
+
+
+if __name__ == '__main__':
+    test_valid_sources()
+    test_invalid_sources_report_position()
+    test_tokens_skip_comments()
+    test_strip_markdown_fences()
+    print("✅ Lua语法检查测试通过")
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+测试模拟LLM服务器（按prompt判断模块、OpenAI兼容接口、错误和截断注入、Grid Planner布局）
+"""
+
+import json
+import sys
+
+import pytest
+
+import mock_llm_server
+from app import build_grid_planner_prompt, validate_layout
+from mock_llm_server import build_grid_layout, detect_module, parse_latency
+from testkit import run_tests
+
+GRID_INTENT = {"grid": {"width": 20, "height": 12}, "counts": {"enemy": 2, "npc": 1, "chest": 1, "door": 1}}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    """模拟服务器的测试客户端：无延迟、不注入错误和截断，统计从0开始"""
+    monkeypatch.setattr(mock_llm_server, "SETTINGS", dict(mock_llm_server.SETTINGS, latency=("fixed", [0.0]),
+                                                          tokens_per_sec=0.0, error_rate=0.0, truncate_rate=0.0))
+    monkeypatch.setattr(mock_llm_server, "STATS", {"requests": 0, "errors": 0, "truncated": 0, "by_module": {}})
+    return mock_llm_server.app.test_client()
+
+
+def grid_planner_prompt(intent=GRID_INTENT):
+    """未配置prompt模板时Grid Planner使用的默认prompt"""
+    return build_grid_planner_prompt({"modules": {"grid_planner": {}}}, intent)
+
+
+def sse_events(response):
+    """解析SSE响应，返回事件列表（不含[DONE]）和是否以[DONE]结束"""
+    lines = [line[len("data: "):] for line in response.get_data(as_text=True).split("\n\n") if line]
+    done = lines[-1] == "[DONE]"
+    return [json.loads(line) for line in lines if line != "[DONE]"], done
+
+
+def test_detect_config_templates():
+    """config.example.json 中每个模块的prompt模板都判断为该模块（后面的模块会提到 Screenwriter Agent）"""
+    with open('config.example.json', 'r', encoding='utf-8') as f:
+        modules = json.load(f)["modules"]
+    templates = {name: module["prompt_template"] for name, module in modules.items() if module.get("prompt_template")}
+    assert templates
+    for name, template in templates.items():
+        assert detect_module(template) == name, name
+
+
+def test_detect_default_prompts():
+    """未配置prompt模板时使用的默认prompt"""
+    intent = {"grid": {"width": 20, "height": 12}, "counts": {"enemy": 2}}
+    assert detect_module(build_grid_planner_prompt({"modules": {"grid_planner": {}}}, intent)) == "grid_planner"
+    assert detect_module("System:\nYou are a level requirement parser.\n") == "intent_parser"
+    assert detect_module("你好") == "unknown"
+
+
+def test_grid_layouts_pass_layout_guard():
+    """不同尺寸和数量的intent生成的布局都能通过validate_layout"""
+    intents = [GRID_INTENT,
+               {"grid": {"width": 10, "height": 10}, "counts": {"enemy": 3, "npc": 0, "chest": 2, "door": 0}},
+               {"grid": {"width": 30, "height": 20}, "counts": {"enemy": 4, "npc": 2, "chest": 3, "door": 2}},
+               {"grid": {"width": 5, "height": 5}, "counts": {"enemy": 1, "npc": 0, "chest": 0, "door": 1}}]
+    for intent in intents:
+        is_valid, errors, _ = validate_layout(intent, build_grid_layout(grid_planner_prompt(intent)))
+        assert is_valid, (intent, errors)
+
+
+def test_parse_latency():
+    """延迟分布的参数个数必须匹配"""
+    assert parse_latency("uniform:0.2,1.0") == ("uniform", [0.2, 1.0])
+    with pytest.raises(Exception):
+        parse_latency("normal:0.8")
+
+
+def test_chat_completions_with_n(client):
+    """n个候选各自是合法布局，usage按全部候选计算"""
+    response = client.post("/v1/chat/completions", json={
+        "model": "gpt-4o", "n": 3, "messages": [{"role": "user", "content": grid_planner_prompt()}]})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert [choice["index"] for choice in body["choices"]] == [0, 1, 2]
+    for choice in body["choices"]:
+        assert choice["finish_reason"] == "stop"
+        assert validate_layout(GRID_INTENT, json.loads(choice["message"]["content"]))[0]
+    assert body["usage"]["total_tokens"] == body["usage"]["prompt_tokens"] + body["usage"]["completion_tokens"]
+    assert mock_llm_server.STATS["by_module"] == {"grid_planner": 3}
+
+
+def test_chat_completions_stream(client):
+    """流式输出按候选拼接后与非流式输出相同，以[DONE]结束"""
+    messages = [{"role": "user", "content": grid_planner_prompt()}]
+    expected = client.post("/v1/chat/completions", json={"messages": messages}).get_json()
+    response = client.post("/v1/chat/completions", json={"messages": messages, "n": 2, "stream": True})
+    assert response.mimetype == "text/event-stream"
+    events, done = sse_events(response)
+    assert done
+    texts, finish = {}, {}
+    for event in events:
+        choice = event["choices"][0]
+        texts[choice["index"]] = texts.get(choice["index"], "") + choice["delta"].get("content", "")
+        if choice["finish_reason"]:
+            finish[choice["index"]] = choice["finish_reason"]
+    content = expected["choices"][0]["message"]["content"]
+    assert texts == {0: content, 1: content}
+    assert finish == {0: "stop", 1: "stop"}
+
+
+def test_responses(client):
+    """responses接口返回模块的固定输出；流式输出的增量拼接后与最终响应一致"""
+    prompt = "You are a Stage Programmer Agent.\n生成Stage.lua"
+    body = client.post("/v1/responses", json={"input": prompt}).get_json()
+    assert body["status"] == "completed" and body["incomplete_details"] is None
+    assert body["output"][0]["content"][0]["text"] == mock_llm_server.STAGE_LUA
+    assert body["usage"]["output_tokens"] > 0
+
+    events, done = sse_events(client.post("/v1/responses", json={"input": prompt, "stream": True}))
+    assert not done
+    assert events[0]["type"] == "response.created" and events[-1]["type"] == "response.completed"
+    deltas = "".join(event["delta"] for event in events if event["type"] == "response.output_text.delta")
+    assert deltas == events[-1]["response"]["output"][0]["content"][0]["text"] == mock_llm_server.STAGE_LUA
+
+
+def test_error_injection(client):
+    """错误率为1时返回配置的错误码，并计入统计"""
+    mock_llm_server.SETTINGS.update(error_rate=1.0, error_codes=[429])
+    response = client.post("/v1/chat/completions", json={"messages": [{"role": "user", "content": "你好"}]})
+    assert response.status_code == 429 and response.get_json()["error"]["code"] == 429
+    assert client.post("/v1/responses", json={"input": "你好"}).status_code == 429
+    stats = client.get("/mock/stats").get_json()
+    assert stats["requests"] == 2 and stats["errors"] == 2
+
+
+def test_truncation_injection(client):
+    """截断率为1时输出被截短，chat返回finish_reason=length，responses返回incomplete"""
+    mock_llm_server.SETTINGS.update(truncate_rate=1.0)
+    choice = client.post("/v1/chat/completions", json={
+        "messages": [{"role": "user", "content": grid_planner_prompt()}]}).get_json()["choices"][0]
+    assert choice["finish_reason"] == "length"
+    with pytest.raises(json.JSONDecodeError):
+        json.loads(choice["message"]["content"])
+
+    body = client.post("/v1/responses", json={"input": "You are a Stage Programmer Agent."}).get_json()
+    assert body["status"] == "incomplete" and body["incomplete_details"] == {"reason": "max_output_tokens"}
+    assert len(body["output"][0]["content"][0]["text"]) < len(mock_llm_server.STAGE_LUA)
+    assert client.get("/mock/stats").get_json()["truncated"] == 2
+
+
+if __name__ == '__main__':
+    sys.exit(run_tests(__file__, "✅ 模拟LLM服务器测试通过"))
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+测试模块目录接口（只返回元数据和prompt哈希）和按需获取prompt正文（ETag、长期缓存）
+"""
+
+import copy
+import sys
+
+import pytest
+
+import app
+from testkit import run_tests
+
+CONFIG = {"modules": {
+    "screenwriter": {"name": "编剧", "prompt_template": "想法: {user_input}" * 200, "temperature": 0.8,
+                     "prompt_variants": {"short": {"weight": 1, "prompt_template": "短: {user_input}"}}},
+    "grid_planner": {"name": "网格规划", "prompt_template": "蓝图: {blueprint}", "json_mode": True},
+}}
+
+
+@pytest.fixture
+def client(app_env):
+    """使用内存中的配置（不读写config.json）的测试客户端"""
+    app_env.use_config(copy.deepcopy(CONFIG))
+    return app.app.test_client()
+
+
+def test_catalog_has_no_prompt_bodies(client):
+    """目录只有元数据、哈希和正文地址"""
+    catalog = client.get("/api/modules").get_json()
+    entry = catalog["screenwriter"]
+    assert "prompt_template" not in entry
+    assert entry["prompt_chars"] == len(CONFIG["modules"]["screenwriter"]["prompt_template"])
+    assert entry["prompt_url"] == f"/api/modules/screenwriter/prompt?v={entry['prompt_hash']}"
+    assert entry["temperature"] == 0.8 and catalog["grid_planner"]["json_mode"] is True
+
+
+def test_prompt_body_caching(client):
+    """正文带强ETag，版本号匹配时长期缓存，If-None-Match命中时返回304"""
+    entry = client.get("/api/modules").get_json()["grid_planner"]
+    response = client.get(entry["prompt_url"])
+    assert response.get_data(as_text=True) == "蓝图: {blueprint}"
+    assert response.headers["ETag"] == f'"{entry["prompt_hash"]}"'
+    assert "immutable" in response.headers["Cache-Control"]
+
+    stale = client.get("/api/modules/grid_planner/prompt?v=old")
+    assert "immutable" not in stale.headers["Cache-Control"]
+    not_modified = client.get(entry["prompt_url"], headers={"If-None-Match": response.headers["ETag"]})
+    assert not_modified.status_code == 304
+    assert client.get("/api/modules/missing/prompt").status_code == 404
+
+
+def test_edit_changes_only_that_hash(client):
+    """修改一个模块后只有该模块的哈希变化"""
+    before = client.get("/api/modules").get_json()
+    saved = client.post("/api/modules/grid_planner", json={"prompt_template": "新的蓝图: {blueprint}"}).get_json()
+    after = client.get("/api/modules").get_json()
+    assert saved["module"]["prompt_hash"] == after["grid_planner"]["prompt_hash"]
+    assert after["grid_planner"]["prompt_hash"] != before["grid_planner"]["prompt_hash"]
+    assert after["screenwriter"] == before["screenwriter"]
+
+
+def test_config_has_no_prompt_bodies(client):
+    """GET /api/config 中的prompt模板换成哈希和正文地址，保存配置时不会清空模板"""
+    catalog = client.get("/api/modules").get_json()
+    modules = client.get("/api/config").get_json()["modules"]
+    screenwriter = modules["screenwriter"]
+    assert "prompt_template" not in screenwriter
+    assert screenwriter["prompt_url"] == catalog["screenwriter"]["prompt_url"]
+    assert "prompt_template" not in screenwriter["prompt_variants"]["short"]
+    assert screenwriter["prompt_variants"]["short"]["weight"] == 1
+    assert modules["grid_planner"]["json_mode"] is True
+
+    saved = client.post("/api/config", json={"modules": {"grid_planner": {"temperature": 0.2}}}).get_json()
+    assert "prompt_template" not in saved["config"]["modules"]["grid_planner"]
+    assert app.load_config()["modules"]["grid_planner"]["prompt_template"] == "蓝图: {blueprint}"
+    assert "prompt_template" in app.load_config()["modules"]["screenwriter"]["prompt_variants"]["short"]
+
+
+if __name__ == '__main__':
+    sys.exit(run_tests(__file__, "✅ 模块目录接口测试通过"))
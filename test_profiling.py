@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+测试请求级性能分析（阶段耗时、线程池中的阶段、CPU分析、未开启时不记录）
+"""
+
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import app
+from log_utils import get_logger, in_context, module_span
+from profiling import RequestProfiler, active_profiler, stage, staged
+from testkit import run_tests
+
+
+@staged("extract_json_from_response")
+def parse(text):
+    return sum(ord(c) for c in text)
+
+
+def busy(n):
+    return sum(i * i for i in range(n))
+
+
+def test_disabled_is_noop():
+    """没有开启性能分析时stage不记录任何东西"""
+    assert active_profiler.get() is None
+    with stage("grid_planner"):
+        pass
+    assert parse("abc") == 294
+
+
+def test_stages_and_threads():
+    """阶段按名称汇总，线程池任务（in_context包装）中的阶段也记录；module_span同时是一个阶段"""
+    with RequestProfiler(cpu=False) as profiler:
+        with stage("provider:grid_planner"):
+            time.sleep(0.01)
+        parse("x" * 100)
+        parse("y")
+        with module_span(get_logger("test"), "layout_guard"):
+            pass
+
+        def tile(_):
+            with stage("layout_guard"):
+                return busy(1000)
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            list(executor.map(in_context(tile), range(3)))
+    assert active_profiler.get() is None
+
+    summary = profiler.stage_summary()
+    assert summary["extract_json_from_response"]["count"] == 2
+    assert summary["layout_guard"]["count"] == 4
+    assert summary["provider:grid_planner"]["total_ms"] >= 10
+    assert list(summary)[0] == "provider:grid_planner"
+    assert profiler.wall_ms >= summary["provider:grid_planner"]["total_ms"]
+    assert len({span["thread"] for span in profiler.spans}) >= 2
+    assert profiler.report()["cpu_top"] == []
+
+
+def test_cpu_profile():
+    """CPU分析的函数排名和文本报告"""
+    with RequestProfiler() as profiler:
+        busy(20000)
+    report = profiler.report(limit=5)
+    assert len(report["cpu_top"]) <= 5
+    assert any(row["function"].startswith("busy (test_profiling.py") for row in report["cpu_top"])
+    assert "cumulative" in profiler.cpu_text()
+
+
+def test_config_hides_admin_token(app_env):
+    """读取和保存配置的响应都不返回管理员令牌，保存时也不会清空令牌"""
+    config = {"api_config": {"api_key": "k"}, "modules": {}, "profiling": {"admin_token": "s3cret"}}
+    saved = app_env.use_config(config)
+    client = app.app.test_client()
+    assert client.get("/api/config").get_json()["profiling"]["admin_token"] == ""
+    response = client.post("/api/config", json={})
+    assert "s3cret" not in response.get_data(as_text=True)
+    assert response.get_json()["config"]["profiling"]["admin_token"] == ""
+    assert saved[0]["profiling"]["admin_token"] == "s3cret"
+
+
+if __name__ == '__main__':
+    sys.exit(run_tests(__file__, "✅ 性能分析测试通过"))
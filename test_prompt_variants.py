@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+测试prompt变体实验（按权重分配变体、变体字段覆盖、按变体统计和对比）
+"""
+
+import tempfile
+from collections import Counter
+
+from prompt_variants import (ExperimentStats, assign_variants, bind_variants, choose_variant, current_variant,
+                             module_variants, variant_field)
+
+GRID_PLANNER = {
+    "prompt_template": "长prompt {intent}",
+    "prompt_variants": {
+        "default": {"weight": 3},
+        "short": {"weight": 1, "prompt_template": "短prompt {intent}", "system_prompt": "简短回答"},
+        "retired": {"weight": 0, "prompt_template": "旧prompt {intent}"},
+    },
+}
+
+
+def test_assignment():
+    """同一个运行总是分到同一个变体，流量按权重分配，权重为0的变体不分配"""
+    assert module_variants({"prompt_template": "x"}) == []
+    assert module_variants({"prompt_variants": {"b": {}}}) == [("default", 1.0), ("b", 1.0)]
+    assert choose_variant(GRID_PLANNER, "run-1:grid_planner") == choose_variant(GRID_PLANNER, "run-1:grid_planner")
+
+    counts = Counter(choose_variant(GRID_PLANNER, f"run-{i}:grid_planner") for i in range(4000))
+    assert set(counts) == {"default", "short"}
+    assert 0.7 < counts["default"] / 4000 < 0.8
+
+    config = {"modules": {"grid_planner": GRID_PLANNER, "screenwriter": {"prompt_template": "{user_input}"}}}
+    assert list(assign_variants(config, "run-1")) == ["grid_planner"]
+
+
+def test_variant_fields():
+    """变体覆盖prompt模板和system prompt，未设置的字段沿用模块配置"""
+    bind_variants({"grid_planner": "short"})
+    try:
+        assert current_variant("grid_planner") == "short" and current_variant("screenwriter") is None
+        assert variant_field(GRID_PLANNER, "grid_planner", "prompt_template") == "短prompt {intent}"
+        assert variant_field(GRID_PLANNER, "grid_planner", "system_prompt") == "简短回答"
+        bind_variants({"grid_planner": "default"})
+        assert variant_field(GRID_PLANNER, "grid_planner", "prompt_template") == "长prompt {intent}"
+        assert variant_field(GRID_PLANNER, "grid_planner", "system_prompt") is None
+    finally:
+        bind_variants(None)
+
+
+def test_stats_and_compare():
+    """按变体汇总耗时、Token、JSON成功率和LayoutGuard首次通过率，重新加载后样本仍在"""
+    root = tempfile.mkdtemp()
+    stats = ExperimentStats(root)
+    for i in range(4):
+        stats.record_call("grid_planner", "default", 2.0, input_tokens=1200, output_tokens=300, json_failed=False)
+        stats.record_call("grid_planner", "short", 1.0, input_tokens=400, output_tokens=280, json_failed=(i == 0))
+        stats.record_check("grid_planner", "default", "layout_guard_first_attempt", True)
+        stats.record_check("grid_planner", "short", "layout_guard_first_attempt", i % 2 == 0)
+
+    report = ExperimentStats(root).compare({"grid_planner": GRID_PLANNER}, min_samples=4)["grid_planner"]
+    short = report["variants"]["short"]
+    assert short["calls"] == 4 and short["input_tokens_mean"] == 400
+    assert short["json_success_rate"] == 0.75
+    assert short["checks"]["layout_guard_first_attempt"] == {"samples": 4, "pass_rate": 0.5}
+    assert report["variants"]["default"]["weight"] == 3.0 and "retired" not in report["variants"]
+    assert report["fastest"] == "short" and report["most_reliable"] == "default"
+
+    # 样本不足时不给出结论
+    assert stats.compare({"grid_planner": GRID_PLANNER}, min_samples=5)["grid_planner"]["fastest"] is None
+
+
+if __name__ == '__main__':
+    test_assignment()
+    test_variant_fields()
+    test_stats_and_compare()
+    print("✅ prompt变体实验测试通过")
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+测试生成接口的响应详略（final/summary/full、fields）和按运行ID获取中间产物
+"""
+
+import json
+import sys
+
+import app
+from response_detail import parse_detail, shape_payload, shape_results
+from run_checkpoint import RunCheckpoints
+from testkit import run_tests
+
+RAW = "模型输出的不是JSON " * 200
+
+SCRIPT_RESULTS = {
+    "lua_checks": {"stage_programmer": {"status": "ok", "attempts": 1, "errors": []}},
+    "blueprint": {"title": "夜袭"},
+    "stage_design": app.extract_json_from_response(RAW),
+    "stage_lua": "-- Stage",
+    "casting_design": {"roles": []},
+    "cast_lua": "-- Cast",
+    "main_lua": "-- main",
+}
+
+
+def test_shape_results():
+    """final只有最终产物；summary把中间产物换成引用，JSON解析失败的输出不带原始文本"""
+    final = shape_results(SCRIPT_RESULTS, "script", "run-1", "final")
+    assert final == {"stage_lua": "-- Stage", "cast_lua": "-- Cast", "main_lua": "-- main"}
+
+    summary = shape_results(SCRIPT_RESULTS, "script", "run-1", "summary")
+    assert summary["lua_checks"] == SCRIPT_RESULTS["lua_checks"] and summary["main_lua"] == "-- main"
+    assert summary["blueprint"] == {"ref": "/api/runs/run-1/results/blueprint"}
+    assert summary["stage_design"]["raw_chars"] == len(RAW) and "raw" not in summary["stage_design"]
+    assert "raw_preview" not in SCRIPT_RESULTS["stage_design"]
+
+    level = {"validated_result": {"status": "valid", "errors": [], "layout": {"grid_ascii": ["#"]}},
+             "level_export": {"packed_bytes": 48, "data_base64": "AAAA"}, "level_lua": "-- Level"}
+    summary = shape_results(level, "level", "run-2", "summary")
+    assert summary["validated_result"] == {"status": "valid", "errors": []}
+    assert summary["level_export"] == {"packed_bytes": 48}
+    assert "layout" in level["validated_result"]
+
+    assert shape_results(SCRIPT_RESULTS, "script", "run-1", fields=["blueprint", "missing"]) == {
+        "blueprint": {"title": "夜袭"}}
+    assert shape_results(SCRIPT_RESULTS, "script", "run-1", "full") is SCRIPT_RESULTS
+
+
+def test_shape_payload_and_params():
+    """失败的响应和full原样返回；detail默认取配置，无效值报错"""
+    payload = {"success": True, "run_id": "run-1", "results": SCRIPT_RESULTS, "saved_files": {}}
+    assert shape_payload(payload, "script") is payload
+    shaped = shape_payload(payload, "script", "final")
+    assert shaped["detail"] == "final" and shaped["results_url"] == "/api/runs/run-1/results"
+    assert payload["results"] is SCRIPT_RESULTS and "detail" not in payload
+    error = {"error": "失败", "run_id": "run-1"}
+    assert shape_payload(error, "script", "final") is error
+
+    assert parse_detail({}, {}) == (("full", None), None)
+    assert parse_detail({}, {"response": {"detail": "summary"}})[0] == ("summary", None)
+    assert parse_detail({"detail": "final", "fields": "blueprint, main_lua"}, {})[0] == (
+        "final", ["blueprint", "main_lua"])
+    assert parse_detail({"detail": "tiny"}, {})[1][1] == 400
+    assert parse_detail({"fields": 3}, {})[1][1] == 400
+
+
+def test_run_results_endpoint(app_env):
+    """已完成的运行返回保存的结果，未完成的运行返回检查点"""
+    store = app_env.store
+    run = RunCheckpoints.start(store, "script", {"user_input": "潜入城堡"})
+    run.save("blueprint", {"title": "夜袭"})
+    client = app.app.test_client()
+    partial = client.get(f"/api/runs/{run.run_id}/results").get_json()
+    assert partial["complete"] is False and partial["results"] == {"blueprint": {"title": "夜袭"}}
+
+    store.save_run("script", {"results.json": json.dumps(SCRIPT_RESULTS, ensure_ascii=False)},
+                   run_id=run.run_id, meta={"status": "completed"})
+    field = client.get(f"/api/runs/{run.run_id}/results/stage_design").get_json()
+    assert field["value"]["raw"] == RAW
+    selected = client.get(f"/api/runs/{run.run_id}/results?fields=main_lua,cast_lua").get_json()
+    assert selected["complete"] and selected["results"] == {"main_lua": "-- main", "cast_lua": "-- Cast"}
+    assert client.get(f"/api/runs/{run.run_id}/results/missing").status_code == 404
+    assert client.get("/api/runs/missing-run/results").status_code == 404
+
+    # 文件列表中的results.json指向结果接口（下载接口不提供results.json）
+    files = client.get(f"/api/files?run_id={run.run_id}").get_json()["files"]
+    path = next(item["path"] for item in files if item["name"] == "results.json")
+    assert path == f"/api/runs/{run.run_id}/results" and client.get(path).status_code == 200
+
+
+if __name__ == '__main__':
+    sys.exit(run_tests(__file__, "✅ 响应详略测试通过"))
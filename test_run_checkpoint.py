@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+测试流水线检查点（保存、继续运行、垃圾回收时保留检查点内容）
+"""
+
+import sys
+import tempfile
+
+import app
+from artifact_store import ArtifactStore
+from run_checkpoint import RunCheckpoints
+from testkit import run_tests
+
+# 实体数量与默认Intent不一致，LayoutGuard总是验证失败
+INVALID_LAYOUT = {"grid_meta": {"width": 5, "height": 3}, "grid_ascii": ["#####", "#S.D#", "#####"],
+                  "entities": {"player_start": {"x": 1, "y": 1}, "doors": [{"x": 3, "y": 1}]}}
+
+
+def test_resume_skips_completed_steps():
+    """继续运行时已完成的步骤直接使用检查点，失败的步骤重新执行"""
+    with tempfile.TemporaryDirectory() as root:
+        store = ArtifactStore(root)
+        run = RunCheckpoints.start(store, "script", {"user_input": "潜入城堡"})
+        assert run.step("blueprint", lambda: {"title": "夜袭"}) == {"title": "夜袭"}
+        run.step("stage_design", lambda: {"error": "Failed to parse JSON"}, keep=lambda v: "error" not in v)
+        try:
+            run.step("stage_lua", lambda: 1 / 0)
+        except ZeroDivisionError:
+            run.mark("failed", failed_step=run.current)
+
+        resumed = RunCheckpoints.resume(store, run.run_id)
+        assert resumed.request == {"user_input": "潜入城堡"}
+        assert resumed.meta["failed_step"] == "stage_lua"
+        calls = []
+        assert resumed.step("blueprint", lambda: calls.append("blueprint")) == {"title": "夜袭"}
+        resumed.step("stage_design", lambda: calls.append("stage_design") or {"ok": True})
+        assert calls == ["stage_design"]
+        assert resumed.restored == ["blueprint"]
+
+
+def test_gc_keeps_checkpoint_objects():
+    """检查点引用的内容对象不会被当作未引用对象回收"""
+    with tempfile.TemporaryDirectory() as root:
+        store = ArtifactStore(root, max_total_mb=100)
+        run = RunCheckpoints.start(store, "level", {"user_input": "墓地"})
+        run.save("intent", {"grid": {"width": 20, "height": 12}})
+        store.gc()
+        assert store.load_checkpoints(run.run_id) == {"intent": {"grid": {"width": 20, "height": 12}}}
+        assert RunCheckpoints.resume(store, "missing-run") is None
+
+
+def test_level_pipeline_skips_failed_outputs(app_env):
+    """Intent Parser解析失败和没有通过验证的布局不保存检查点，继续运行时重新调用"""
+    calls = []
+
+    def fake_call(module_name, prompt, config, system_prompt=None, n=1):
+        calls.append(module_name)
+        if module_name == "intent_parser":
+            return app.extract_json_from_response("不是JSON")
+        return INVALID_LAYOUT
+
+    config = {"api_config": {"api_key": "k"}, "layout_library": {"enabled": False},
+              "modules": {"intent_parser": {"prompt_template": "{user_input}", "json_mode": True},
+                          "grid_planner": {"json_mode": True}}}
+    app_env.fake_llm(fake_call)
+    payload, _ = app.run_level_pipeline("墓地", config)
+    assert payload["results"]["validated_result"]["status"] == "invalid"
+    assert app_env.store.load_checkpoints(payload["run_id"]) == {}
+
+    calls.clear()
+    app.run_level_pipeline("墓地", config, resume=RunCheckpoints.resume(app_env.store, payload["run_id"]))
+    assert calls[:2] == ["intent_parser", "grid_planner"]
+
+
+if __name__ == '__main__':
+    sys.exit(run_tests(__file__, "✅ 检查点测试通过"))
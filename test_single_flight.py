@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+测试进行中请求合并
+"""
+
+import threading
+import time
+
+from single_flight import SingleFlight
+
+
+def test_concurrent_calls_share_one_execution():
+    """相同键的并发调用只执行一次，全部拿到同一个结果"""
+    flight = SingleFlight()
+    executions = []
+    release = threading.Event()
+    results = []
+
+    def work():
+        executions.append(1)
+        release.wait(5)
+        return {"run_id": "r1"}
+
+    def caller():
+        results.append(flight.do("key", work))
+
+    threads = [threading.Thread(target=caller) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    while flight.stats()["waiting"] < 4:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(executions) == 1
+    assert all(result is results[0][0] for result, _ in results)
+    assert sorted(shared for _, shared in results) == [False, True, True, True, True]
+    stats = flight.stats()
+    assert (stats["executed"], stats["coalesced"], stats["in_flight"]) == (1, 4, 0)
+
+
+def test_errors_propagate_and_key_is_released():
+    """异常传给所有等待者，完成后相同的键重新执行"""
+    flight = SingleFlight()
+
+    def fail():
+        raise ValueError("boom")
+
+    try:
+        flight.do("key", fail)
+        assert False, "应该抛出异常"
+    except ValueError:
+        pass
+    assert flight.do("key", lambda: 42) == (42, False)
+
+
+if __name__ == '__main__':
+    test_concurrent_calls_share_one_execution()
+    test_errors_propagate_and_key_is_released()
+    print("✅ 请求合并测试通过")
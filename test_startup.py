@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+测试启动优化（延迟导入OpenAI SDK、客户端缓存、prompt模板预解析、预热阶段记录）
+"""
+
+import subprocess
+import sys
+
+import app
+from startup import StartupTimeline
+
+
+def test_import_does_not_load_openai():
+    """导入app时不加载OpenAI SDK"""
+    code = "import sys; import app; print('openai' in sys.modules)"
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert out.stdout.strip().splitlines()[-1] == "False"
+
+
+def test_timeline():
+    """阶段耗时、失败阶段只记录错误、预热完成状态"""
+    timeline = StartupTimeline()
+    with timeline.phase("client"):
+        pass
+    with timeline.phase("connection"):
+        raise OSError("连接被拒绝")
+    timeline.mark("ready")
+    report = timeline.snapshot()
+    assert [phase["name"] for phase in report["phases"]] == ["client", "connection"]
+    assert report["errors"] == {"connection": "连接被拒绝"}
+    assert report["ready"] and report["ready_ms"] >= 0
+
+
+def test_client_cache():
+    """相同API密钥和Base URL复用同一个客户端"""
+    first = app.get_client({"api_key": "k1", "base_url": "http://127.0.0.1:9/v1"})
+    assert app.get_client({"api_key": "k1", "base_url": "http://127.0.0.1:9/v1"}) is first
+    assert app.get_client({"api_key": "k2", "base_url": "http://127.0.0.1:9/v1"}) is not first
+    try:
+        app.get_client({"api_key": ""})
+        assert False, "未配置API密钥时应该报错"
+    except ValueError:
+        pass
+
+
+def test_parse_prompt_templates():
+    """预解析模板：占位符、流水线不提供的占位符、格式错误"""
+    parsed = app.parse_prompt_templates({"modules": {
+        "screenwriter": {"prompt_template": "想法: {user_input}，风格: {style}"},
+        "stage_design": {"prompt_template": "蓝图 {blueprint"},
+        "grid_planner": {"prompt_template": ""},
+        "custom": {"prompt_template": "{anything}"},
+    }})
+    assert parsed["screenwriter"] == {"fields": ["style", "user_input"], "unknown": ["style"]}
+    assert "error" in parsed["stage_design"]
+    assert "grid_planner" not in parsed
+    assert parsed["custom"]["unknown"] == []
+
+
+def test_warm_up_without_api_key():
+    """没有API密钥时跳过客户端和连接阶段，其余阶段照常完成"""
+    app.warm_up({"modules": {"screenwriter": {"prompt_template": "{user_input}"}}})
+    report = app.startup.snapshot()
+    names = [phase["name"] for phase in report["phases"]]
+    assert names[:2] == ["imports", "app_setup"]
+    assert {"import_openai", "templates", "stores"} <= set(names) and "client" not in names
+    assert report["ready"] and report["details"]["templates"]["screenwriter"]["fields"] == ["user_input"]
+
+
+if __name__ == '__main__':
+    test_import_does_not_load_openai()
+    test_timeline()
+    test_client_cache()
+    test_parse_prompt_templates()
+    test_warm_up_without_api_key()
+    print("✅ 启动优化测试通过")
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+测试模块用量统计与自动调参建议
+"""
+
+import sys
+import tempfile
+
+import app
+from testkit import CountingClient, run_tests
+from usage_stats import UsageStats
+
+TUNING = {"min_samples": 10, "target_failure_rate": 0.1}
+
+
+def test_max_tokens_follows_percentile():
+    """样本不足时保持配置，足够后按分位数加余量取整"""
+    stats = UsageStats(None)
+    config = {"max_tokens": 2000}
+    for i in range(9):
+        stats.record("screenwriter", "gpt-4o", 1.0, output_tokens=400 + i)
+    assert stats.recommend("screenwriter", config, TUNING)["max_tokens"] == 2000
+    stats.record("screenwriter", "gpt-4o", 1.0, output_tokens=800)
+    # p99 ≈ 764，乘1.25后向上取整到100
+    assert stats.recommend("screenwriter", config, TUNING)["max_tokens"] == 1000
+
+
+def test_truncation_raises_limit():
+    """近期截断率超标时放大max_tokens"""
+    stats = UsageStats(None)
+    for _ in range(10):
+        stats.record("grid_planner", "gpt-4o", 1.0, output_tokens=500, max_tokens=500, truncated=True)
+    assert stats.recommend("grid_planner", {"max_tokens": 500}, TUNING)["max_tokens"] == 800
+
+
+def test_reasoning_effort_steps_down_until_failures():
+    """失败率达标时逐级降低推理强度，下一级失败率超标时停止"""
+    stats = UsageStats(None)
+    config = {"reasoning_effort": "high"}
+    for _ in range(10):
+        stats.record("screenwriter", "gpt-5.1-codex", 5.0, output_tokens=100, reasoning_effort="high")
+    assert stats.recommend("screenwriter", config, TUNING)["reasoning_effort"] == "medium"
+    for _ in range(10):
+        stats.record("screenwriter", "gpt-5.1-codex", 2.0, output_tokens=100, reasoning_effort="medium")
+    assert stats.recommend("screenwriter", config, TUNING)["reasoning_effort"] == "low"
+    for _ in range(10):
+        stats.record("screenwriter", "gpt-5.1-codex", 1.0, output_tokens=100, reasoning_effort="low",
+                     json_failed=True)
+    assert stats.recommend("screenwriter", config, TUNING)["reasoning_effort"] == "medium"
+
+    report = stats.report({"screenwriter": config}, TUNING)["screenwriter"]
+    assert report["estimated_latency_saved_s"] == 3.0
+    assert report["by_reasoning_effort"]["low"]["failure_rate"] == 1.0
+
+
+def test_chat_calls_record_no_reasoning_effort(app_env):
+    """chat.completions调用不发送reasoning参数，样本的推理强度为None；responses API调用记录实际发送的强度"""
+    config = {"api_config": {"api_key": "k", "model": "gpt-4o"},
+              "modules": {"grid_planner": {"json_mode": True},
+                          "stage_programmer": {"model": "gpt-5.1-codex", "reasoning_effort": "medium"}}}
+    app_env.fake_client(CountingClient())
+    app.call_gpt_module("grid_planner", "prompt", config)
+    app.call_gpt_module("grid_planner", "prompt", config, n=2)
+    app.call_gpt_module("stage_programmer", "prompt", config)
+    stats = app.get_usage_stats()
+    assert [s["reasoning_effort"] for s in stats.samples("grid_planner")] == [None, None, None]
+    assert stats.samples("stage_programmer")[0]["reasoning_effort"] == "medium"
+    assert stats.report(config["modules"])["grid_planner"]["by_reasoning_effort"] == {}
+
+
+def test_samples_persist():
+    """重新加载后保留样本"""
+    with tempfile.TemporaryDirectory() as root:
+        UsageStats(root).record("screenwriter", "gpt-4o", 1.5, output_tokens=300)
+        reloaded = UsageStats(root)
+        assert reloaded.summary("screenwriter")["output_tokens"]["max"] == 300
+
+
+if __name__ == '__main__':
+    sys.exit(run_tests(__file__, "✅ 用量统计测试通过"))
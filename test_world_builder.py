@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+测试大地图分块生成（区块规划、通道、区块验证、拼接和连通性检查）
+"""
+
+import random
+import re
+import sys
+
+import app
+from app import world_to_lua
+from mock_llm_server import build_grid_layout
+from testkit import WORLD_INTENT, build_tiles, run_tests
+from world_builder import (TooManyTiles, plan_tiles, distribute_counts, plan_gates, validate_tile, stitch_world,
+                           check_world_connectivity)
+
+
+def test_plan_tiles():
+    """区块覆盖整张地图，过短的最后一段并入前一个区块"""
+    tiles = plan_tiles(23, 12, 10, 6)
+    assert [(t["x"], t["width"]) for t in tiles if t["ty"] == 0] == [(0, 10), (10, 13)]
+    assert sum(t["width"] * t["height"] for t in tiles) == 23 * 12
+    assert len(plan_tiles(20, 12, 40, 30)) == 1
+    assert len(plan_tiles(23, 12, 10, 6, max_tiles=4)) == 4
+    try:
+        plan_tiles(23, 12, 10, 6, max_tiles=3)
+        assert False, "应该报错"
+    except TooManyTiles as e:
+        assert "4 个区块" in str(e)
+
+
+def test_distribute_counts():
+    """实体总数不变，门放在离起点最远的区块"""
+    tiles = plan_tiles(23, 12, 10, 6)
+    counts = distribute_counts(WORLD_INTENT["counts"], tiles)
+    for key, total in WORLD_INTENT["counts"].items():
+        assert sum(c[key] for c in counts) == total
+    assert counts[-1]["door"] >= 1 and counts[0]["door"] == 0
+
+
+def test_gates_are_adjacent():
+    """每对相邻区块一个通道，两个通道格子在世界中相邻且分属两个区块"""
+    tiles = plan_tiles(23, 12, 10, 6)
+    gates = plan_gates(tiles, random.Random(0))
+    assert len(gates) == 4
+    for gate in gates:
+        (ax, ay), (bx, by) = gate["world"]
+        assert abs(ax - bx) + abs(ay - by) == 1
+
+
+def test_validate_tile():
+    """生成的区块通过验证；堵住通道或边界开口时验证失败"""
+    _, _, intents, layouts = build_tiles()
+    for intent, layout in zip(intents, layouts):
+        assert validate_tile(intent, layout) == (True, [])
+
+    intent, layout = intents[1], layouts[1]
+    gate = intent["tile"]["gates"][0]
+    blocked = [list(row) for row in layout["grid_ascii"]]
+    blocked[gate["y"]][gate["x"]] = '#'
+    assert validate_tile(intent, dict(layout, grid_ascii=[''.join(r) for r in blocked]))[1][0]["code"] == "gate_blocked"
+
+    opened = [list(row) for row in layout["grid_ascii"]]
+    opened[0][2] = '.'
+    assert validate_tile(intent, dict(layout, grid_ascii=[''.join(r) for r in opened]))[1][0]["code"] == "border_open"
+
+    # LLM返回的坐标不是整数或实体格式不对时记为验证错误（区块会重新生成），不抛出异常
+    enemy = layout["entities"]["enemies"][0]
+    bad_coordinates = dict(layout["entities"], enemies=[dict(enemy, x=str(enemy["x"]))])
+    assert validate_tile(intent, dict(layout, entities=bad_coordinates))[1][0]["code"] == "enemies_mismatch"
+    assert validate_tile(intent, dict(layout, entities=dict(layout["entities"], enemies=[None])))[1][0]["code"] == "invalid_format"
+    assert validate_tile(intent, dict(layout, entities=["enemies"]))[1][0]["code"] == "invalid_format"
+
+
+def test_stitch_and_connectivity():
+    """拼接后实体坐标为世界坐标，整张地图连通；封死通道后报告不可达的区块"""
+    tiles, gates, _, layouts = build_tiles()
+    world = stitch_world(23, 12, tiles, layouts)
+    assert len(world["grid_ascii"]) == 12 and all(len(row) == 23 for row in world["grid_ascii"])
+    assert len(world["entities"]["enemies"]) == 5 and len(world["entities"]["doors"]) == 2
+    for door in world["entities"]["doors"]:
+        assert world["grid_ascii"][door["y"]][door["x"]] == 'D'
+    connected, report = check_world_connectivity(world, tiles)
+    assert connected and report["unreachable_tiles"] == []
+
+    rows = [list(row) for row in world["grid_ascii"]]
+    for gate in gates:
+        for x, y in gate["world"]:
+            rows[y][x] = '#'
+    closed = dict(world, grid_ascii=[''.join(r) for r in rows])
+    connected, report = check_world_connectivity(closed, tiles)
+    assert not connected and len(report["unreachable_tiles"]) == len(tiles) - 1
+
+
+def test_world_to_lua():
+    """每个区块一个带世界坐标偏移的AllocBlock，区块内物体使用区块内坐标"""
+    tiles, _, _, layouts = build_tiles()
+    lua = world_to_lua(tiles, layouts, 'Env.SetEnvironment("Fog", "Night")')
+    assert lua.startswith('Env.SetEnvironment("Fog", "Night")')
+    assert 'local block_1_0 = Env.AllocBlock(13, 6, 10, 0)' in lua
+    assert 'local block_1_1 = Env.AllocBlock(13, 6, 10, 6)' in lua
+    assert 'Env.PlaceItem(block_1_1, "Wall_Stone", 12, 5)' in lua
+
+
+def test_world_to_lua_many_tiles():
+    """区块超过200个时，每个区块的局部变量在自己的 do ... end 中，顶层没有局部变量"""
+    world_intent = dict(WORLD_INTENT, grid={"width": 75, "height": 75}, counts={})
+    tiles, _, _, layouts = build_tiles(world_intent, 5, 5)
+    assert len(tiles) == 225
+    depth, top_level_locals = 0, 0
+    for line in world_to_lua(tiles, layouts).splitlines():
+        if line == "do":
+            depth += 1
+        elif line == "end":
+            depth -= 1
+        elif depth == 0 and re.match(r"local\b", line):
+            top_level_locals += 1
+    assert depth == 0 and top_level_locals == 0
+
+
+def test_pipeline_rejects_too_many_tiles(app_env):
+    """区块数量超过 world.max_tiles 时返回400，不调用Grid Planner"""
+    calls = []
+
+    def fake_call(module_name, prompt, config, system_prompt=None, n=1):
+        calls.append(module_name)
+        return dict(WORLD_INTENT, grid={"width": 800, "height": 600})
+
+    config = {"api_config": {"api_key": "k"}, "world": {"max_tiles": 100},
+              "modules": {"intent_parser": {"json_mode": True}, "grid_planner": {"json_mode": True}}}
+    app_env.fake_llm(fake_call)
+    payload, status = app.run_level_pipeline("巨大的墓地", config, world={})
+    assert status == 400 and payload["error_type"] == "TooManyTiles"
+    assert "grid_planner" not in calls
+
+
+def test_pipeline_retries_tiles_with_bad_coordinates(app_env):
+    """区块坐标不是整数时重新生成该区块；tile_retries为0时每个区块仍尝试一次"""
+    for tile_retries, bad_first in ((2, True), (0, False)):
+        prompts = []
+
+        def fake_call(module_name, prompt, config, system_prompt=None, n=1):
+            if module_name == "intent_parser":
+                return dict(WORLD_INTENT)
+            layout = build_grid_layout(prompt)
+            if bad_first and prompt not in prompts:
+                enemies = [dict(enemy, x=None) for enemy in layout["entities"]["enemies"]]
+                layout = dict(layout, entities=dict(layout["entities"], enemies=enemies or [{"x": None, "y": 1}]))
+            prompts.append(prompt)
+            return layout
+
+        config = {"api_config": {"api_key": "k"}, "world": {"tile_retries": tile_retries},
+                  "modules": {"intent_parser": {"json_mode": True}, "grid_planner": {"json_mode": True}}}
+        app_env.fake_llm(fake_call)
+        payload, status = app.run_level_pipeline("废弃墓地", config, world={"tile_width": 10, "tile_height": 6})
+        assert status == 200, payload
+        assert len(set(prompts)) == 4 and len(prompts) == (8 if bad_first else 4)
+
+
+if __name__ == '__main__':
+    sys.exit(run_tests(__file__, "✅ 大地图分块生成测试通过"))
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+测试共用的辅助函数和假客户端（不是测试文件，pytest不会收集）
+"""
+
+import json
+import random
+from types import SimpleNamespace
+
+import pytest
+
+from mock_llm_server import build_grid_layout
+from world_builder import plan_tiles, distribute_counts, plan_gates, tile_gates, tile_intent, tile_prompt_suffix
+
+WORLD_INTENT = {
+    "theme": "废弃墓地",
+    "grid": {"width": 23, "height": 12},
+    "counts": {"enemy": 5, "npc": 2, "chest": 3, "door": 2},
+}
+
+
+def run_tests(path, message):
+    """直接运行测试文件时用pytest执行（可以使用conftest.py中的fixture），全部通过时打印message"""
+    exit_code = pytest.main([path, "-q"])
+    if exit_code == 0:
+        print(message)
+    return exit_code
+
+
+class CountingClient:
+    """每次调用返回带序号的输出；fail_with不为空时抛出该错误"""
+
+    def __init__(self, fail_with=None):
+        self.calls = 0
+        self.fail_with = fail_with
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+        self.responses = SimpleNamespace(create=self.create_response)
+
+    def create(self, **params):
+        self.calls += 1
+        if self.fail_with:
+            raise Exception(self.fail_with)
+        choices = [SimpleNamespace(message=SimpleNamespace(content=f'{{"call": {self.calls}, "choice": {i}}}'),
+                                   finish_reason="length" if i else "stop") for i in range(params.get("n", 1))]
+        usage = SimpleNamespace(prompt_tokens=120, completion_tokens=40,
+                                completion_tokens_details=SimpleNamespace(reasoning_tokens=8))
+        return SimpleNamespace(choices=choices, usage=usage)
+
+    def create_response(self, **params):
+        self.calls += 1
+        usage = SimpleNamespace(input_tokens=150, output_tokens=60, output_tokens_details=None)
+        return SimpleNamespace(output_text=f"-- call {self.calls}", usage=usage, status="completed")
+
+
+def build_tiles(world_intent=WORLD_INTENT, tile_width=10, tile_height=6):
+    """用模拟服务器的布局生成器生成所有区块"""
+    grid = world_intent["grid"]
+    tiles = plan_tiles(grid["width"], grid["height"], tile_width, tile_height)
+    gates = plan_gates(tiles, random.Random(1))
+    counts = distribute_counts(world_intent["counts"], tiles)
+    intents, layouts = [], []
+    for index, tile in enumerate(tiles):
+        intent = tile_intent(world_intent, tile, counts[index], tile_gates(index, tiles, gates), index == 0)
+        prompt = "User:\n" + json.dumps({"intent": intent}, ensure_ascii=False) + tile_prompt_suffix(intent)
+        intents.append(intent)
+        layouts.append(build_grid_layout(prompt))
+    return tiles, gates, intents, layouts
@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+模块用量统计与自动调参：记录每次LLM调用的输出Token数、耗时、截断和JSON解析失败，
+并根据历史分位数给出各模块的 max_tokens 和 reasoning_effort 建议值
+"""
+
+import json
+import math
+import os
+import threading
+import time
+from collections import defaultdict, deque
+
+from artifact_store import atomic_write
+
+STATS_FILE = "usage_stats.jsonl"
+
+# 推理强度从低到高
+REASONING_LEVELS = ["low", "medium", "high"]
+
+DEFAULT_TUNING = {
+    "min_samples": 20,           # 样本数少于该值时不调整
+    "percentile": 99,            # max_tokens 取输出Token数的该分位数
+    "headroom": 1.25,            # 在分位数基础上预留的余量
+    "min_tokens": 256,
+    "max_tokens_cap": 16000,
+    "target_failure_rate": 0.02,  # 截断+JSON解析失败率的目标上限
+}
+
+
+def percentile(values, pct):
+    """线性插值计算分位数"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100.0
+    lower = int(k)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (k - lower)
+
+
+def _mean(values):
+    return sum(values) / len(values) if values else None
+
+
+def _is_failure(sample):
+    return bool(sample.get("truncated") or sample.get("json_failed"))
+
+
+class UsageStats:
+    """
+    按模块保存最近 window 次调用的样本
+    样本追加写入JSONL文件，启动时只加载每个模块最近的样本，并压缩文件
+    """
+
+    def __init__(self, root="output", window=500):
+        self.path = os.path.join(root, STATS_FILE) if root else None
+        self.window = window
+        self._lock = threading.Lock()
+        self._samples = defaultdict(lambda: deque(maxlen=self.window))
+        if self.path and os.path.exists(self.path):
+            self._load()
+
+    def _load(self):
+        total = 0
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    sample = json.loads(line)
+                except ValueError:
+                    continue
+                total += 1
+                self._samples[sample["module"]].append(sample)
+        kept = sum(len(samples) for samples in self._samples.values())
+        if total > kept * 2:
+            lines = [json.dumps(s, ensure_ascii=False) + "\n" for samples in self._samples.values() for s in samples]
+            atomic_write(self.path, "".join(lines).encode('utf-8'))
+
+    def record(self, module, model, latency, output_tokens=None, reasoning_tokens=None, max_tokens=None,
+               reasoning_effort=None, truncated=False, json_failed=False):
+        """记录一次调用"""
+        sample = {
+            "module": module,
+            "model": model,
+            "time": time.time(),
+            "latency": round(latency, 4),
+            "output_tokens": output_tokens,
+            "reasoning_tokens": reasoning_tokens,
+            "max_tokens": max_tokens,
+            "reasoning_effort": reasoning_effort,
+            "truncated": bool(truncated),
+            "json_failed": bool(json_failed),
+        }
+        with self._lock:
+            self._samples[module].append(sample)
+            if self.path:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(sample, ensure_ascii=False) + "\n")
+
+    def samples(self, module):
+        with self._lock:
+            return list(self._samples.get(module, ()))
+
+    def modules(self):
+        with self._lock:
+            return sorted(self._samples)
+
+    def summary(self, module):
+        """某个模块的用量汇总"""
+        samples = self.samples(module)
+        tokens = [s["output_tokens"] for s in samples if s.get("output_tokens") is not None]
+        latencies = [s["latency"] for s in samples]
+        return {
+            "samples": len(samples),
+            "output_tokens": {
+                "p50": percentile(tokens, 50),
+                "p95": percentile(tokens, 95),
+                "p99": percentile(tokens, 99),
+                "max": max(tokens) if tokens else None,
+            },
+            "latency_s": {"mean": _mean(latencies), "p50": percentile(latencies, 50), "p95": percentile(latencies, 95)},
+            "truncation_rate": _mean([1.0 if s.get("truncated") else 0.0 for s in samples]),
+            "json_failure_rate": _mean([1.0 if s.get("json_failed") else 0.0 for s in samples]),
+        }
+
+    def recommend(self, module, module_config, tuning=None):
+        """
+        根据历史样本给出建议值，样本不足时保持当前配置
+        - max_tokens: 输出Token数的高分位数加余量；近期截断率超标时在当前值基础上放大
+        - reasoning_effort: 从当前配置开始逐级降低，只要该级别的失败率不超过目标；
+          下一级样本不足时先降一级试探，积累样本后再决定
+        """
+        tuning = dict(DEFAULT_TUNING, **(tuning or {}))
+        samples = self.samples(module)
+        current_tokens = module_config.get("max_tokens", 2000)
+        current_effort = module_config.get("reasoning_effort", "high")
+        result = {"max_tokens": current_tokens, "reasoning_effort": current_effort}
+        if len(samples) < tuning["min_samples"]:
+            return result
+
+        tokens = [s["output_tokens"] for s in samples if s.get("output_tokens") is not None]
+        if len(tokens) >= tuning["min_samples"]:
+            suggested = percentile(tokens, tuning["percentile"]) * tuning["headroom"]
+            recent = samples[-tuning["min_samples"]:]
+            truncation_rate = _mean([1.0 if s.get("truncated") else 0.0 for s in recent])
+            if truncation_rate > tuning["target_failure_rate"]:
+                suggested = max(suggested, current_tokens * 1.5)
+            suggested = int(math.ceil(suggested / 100.0) * 100)
+            result["max_tokens"] = max(tuning["min_tokens"], min(tuning["max_tokens_cap"], suggested))
+
+        if current_effort in REASONING_LEVELS:
+            by_effort = defaultdict(list)
+            for s in samples:
+                by_effort[s.get("reasoning_effort")].append(s)
+            level = REASONING_LEVELS.index(current_effort)
+            while level > 0:
+                here = by_effort.get(REASONING_LEVELS[level], [])
+                if len(here) < tuning["min_samples"] or _mean([_is_failure(s) for s in here]) > tuning["target_failure_rate"]:
+                    break
+                lower = by_effort.get(REASONING_LEVELS[level - 1], [])
+                if len(lower) >= tuning["min_samples"] and _mean([_is_failure(s) for s in lower]) > tuning["target_failure_rate"]:
+                    break
+                level -= 1
+                if len(lower) < tuning["min_samples"]:
+                    break
+            result["reasoning_effort"] = REASONING_LEVELS[level]
+        return result
+
+    def report(self, modules_config, tuning=None):
+        """
+        各模块的用量、建议值，以及按历史样本估算的效果：
+        - 预计截断率: 历史输出中超过建议max_tokens的比例
+        - 预计节省耗时: 当前推理强度与建议推理强度的平均耗时之差
+        """
+        report = {}
+        for module in sorted(set(modules_config) | set(self.modules())):
+            module_config = modules_config.get(module, {})
+            samples = self.samples(module)
+            entry = self.summary(module)
+            entry["current"] = {
+                "max_tokens": module_config.get("max_tokens", 2000),
+                "reasoning_effort": module_config.get("reasoning_effort", "high"),
+            }
+            recommended = self.recommend(module, module_config, tuning)
+            entry["recommended"] = recommended
+
+            tokens = [s["output_tokens"] for s in samples if s.get("output_tokens") is not None]
+            entry["projected_truncation_rate"] = (
+                _mean([1.0 if t > recommended["max_tokens"] else 0.0 for t in tokens]) if tokens else None
+            )
+
+            by_effort = defaultdict(list)
+            for s in samples:
+                by_effort[s.get("reasoning_effort")].append(s)
+            entry["by_reasoning_effort"] = {
+                effort: {
+                    "samples": len(rows),
+                    "mean_latency_s": _mean([s["latency"] for s in rows]),
+                    "failure_rate": _mean([1.0 if _is_failure(s) else 0.0 for s in rows]),
+                }
+                for effort, rows in by_effort.items() if effort
+            }
+            current_latency = entry["by_reasoning_effort"].get(entry["current"]["reasoning_effort"], {})
+            tuned_latency = entry["by_reasoning_effort"].get(recommended["reasoning_effort"], {})
+            if current_latency.get("samples") and tuned_latency.get("samples"):
+                entry["estimated_latency_saved_s"] = current_latency["mean_latency_s"] - tuned_latency["mean_latency_s"]
+            else:
+                entry["estimated_latency_saved_s"] = None
+            report[module] = entry
+        return report
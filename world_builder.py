@@ -0,0 +1,295 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+大地图分块生成：把大地图切成多个区块，每个区块单独调用Grid Planner（可并行），
+区块之间通过边界上的通道格子（gate）相连，最后拼接并检查整张地图的连通性
+"""
+
+import random
+from collections import deque
+
+WALKABLE = set('.SCEND')
+ENTITY_SYMBOLS = {'E': "enemies", 'N': "npcs", 'C': "chests", 'D': "doors"}
+COUNT_KEYS = {"enemy": 'E', "npc": 'N', "chest": 'C', "door": 'D'}
+MIN_TILE_SIZE = 5
+
+
+def _split(total, size):
+    """把长度total切成若干段，每段不超过size；最后一段太短时并入前一段"""
+    spans = []
+    start = 0
+    while start < total:
+        length = min(size, total - start)
+        spans.append([start, length])
+        start += length
+    if len(spans) > 1 and spans[-1][1] < MIN_TILE_SIZE:
+        spans[-2][1] += spans.pop()[1]
+    return spans
+
+
+class TooManyTiles(ValueError):
+    """区块数量超过上限（地图太大或区块太小）"""
+
+
+def plan_tiles(width, height, tile_width, tile_height, max_tiles=None):
+    """
+    规划区块，返回按行优先排列的区块列表
+    每个区块: {"tx", "ty", "x", "y", "width", "height"}（x、y为区块左上角在世界中的坐标）
+    max_tiles: 区块数量上限，超过时抛出TooManyTiles（每个区块都要调用一次Grid Planner）
+    """
+    if width < MIN_TILE_SIZE or height < MIN_TILE_SIZE:
+        raise ValueError(f"地图尺寸至少为{MIN_TILE_SIZE}x{MIN_TILE_SIZE}")
+    tile_width = max(MIN_TILE_SIZE, tile_width)
+    tile_height = max(MIN_TILE_SIZE, tile_height)
+    count = len(_split(width, tile_width)) * len(_split(height, tile_height))
+    if max_tiles is not None and count > max_tiles:
+        raise TooManyTiles(f"地图 {width}x{height} 按区块 {tile_width}x{tile_height} 需要 {count} 个区块，"
+                           f"超过上限 {max_tiles}，请增大区块尺寸或减小地图尺寸")
+    tiles = []
+    for ty, (y, h) in enumerate(_split(height, tile_height)):
+        for tx, (x, w) in enumerate(_split(width, tile_width)):
+            tiles.append({"tx": tx, "ty": ty, "x": x, "y": y, "width": w, "height": h})
+    return tiles
+
+
+def distribute_counts(counts, tiles):
+    """
+    把整张地图的实体数量分配到各区块
+    敌人、NPC、宝箱按区块面积比例分配（最大余数法）；门优先放在离起点（第一个区块）最远的区块
+    """
+    areas = [tile["width"] * tile["height"] for tile in tiles]
+    total_area = sum(areas)
+    result = [{key: 0 for key in COUNT_KEYS} for _ in tiles]
+    for key in ("enemy", "npc", "chest"):
+        total = int(counts.get(key, 0))
+        shares = [total * area / total_area for area in areas]
+        for i, share in enumerate(shares):
+            result[i][key] = int(share)
+        remaining = total - sum(r[key] for r in result)
+        order = sorted(range(len(tiles)), key=lambda i: shares[i] - int(shares[i]), reverse=True)
+        for i in order[:remaining]:
+            result[i][key] += 1
+    far_first = sorted(range(len(tiles)), key=lambda i: tiles[i]["tx"] + tiles[i]["ty"], reverse=True)
+    for n in range(int(counts.get("door", 0))):
+        result[far_first[n % len(tiles)]]["door"] += 1
+    return result
+
+
+def plan_gates(tiles, rng=None):
+    """
+    在相邻区块的公共边上各开一个通道格子，返回通道列表
+    每个通道: {"a": 区块下标, "b": 区块下标, "world": [(x, y), (x, y)]}，两个格子分别属于a和b，在世界中相邻
+    """
+    rng = rng or random.Random(0)
+    index = {(tile["tx"], tile["ty"]): i for i, tile in enumerate(tiles)}
+    gates = []
+    for i, tile in enumerate(tiles):
+        right = index.get((tile["tx"] + 1, tile["ty"]))
+        if right is not None:
+            offset = rng.randint(1, tile["height"] - 2)
+            y = tile["y"] + offset
+            gates.append({"a": i, "b": right, "world": [(tile["x"] + tile["width"] - 1, y), (tiles[right]["x"], y)]})
+        below = index.get((tile["tx"], tile["ty"] + 1))
+        if below is not None:
+            offset = rng.randint(1, tile["width"] - 2)
+            x = tile["x"] + offset
+            gates.append({"a": i, "b": below, "world": [(x, tile["y"] + tile["height"] - 1), (x, tiles[below]["y"])]})
+    return gates
+
+
+def tile_gates(tile_index, tiles, gates):
+    """某个区块上的通道格子（区块内坐标）"""
+    tile = tiles[tile_index]
+    cells = []
+    for gate in gates:
+        for owner, (x, y) in zip((gate["a"], gate["b"]), gate["world"]):
+            if owner == tile_index:
+                cells.append({"x": x - tile["x"], "y": y - tile["y"]})
+    return cells
+
+
+def tile_intent(world_intent, tile, counts, gates, has_start):
+    """生成区块的intent：尺寸、实体数量，以及边界和通道约束"""
+    intent = dict(world_intent)
+    intent.pop("environment_lua", None)
+    intent["grid"] = dict(world_intent.get("grid", {}), width=tile["width"], height=tile["height"])
+    intent["counts"] = dict(counts)
+    intent["tile"] = {
+        "position": [tile["tx"], tile["ty"]],
+        "player_start": 1 if has_start else 0,
+        "gates": gates,
+        "border": "all border cells must be '#' except the gate cells, which must be '.'",
+    }
+    return intent
+
+
+TILE_RULES = """
+
+Tile rules (this layout is ONE tile of a larger world; these rules override the hard rules above):
+- The tile is {width}x{height}. Every border cell must be '#', except these gate cells which must be '.': {gates}
+- The tile must contain exactly {starts} 'S' (player start){start_note}
+- The gate cells, the 'S' (if any) and all 'D' cells must be connected through walkable cells inside the tile"""
+
+
+def tile_prompt_suffix(intent):
+    """追加到Grid Planner prompt后面的区块规则"""
+    tile = intent["tile"]
+    gates = ", ".join(f"({g['x']}, {g['y']})" for g in tile["gates"]) or "none"
+    start_note = "; entities.player_start must be omitted or null" if not tile["player_start"] else ""
+    return TILE_RULES.format(width=intent["grid"]["width"], height=intent["grid"]["height"], gates=gates,
+                             starts=tile["player_start"], start_note=start_note)
+
+
+def _is_coordinate(value):
+    """坐标必须是整数（bool不算）"""
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _connected(grid, points):
+    """points中的所有格子是否在同一个连通区域内"""
+    if not points:
+        return True
+    height, width = len(grid), len(grid[0])
+    start = points[0]
+    seen = {start}
+    queue = deque([start])
+    while queue:
+        x, y = queue.popleft()
+        for nx, ny in ((x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1)):
+            if 0 <= nx < width and 0 <= ny < height and (nx, ny) not in seen and grid[ny][nx] in WALKABLE:
+                seen.add((nx, ny))
+                queue.append((nx, ny))
+    return all(point in seen for point in points)
+
+
+def validate_tile(intent, layout):
+    """
+    验证区块布局（validate_layout的区块版本：起点数量可以为0，额外检查边界墙和通道）
+    返回: (is_valid, errors)
+    """
+    def fail(code, detail):
+        return False, [{"code": code, "detail": detail}]
+
+    if not isinstance(layout, dict):
+        return fail("invalid_format", "布局格式无效")
+    width, height = intent["grid"]["width"], intent["grid"]["height"]
+    grid = layout.get("grid_ascii", [])
+    entities = layout.get("entities") or {}
+    if not isinstance(entities, dict):
+        return fail("invalid_format", "entities格式无效")
+    if not isinstance(grid, list) or len(grid) != height or any(not isinstance(row, str) or len(row) != width for row in grid):
+        return fail("dimension_mismatch", f"区块尺寸应为{width}x{height}")
+    for y, row in enumerate(grid):
+        for x, char in enumerate(row):
+            if char not in '. #SCEND':
+                return fail("illegal_char", f"位置({x},{y})包含非法字符: '{char}'")
+
+    starts = [(x, y) for y, row in enumerate(grid) for x, char in enumerate(row) if char == 'S']
+    if len(starts) != intent["tile"]["player_start"]:
+        return fail("player_start_count", f"'S'的数量({len(starts)})应为{intent['tile']['player_start']}")
+    for key, symbol in COUNT_KEYS.items():
+        actual = sum(row.count(symbol) for row in grid)
+        if actual != intent["counts"].get(key, 0):
+            return fail("count_mismatch", f"{key}数量不匹配: 期望{intent['counts'].get(key, 0)}, 实际{actual}")
+    for symbol, key in ENTITY_SYMBOLS.items():
+        items = entities.get(key) or []
+        if not isinstance(items, list) or any(not isinstance(entity, dict) for entity in items):
+            return fail("invalid_format", f"entities.{key}格式无效")
+        for entity in items:
+            ex, ey = entity.get("x", -1), entity.get("y", -1)
+            if not (_is_coordinate(ex) and _is_coordinate(ey)):
+                return fail(f"{key}_mismatch", f"{key}坐标({ex},{ey})不是整数")
+            if not (0 <= ey < height and 0 <= ex < width) or grid[ey][ex] != symbol:
+                return fail(f"{key}_mismatch", f"{key}坐标({ex},{ey})在ASCII中不是'{symbol}'")
+
+    gate_cells = {(g["x"], g["y"]) for g in intent["tile"]["gates"]}
+    for (x, y) in gate_cells:
+        if grid[y][x] != '.':
+            return fail("gate_blocked", f"通道格子({x},{y})必须是'.'")
+    for y in range(height):
+        for x in range(width):
+            on_border = x in (0, width - 1) or y in (0, height - 1)
+            if on_border and (x, y) not in gate_cells and grid[y][x] != '#':
+                return fail("border_open", f"边界格子({x},{y})必须是'#'")
+
+    doors = [(x, y) for y, row in enumerate(grid) for x, char in enumerate(row) if char == 'D']
+    if not _connected(grid, starts + sorted(gate_cells) + doors):
+        return fail("tile_disconnected", "区块内的通道、起点和门不连通")
+    return True, []
+
+
+def entities_from_grid(grid, offset_x=0, offset_y=0, source_entities=None):
+    """根据ASCII网格重建实体列表（保留原实体的type等字段），坐标加上偏移"""
+    source_entities = source_entities or {}
+    by_position = {}
+    for key in ENTITY_SYMBOLS.values():
+        for entity in source_entities.get(key) or []:
+            by_position[(key, entity.get("x"), entity.get("y"))] = entity
+    entities = {"player_start": None, "doors": [], "chests": [], "enemies": [], "npcs": []}
+    for y, row in enumerate(grid):
+        for x, char in enumerate(row):
+            if char == 'S':
+                entities["player_start"] = {"x": x + offset_x, "y": y + offset_y}
+            elif char in ENTITY_SYMBOLS:
+                key = ENTITY_SYMBOLS[char]
+                entity = dict(by_position.get((key, x, y), {}))
+                entity.update(x=x + offset_x, y=y + offset_y)
+                entities[key].append(entity)
+    return entities
+
+
+def stitch_world(width, height, tiles, tile_layouts):
+    """把各区块拼成整张地图的布局（实体坐标转换为世界坐标）"""
+    rows = [[' '] * width for _ in range(height)]
+    entities = {"player_start": None, "doors": [], "chests": [], "enemies": [], "npcs": []}
+    for tile, layout in zip(tiles, tile_layouts):
+        for y, row in enumerate(layout["grid_ascii"]):
+            rows[tile["y"] + y][tile["x"]:tile["x"] + tile["width"]] = row
+        tile_entities = entities_from_grid(layout["grid_ascii"], tile["x"], tile["y"], layout.get("entities"))
+        if tile_entities["player_start"]:
+            entities["player_start"] = tile_entities["player_start"]
+        for key in ENTITY_SYMBOLS.values():
+            entities[key].extend(tile_entities[key])
+    return {
+        "grid_meta": {"width": width, "height": height, "meters_per_char": 1, "origin": "top_left_(0,0)"},
+        "grid_ascii": [''.join(row) for row in rows],
+        "entities": entities,
+    }
+
+
+def check_world_connectivity(world_layout, tiles):
+    """
+    从起点出发对整张地图做BFS，检查所有门和所有区块都可以到达
+    返回: (is_connected, 报告)
+    """
+    grid = world_layout["grid_ascii"]
+    start = world_layout["entities"].get("player_start")
+    if not start:
+        return False, {"error": "地图中没有玩家起点"}
+    height, width = len(grid), len(grid[0])
+    seen = [[False] * width for _ in range(height)]
+    seen[start["y"]][start["x"]] = True
+    queue = deque([(start["x"], start["y"])])
+    reached = 1
+    while queue:
+        x, y = queue.popleft()
+        for nx, ny in ((x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1)):
+            if 0 <= nx < width and 0 <= ny < height and not seen[ny][nx] and grid[ny][nx] in WALKABLE:
+                seen[ny][nx] = True
+                reached += 1
+                queue.append((nx, ny))
+
+    unreachable_doors = [d for d in world_layout["entities"]["doors"] if not seen[d["y"]][d["x"]]]
+    unreachable_tiles = [
+        [tile["tx"], tile["ty"]] for tile in tiles
+        if not any(seen[y][x] for y in range(tile["y"], tile["y"] + tile["height"])
+                   for x in range(tile["x"], tile["x"] + tile["width"]))
+    ]
+    walkable = sum(1 for row in grid for char in row if char in WALKABLE)
+    report = {
+        "reachable_cells": reached,
+        "walkable_cells": walkable,
+        "unreachable_doors": unreachable_doors,
+        "unreachable_tiles": unreachable_tiles,
+    }
+    return not unreachable_doors and not unreachable_tiles, report